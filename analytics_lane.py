@@ -0,0 +1,61 @@
+import functools
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+
+class AnalyticsLane:
+    """Runs the owner reports on their own worker thread instead of the chat executor.
+
+    A wrapped handler (`handler`) only queues the report and returns, so a slow report holds no chat
+    worker; its queries go to the DataSource analytics backend (its own pool, statement timeout and
+    optionally a read replica). At most `max_pending` reports wait at once, past that the owner is
+    asked to try again. A report that fails, e.g. on a statement timeout, is answered with an apology.
+    """
+
+    def __init__(self, workers=1, max_pending=8):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="analytics")
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.failed = 0
+        self.rejected = 0
+
+    def handler(self, callback):
+        """Wrap a telegram handler callback to run it on the lane"""
+        @functools.wraps(callback)
+        def queued_handler(update, context):
+            with self._lock:
+                busy = self.pending >= self.max_pending
+                if busy:
+                    self.rejected += 1
+                else:
+                    self.pending += 1
+            if busy:
+                context.bot.send_message(chat_id=update.effective_chat.id,
+                                         text="Reports are busy, please try again in a minute")
+                return
+            self._pool.submit(self._run, callback, update, context)
+        return queued_handler
+
+    def _run(self, callback, update, context):
+        try:
+            callback(update, context)
+        except Exception as error:
+            logger.error(f"report {callback.__name__} failed: {error!r}")
+            with self._lock:
+                self.failed += 1
+            try:
+                context.bot.send_message(chat_id=update.effective_chat.id,
+                                         text="Sorry, the report could not be built, please try again later")
+            except Exception as send_error:
+                logger.error(send_error)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
@@ -0,0 +1,87 @@
+"""Precompute the recommended dishes of every client into a JSON artifact.
+
+Usage: DATABASE_URL=... python batch_recommendations.py [--output recommendations.json] [--workers 4] [--full]
+
+Without --full only clients that placed an order since the previous run are recomputed.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import time
+from data_source import DataSource
+from menu_catalog import MenuCatalog
+from recommender import RecommenderEngine
+from taste_store import TasteStore
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+EXTRA_DISHES = 5
+
+_engine = None
+
+
+def init_worker(menu_data, order_lines, neighbours, mode):
+    global _engine
+    menu = MenuCatalog(lambda: menu_data, ttl=float('inf'))
+    taste = TasteStore(lambda: order_lines, menu)
+    _engine = (RecommenderEngine(lambda: order_lines, taste, neighbours=neighbours), mode)
+
+
+def recommend_chunk(clients):
+    engine, mode = _engine
+    return [(client, engine.recommend(client, mode=mode, n=engine.top_n + EXTRA_DISHES)) for client in clients]
+
+
+def load_artifact(path):
+    if not os.path.exists(path):
+        return dict()
+    with open(path, encoding='utf-8') as artifact:
+        return json.load(artifact).get("clients", dict())
+
+
+def write_artifact(path, clients):
+    temp_path = path + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as artifact:
+        json.dump({"generated_at": time.time(), "clients": clients}, artifact)
+    os.replace(temp_path, path)
+
+
+def run(database_url, output, workers, full=False, neighbours=4, mode='user', chunk_size=64):
+    data_source = DataSource(database_url)
+    menu_data = data_source.load_menu()
+    order_lines = data_source.load_order_lines()
+    data_source.close()
+    last_order = dict()
+    for order_number, client_number, dish_number, quantity in order_lines:
+        last_order[client_number] = max(order_number, last_order.get(client_number, order_number))
+    previous = dict() if full else load_artifact(output)
+    clients = [client for client, order_number in last_order.items()
+               if str(client) not in previous or previous[str(client)]["last_order"] < order_number]
+    chunks = [clients[i:i + chunk_size] for i in range(0, len(clients), chunk_size)]
+    start = time.perf_counter()
+    if chunks:
+        with multiprocessing.Pool(workers, initializer=init_worker,
+                                  initargs=(menu_data, order_lines, neighbours, mode)) as pool:
+            for chunk in pool.imap_unordered(recommend_chunk, chunks):
+                for client, dishes in chunk:
+                    previous[str(client)] = {"last_order": last_order[client],
+                                             "dishes": [int(dish) for dish in dishes]}
+    elapsed = time.perf_counter() - start
+    write_artifact(output, previous)
+    logger.info(f"recomputed {len(clients)} of {len(last_order)} clients in {elapsed:.2f}s "
+                f"({len(clients) / elapsed if elapsed else 0:.1f} clients/s) with {workers} workers")
+    return len(clients), elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", default=os.environ.get("RECOMMENDATIONS_PATH", "recommendations.json"))
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--neighbours", type=int, default=int(os.environ.get("RECOMMEND_NEIGHBOURS", "4")))
+    parser.add_argument("--mode", default=os.environ.get("RECOMMEND_MODE", "user"), choices=['user', 'item'])
+    parser.add_argument("--full", action='store_true', help="recompute every client")
+    args = parser.parse_args()
+    run(os.environ.get("DATABASE_URL"), args.output, args.workers, args.full, args.neighbours, args.mode)
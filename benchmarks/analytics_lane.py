@@ -0,0 +1,196 @@
+"""Customer handler latency while the owner keeps asking for reports: shared connection vs analytics lane.
+
+Customer chats send a steady stream of updates through the ChatExecutor (like the bot) while the
+owner asks for a full report every `--report-every` seconds: the rankings, the income rebuild and
+the income per dish type chart, from the sales history scaled up `--scale` times. Three runs: no reports, reports
+sharing the ordering connections and chat workers (before the lane), and reports on the
+AnalyticsLane with their own backend. Then a report hitting a tiny statement timeout shows it is
+stopped and answered. The database is a SQLite file opened by two backends (a local stand-in for
+Postgres and its replica), or Postgres with DATABASE_URL (and ANALYTICS_DATABASE_URL) set.
+Usage: python -m benchmarks.analytics_lane [--seconds 10] [--scale 500] [--chats 40] [--rate 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("MODE", "dev")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+import main
+from analytics_lane import AnalyticsLane
+from chat_executor import ChatExecutor
+from data_source import DataSource
+from storage_backends import PostgresBackend, SQLiteBackend
+from benchmarks.common import report
+from benchmarks.fakes import FakeBot, make_context, make_contact, make_update
+
+OWNER_CHAT = -1
+CUSTOMER_FLOW = [(main.dish_type_handler, "🌏 Soups🍜"), (main.favorite_handler, "The most favorite🔝"),
+                 (main.back_handler, "🔙 Back"), (main.continue_handler, "🛍️ continue ")]
+
+
+def owner_report(update, context):
+    main.dataSource.rankings.refresh()
+    main.dataSource.income.build()
+    main.charts.invalidate()
+    main.income_dish_type_handler(update, context)
+
+
+def scale_history(backend, scale):
+    """Copies of every order and its lines under new order numbers"""
+    conn = backend.getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute("select coalesce(max(order_number), 0) + 1 from order_")
+        step = cur.fetchone()[0]
+        for copy in range(1, scale):
+            cur.execute(backend.sql("""insert into order_(order_number, shipping, client_number, order_time,
+                                        delivery_phone_number, remarks)
+                                    select order_number + %s, shipping, client_number, order_time,
+                                        delivery_phone_number, remarks from order_ where order_number < %s"""),
+                        (copy * step, step))
+            cur.execute(backend.sql("""insert into dish_in_order(order_number, dish_number, quantity)
+                                    select order_number + %s, dish_number, quantity from dish_in_order
+                                    where order_number < %s"""), (copy * step, step))
+        cur.close()
+        conn.commit()
+    finally:
+        backend.putconn(conn)
+    return step
+
+
+def unscale_history(backend, step):
+    conn = backend.getconn()
+    try:
+        cur = conn.cursor()
+        cur.execute(backend.sql("delete from dish_in_order where order_number >= %s"), (step,))
+        cur.execute(backend.sql("delete from order_ where order_number >= %s"), (step,))
+        cur.close()
+        conn.commit()
+    finally:
+        backend.putconn(conn)
+
+
+def open_chats(bot, chats):
+    contexts = dict()
+    for chat_id in range(chats):
+        context = make_context(bot, dict())
+        main.phone_number_handler(make_update(bot, chat_id, contact=make_contact(f"97251{chat_id:07d}", "lane")),
+                                  context)
+        main.location_handler(make_update(bot, chat_id, location=True), context)
+        contexts[chat_id] = context
+    return contexts
+
+
+def load(mode, args, data_source, contexts, bot):
+    """Customer latencies (ms) and completed reports of one run"""
+    main.dataSource = data_source
+    executor = ChatExecutor(workers=8, max_queue=10000)
+    lane = AnalyticsLane()
+    samples = list()
+    reports = list()
+    stop = threading.Event()
+
+    def customer(handler, update, context, arrived):
+        handler(update, context)
+        samples.append((time.perf_counter() - arrived) * 1000)
+
+    def timed_report(update, context):
+        start = time.perf_counter()
+        owner_report(update, context)
+        reports.append(time.perf_counter() - start)
+
+    report_handler = lane.handler(timed_report) if mode == "lane" else timed_report
+
+    def owner():
+        while not stop.wait(args.report_every):
+            if mode != "none":
+                executor.submit(OWNER_CHAT, report_handler, make_update(bot, OWNER_CHAT, text="report"),
+                                make_context(bot, dict()))
+
+    owner_thread = threading.Thread(target=owner, daemon=True)
+    owner_thread.start()
+    interval = 1 / args.rate
+    start = time.perf_counter()
+    sent = 0
+    while time.perf_counter() - start < args.seconds:
+        chat_id = sent % len(contexts)
+        handler, text = CUSTOMER_FLOW[(sent // len(contexts)) % len(CUSTOMER_FLOW)]
+        executor.submit(chat_id, customer, handler, make_update(bot, chat_id, text=text), contexts[chat_id],
+                        time.perf_counter())
+        sent += 1
+        time.sleep(max(0.0, start + sent * interval - time.perf_counter()))
+    stop.set()
+    owner_thread.join()
+    executor.shutdown()
+    lane.shutdown()
+    return samples, reports
+
+
+def timeout_check(analytics_factory, primary, bot):
+    """A report whose statements outlive the analytics statement timeout fails and the owner is told"""
+    main.dataSource = DataSource(None, backend=primary, query_metrics=False,
+                                 analytics_backend=analytics_factory(0.001))
+    lane = AnalyticsLane()
+    sent = len(bot.sent)
+    start = time.perf_counter()
+    lane.handler(owner_report)(make_update(bot, OWNER_CHAT, text="report"), make_context(bot, dict()))
+    lane.shutdown()
+    elapsed = (time.perf_counter() - start) * 1000
+    answers = [kwargs["text"] for kind, chat_id, kwargs in bot.sent[sent:]
+               if chat_id == OWNER_CHAT and kind == "message"]
+    print(f"statement timeout 1ms: {lane.failed} report failed after {elapsed:.0f}ms, "
+          f"owner answered {answers[-1] if answers else None!r}")
+    main.dataSource.analytics.closeall()
+    return lane.failed == 1 and bool(answers)
+
+
+def run(args):
+    database_url = os.environ.get("DATABASE_URL")
+    directory = tempfile.TemporaryDirectory()
+    if database_url:
+        primary = PostgresBackend(database_url, 1, 8)
+
+        def analytics_factory(timeout):
+            return PostgresBackend(os.environ.get("ANALYTICS_DATABASE_URL") or database_url, 1, 2, timeout)
+    else:
+        path = os.path.join(directory.name, "lane.sqlite")
+        primary = SQLiteBackend(path, "data")
+
+        def analytics_factory(timeout):
+            return SQLiteBackend(path, None, timeout)
+    step = scale_history(primary, args.scale)
+    bot = FakeBot()
+    sources = {"none": DataSource(None, backend=primary, query_metrics=False),
+               "shared": DataSource(None, backend=primary, query_metrics=False),
+               "lane": DataSource(None, backend=primary, query_metrics=False,
+                                  analytics_backend=analytics_factory(args.statement_timeout))}
+    try:
+        main.dataSource = sources["none"]
+        main.dataSource.menu.refresh()
+        contexts = open_chats(bot, args.chats)
+        for mode, data_source in sources.items():
+            data_source.menu.refresh()
+            data_source.rankings.refresh()
+            samples, reports = load(mode, args, data_source, contexts, bot)
+            report(f"customers, reports {mode}", samples)
+            if reports:
+                print(f"{'':<40} {len(reports)} reports, mean {sum(reports) / len(reports) * 1000:.0f}ms")
+        ok = timeout_check(analytics_factory, primary, bot)
+    finally:
+        unscale_history(primary, step)
+        directory.cleanup()
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--scale", type=int, default=500)
+    parser.add_argument("--chats", type=int, default=40)
+    parser.add_argument("--rate", type=float, default=200, help="customer updates per second")
+    parser.add_argument("--report-every", type=float, default=0.5)
+    parser.add_argument("--statement-timeout", type=float, default=30)
+    sys.exit(run(parser.parse_args()))
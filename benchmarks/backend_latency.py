@@ -0,0 +1,44 @@
+"""Per call latency of the DataSource queries on the in-process SQLite backend vs Postgres.
+
+Usage: [DATABASE_URL=postgresql://localhost/bothaichin] python -m benchmarks.backend_latency [repeat]
+
+Without DATABASE_URL only the SQLite backend (loaded from data/) is measured.
+"""
+import os
+import sys
+from data_source import DataSource
+from storage_backends import SQLiteBackend
+from benchmarks.common import report, time_calls
+
+CLIENT = '+972500000000'
+
+
+def calls(order_number):
+    return {"load_menu": lambda ds: ds.load_menu(),
+            "get_current_lines": lambda ds: ds.get_current_lines(order_number),
+            "get_order_summary": lambda ds: ds.get_order_summary(order_number),
+            "is_client_new": lambda ds: ds.is_client_new(CLIENT),
+            "load_favorite_dishes": lambda ds: ds.load_favorite_dishes(),
+            "load_order_lines": lambda ds: ds.load_order_lines(),
+            "load_daily_sales": lambda ds: ds.load_daily_sales(),
+            "write_order_changes": lambda ds: ds.write_order_changes(order_number, [10001], [(10001, 1)])}
+
+
+def run(database_url, repeat):
+    sources = {"sqlite": DataSource(None, backend=SQLiteBackend())}
+    if database_url:
+        sources["postgres"] = DataSource(database_url, min_connections=1, max_connections=4)
+    order_numbers = dict()
+    for name, source in sources.items():
+        order_numbers[name] = source.new_order_number()
+        source.new_order(order_numbers[name], 1, CLIENT, None)
+    for call_name in calls(None):
+        for name, source in sources.items():
+            call = calls(order_numbers[name])[call_name]
+            report(f"{call_name} ({name})", time_calls(lambda: call(source), repeat))
+    for source in sources.values():
+        source.close()
+
+
+if __name__ == '__main__':
+    run(os.environ.get("DATABASE_URL"), int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,34 @@
+"""Memory of the ChartService over many renders: every render draws a new DataFrame (cache miss).
+
+Usage: python -m benchmarks.chart_memory [renders]
+"""
+import gc
+import resource
+import sys
+import time
+import numpy as np
+import pandas as pd
+from charts import ChartService
+
+
+def run(renders):
+    service = ChartService()
+    days = pd.date_range("2022-05-01", periods=7).date
+    start = time.perf_counter()
+    for render in range(renders):
+        df = pd.DataFrame({'order_time': days, 'daily_income': np.arange(7) * 100 + render})
+        service.render_bar(df, 'order_time', 'daily_income')
+        if render + 1 in (10, 100, renders):
+            gc.collect()
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            print(f"after {render + 1:>5} renders: max rss {rss / 1024:7.1f}MiB")
+    elapsed = time.perf_counter() - start
+    df = pd.DataFrame({'order_time': days, 'daily_income': np.arange(7)})
+    service.render_bar(df, 'order_time', 'daily_income')
+    start = time.perf_counter()
+    service.render_bar(df, 'order_time', 'daily_income')
+    print(f"{renders / elapsed:.1f} renders/s, cached render {(time.perf_counter() - start) * 1000:.3f}ms")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
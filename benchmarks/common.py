@@ -0,0 +1,57 @@
+import statistics
+import time
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def time_calls(func, repeat):
+    samples = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(name, samples):
+    print(f"{name:<40} n={len(samples):<6} mean={statistics.mean(samples):8.3f}ms "
+          f"p50={percentile(samples, 50):8.3f}ms p99={percentile(samples, 99):8.3f}ms")
+
+
+def read_dish_csv(path="data/DISH.csv"):
+    """(columns, rows) of the shipped menu with lower case column names and int values"""
+    with open(path, encoding='utf-8-sig') as dish_file:
+        lines = [line.rstrip("\r\n").split(";") for line in dish_file if line.strip()]
+    columns = [column.lower() for column in lines[0]]
+    rows = [[int(row[0]), row[1], int(row[2]), row[3]] + [int(flag) for flag in row[4:]] for row in lines[1:]]
+    return columns, rows
+
+
+def read_order_lines_csv(path="data/DISH_IN_ORDER.csv", clients=300):
+    """(order_number, client_number, dish_number, quantity) rows of the shipped order lines.
+
+    ORDER_.csv stores client phone numbers as 9,72502E+11 so the clients are spread synthetically.
+    """
+    rows = list()
+    with open(path, encoding='utf-8-sig') as lines_file:
+        next(lines_file)
+        for line in lines_file:
+            fields = line.rstrip("\r\n").split(",")
+            if len(fields) > 2 and fields[0].isdigit() and fields[1].isdigit():
+                order_number = int(fields[1])
+                rows.append((order_number, order_number % clients, int(fields[0]), int(fields[2] or 1)))
+    return rows
+
+
+def scale_order_lines(rows, factor, clients=300):
+    """The order lines repeated `factor` times with new order and client numbers for every copy"""
+    last_order = max(row[0] for row in rows) + 1
+    for copy in range(factor):
+        for order_number, client_number, dish_number, quantity in rows:
+            yield order_number + copy * last_order, client_number + copy * clients, dish_number, quantity
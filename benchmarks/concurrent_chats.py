@@ -0,0 +1,59 @@
+"""p50/p99 handler latency with many chats active at once: one dispatcher thread vs the ChatExecutor.
+
+Every chat opens an order and sends the same burst of updates; latency is measured from the moment
+the update reaches the dispatcher to the end of its handler, so it includes queueing behind other chats.
+Usage: MODE=dev DATABASE_URL=postgresql://localhost/bothaichin python -m benchmarks.concurrent_chats [chats]
+"""
+import os
+import sys
+import time
+
+os.environ.setdefault("MODE", "dev")
+import main
+from chat_executor import ChatExecutor
+from benchmarks.common import report
+from benchmarks.fakes import FakeBot, make_context, make_contact, make_update
+
+BURST = [(main.dish_type_handler, "🌏 Soups🍜"), (main.recommended_handler, "My recommended dishes🙋"),
+         (main.favorite_handler, "The most favorite🔝"), (main.back_handler, "🔙 Back"),
+         (main.continue_handler, "🛍️ continue ")]
+
+
+def open_chats(bot, chats):
+    contexts = dict()
+    for chat_id in range(chats):
+        context = make_context(bot, dict())
+        contact = make_contact(f"97250{chat_id:07d}", "load", "test")
+        main.phone_number_handler(make_update(bot, chat_id, contact=contact), context)
+        main.location_handler(make_update(bot, chat_id, location=True), context)
+        contexts[chat_id] = context
+    return contexts
+
+
+def replay(contexts, bot, submit):
+    samples = list()
+
+    def timed(handler, update, context, arrived):
+        handler(update, context)
+        samples.append((time.perf_counter() - arrived) * 1000)
+
+    for handler, text in BURST:
+        for chat_id, context in contexts.items():
+            submit(chat_id, timed, handler, make_update(bot, chat_id, text=text), context, time.perf_counter())
+    return samples
+
+
+def run(chats):
+    bot = FakeBot()
+    contexts = open_chats(bot, chats)
+    samples = replay(contexts, bot, lambda chat_id, func, *args: func(*args))
+    report(f"{chats} chats, dispatcher thread", samples)
+    executor = ChatExecutor(workers=int(os.environ.get("HANDLER_WORKERS", "8")),
+                            max_queue=int(os.environ.get("HANDLER_QUEUE_DEPTH", "1000")))
+    samples = replay(contexts, bot, executor.submit)
+    executor.shutdown()
+    report(f"{chats} chats, chat executor ({executor.workers} workers)", samples)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,91 @@
+"""Average wait of an order for its courier: random.choice (the old DELIVERY_MEN) vs the CourierDispatcher.
+
+Simulates a dinner rush on the couriers of delivery_person (from the seed data): orders arrive at
+random at `utilization` times what the couriers can deliver, each courier delivers its orders one
+after the other and a delivery takes 15 to 45 minutes. The wait of an order is the time from its
+placement until its courier leaves with it. Both policies see the same orders and delivery times.
+Then times assign + release against the number of couriers.
+Usage: python -m benchmarks.courier_dispatch [orders]
+"""
+import heapq
+import random
+import statistics
+import sys
+import time
+
+from courier_dispatcher import CourierDispatcher
+from data_source import DataSource
+from storage_backends import SQLiteBackend
+from benchmarks.common import percentile
+
+MEAN_DELIVERY = 30.0
+
+
+def simulate(couriers, orders, pick, release):
+    """Waits (minutes) and the longest queue of one courier; `pick(order_number)` names a courier"""
+    free_at = {phone_number: 0.0 for phone_number in couriers}
+    queued = {phone_number: 0 for phone_number in couriers}
+    completions = list()
+    waits = list()
+    longest = 0
+    for order_number, (arrival, delivery) in enumerate(orders):
+        while completions and completions[0][0] <= arrival:
+            _, done_order, phone_number = heapq.heappop(completions)
+            queued[phone_number] -= 1
+            release(done_order)
+        phone_number = pick(order_number)
+        start = max(arrival, free_at[phone_number])
+        free_at[phone_number] = start + delivery
+        queued[phone_number] += 1
+        longest = max(longest, queued[phone_number])
+        heapq.heappush(completions, (start + delivery, order_number, phone_number))
+        waits.append(start - arrival)
+    return waits, longest
+
+
+def make_orders(count, couriers, utilization, seed):
+    rng = random.Random(seed)
+    rate = utilization * len(couriers) / MEAN_DELIVERY
+    arrival = 0.0
+    orders = list()
+    for _ in range(count):
+        arrival += rng.expovariate(rate)
+        orders.append((arrival, rng.uniform(15, 45)))
+    return orders
+
+
+def assign_cost(couriers, repeat=20000):
+    dispatcher = CourierDispatcher(lambda: [("courier", f"+9725{number:08d}") for number in range(couriers)])
+    dispatcher.refresh()
+    for order_number in range(couriers):
+        dispatcher.assign(order_number)
+    start = time.perf_counter()
+    for order_number in range(couriers, couriers + repeat):
+        dispatcher.assign(order_number)
+        dispatcher.release(order_number - couriers)
+    return (time.perf_counter() - start) / repeat * 1e6
+
+
+def run(count):
+    rows = DataSource(None, backend=SQLiteBackend(), query_metrics=False).load_delivery_persons()
+    couriers = [phone_number for name, phone_number in rows]
+    print(f"{len(couriers)} couriers from delivery_person, {count} orders, deliveries of 15-45 minutes")
+    failed = False
+    for utilization in (0.5, 0.8, 0.95):
+        orders = make_orders(count, couriers, utilization, seed=1)
+        rng = random.Random(2)
+        results = {"random.choice": simulate(couriers, orders, lambda order_number: rng.choice(couriers),
+                                             lambda order_number: None)}
+        dispatcher = CourierDispatcher(lambda: rows)
+        results["least loaded"] = simulate(couriers, orders, dispatcher.assign, dispatcher.release)
+        for policy, (waits, longest) in results.items():
+            print(f"load {utilization:.2f} {policy:<14} mean wait {statistics.mean(waits):6.1f}min "
+                  f"p95 {percentile(waits, 95):6.1f}min longest queue {longest}")
+        failed |= statistics.mean(results["least loaded"][0]) > statistics.mean(results["random.choice"][0])
+    for size in (3, 30, 300, 3000):
+        print(f"{size:>5} couriers: assign + release {assign_cost(size):.2f}us")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
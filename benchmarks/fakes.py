@@ -0,0 +1,146 @@
+"""Stand-ins for the telegram objects the handlers in main.py touch"""
+import threading
+from types import SimpleNamespace
+
+
+class FakeBot:
+    """Records every outgoing message instead of calling the Telegram API"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = list()
+
+    def _record(self, kind, chat_id, **kwargs):
+        with self._lock:
+            self.sent.append((kind, chat_id, kwargs))
+
+    def send_message(self, chat_id, text=None, reply_markup=None, **kwargs):
+        self._record("message", chat_id, text=text)
+
+    def send_photo(self, chat_id, photo=None, **kwargs):
+        if hasattr(photo, "read"):
+            photo.read()
+        self._record("photo", chat_id)
+        file_id = photo if isinstance(photo, str) else f"photo-{len(self.sent)}"
+        return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+    sendPhoto = send_photo
+
+    def send_document(self, chat_id, document=None, **kwargs):
+        self._record("document", chat_id, **kwargs)
+
+
+class FakeMessage:
+    def __init__(self, bot, chat_id, text=None, contact=None, location=None):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.text = text
+        self.contact = contact
+        self.location = location
+
+    def reply_text(self, text, reply_markup=None, **kwargs):
+        self.bot.send_message(self.chat_id, text=text, reply_markup=reply_markup)
+
+
+class FakeCallbackQuery:
+    def __init__(self, data):
+        self.data = data
+
+    def answer(self, *args, **kwargs):
+        pass
+
+    def edit_message_reply_markup(self, *args, **kwargs):
+        pass
+
+
+def make_update(bot, chat_id, text=None, contact=None, location=None, callback_data=None):
+    message = FakeMessage(bot, chat_id, text=text, contact=contact, location=location)
+    callback_query = FakeCallbackQuery(callback_data) if callback_data is not None else None
+    return SimpleNamespace(message=message, effective_message=message, callback_query=callback_query,
+                           effective_chat=SimpleNamespace(id=chat_id))
+
+
+def make_contact(phone_number, first_name, last_name=None):
+    return SimpleNamespace(phone_number=phone_number, first_name=first_name, last_name=last_name)
+
+
+def make_context(bot, user_data):
+    return SimpleNamespace(bot=bot, user_data=user_data)
+
+
+class QueryCounter:
+    """Database round trips and rows fetched since the last reset"""
+
+    def __init__(self):
+        self.round_trips = 0
+        self.rows = 0
+
+    def reset(self):
+        self.round_trips = 0
+        self.rows = 0
+
+
+class CountingCursor:
+    def __init__(self, cursor, counter):
+        self._cursor = cursor
+        self._counter = counter
+
+    def execute(self, *args, **kwargs):
+        self._counter.round_trips += 1
+        return self._cursor.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        self._counter.round_trips += 1
+        return self._cursor.executemany(*args, **kwargs)
+
+    def fetchall(self):
+        rows = self._cursor.fetchall()
+        self._counter.rows += len(rows)
+        return rows
+
+    def fetchone(self):
+        row = self._cursor.fetchone()
+        self._counter.rows += row is not None
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        rows = self._cursor.fetchmany(*args, **kwargs)
+        self._counter.rows += len(rows)
+        return rows
+
+    def __iter__(self):
+        for row in self._cursor:
+            self._counter.rows += 1
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class CountingConnection:
+    def __init__(self, conn, counter):
+        self.conn = conn
+        self._counter = counter
+
+    def cursor(self, *args, **kwargs):
+        return CountingCursor(self.conn.cursor(*args, **kwargs), self._counter)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class CountingBackend:
+    """Wraps a storage backend to count the statements DataSource sends and the rows it reads back"""
+
+    def __init__(self, backend, counter):
+        self.backend = backend
+        self.counter = counter
+
+    def getconn(self):
+        return CountingConnection(self.backend.getconn(), self.counter)
+
+    def putconn(self, conn):
+        self.backend.putconn(conn.conn)
+
+    def __getattr__(self, name):
+        return getattr(self.backend, name)
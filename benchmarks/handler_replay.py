@@ -0,0 +1,204 @@
+"""Replay customer journeys and owner reports built from the shipped orders through the main.py handlers.
+
+Every order of data/ORDER_.csv with lines in DISH_IN_ORDER.csv becomes one customer: start, contact,
+location, recommendations, then category, dish and quantity for each of its lines, shopping cart,
+continue, remarks, payment and finish. Owner report flows run between journeys. For each handler the
+replay reports latency percentiles and the database round trips and rows fetched per call.
+
+Usage: python -m benchmarks.handler_replay [--journeys 200] [--baseline benchmarks/handler_baseline.json]
+                                           [--save-baseline] [--latency-tolerance 0.5]
+
+Without DATABASE_URL the bot runs on the SQLite backend. With --baseline the run fails (exit code 1)
+when a handler makes more round trips, fetches more rows per call or fails more often than the
+stored baseline of the same backend, or, given --latency-tolerance, when its p95 latency grew by more
+than that fraction. The baseline records how many journeys it replayed; a run of another number of
+journeys is not compared (exit code 2).
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("MODE", "dev")
+if not os.environ.get("DATABASE_URL"):
+    os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+import main
+from dish_media import DishMediaCache
+from seed_loader import SeedData
+from benchmarks.common import percentile
+from benchmarks.fakes import CountingBackend, FakeBot, QueryCounter, make_context, make_contact, make_update
+
+logger = logging.getLogger()
+
+OWNER_FLOW = [(main.bos_command, "/mypassword"),
+              (main.weekly_income_handler, "Show Income chart from the last week📊"),
+              (main.income_dish_type_handler, "Show distribution of income per dishes types📊"),
+              (main.weakest_handler, "The dishes that brought in the least money this month📉"),
+              (main.best_handler, "The dishes that brought in the most money this month📈")]
+
+
+class Replay:
+    def __init__(self):
+        self.bot = FakeBot()
+        self.counter = QueryCounter()
+        main.dataSource.backend = CountingBackend(main.dataSource.backend, self.counter)
+        main.dataSource.analytics = CountingBackend(main.dataSource.analytics, self.counter)
+        self.stats = dict()
+
+    def call(self, handler, chat_id, context, **update):
+        stats = self.stats.setdefault(handler.__name__, {"latency": list(), "round_trips": 0, "rows": 0,
+                                                         "errors": 0})
+        self.counter.reset()
+        start = time.perf_counter()
+        try:
+            handler(make_update(self.bot, chat_id, **update), context)
+        except Exception as error:
+            logger.error(f"{handler.__name__}: {error!r}")
+            stats["errors"] += 1
+        stats["latency"].append((time.perf_counter() - start) * 1000)
+        stats["round_trips"] += self.counter.round_trips
+        stats["rows"] += self.counter.rows
+
+    def journey(self, chat_id, client_number, lines):
+        context = make_context(self.bot, dict())
+        menu = main.dataSource.menu
+        self.call(main.start_command, chat_id, context, text="/start")
+        self.call(main.delivery_handler, chat_id, context, text="Order delivery 🛵")
+        self.call(main.phone_number_handler, chat_id, context, contact=make_contact(client_number[1:], "replay"))
+        self.call(main.location_handler, chat_id, context, location=True)
+        self.call(main.recommended_handler, chat_id, context, text="My recommended dishes🙋")
+        self.call(main.back_handler, chat_id, context, text="🔙 Back")
+        for dish_number, quantity in lines:
+            dish = menu.get_dish(dish_number)
+            if dish is None:
+                continue
+            self.call(main.dish_type_handler, chat_id, context, text="🌏 " + dish['dish_type'] + "🍽")
+            self.call(main.selected_dish_handler, chat_id, context,
+                      text="🥡 " + main.dataSource.format_dish(dish_number))
+            self.call(main.quantity_handler, chat_id, context, callback_data=str(min(max(quantity, 1), 3)))
+            self.call(main.back_handler, chat_id, context, text="🔙 Back")
+        self.call(main.shopping_cast_handler, chat_id, context, text="🛒Shopping cart")
+        self.call(main.continue_handler, chat_id, context, text="🛍️ continue ")
+        self.call(main.remarks_handler, chat_id, context, text="✍️i have a remarks")
+        self.call(main.done_command, chat_id, context, text="ring twice please📝")
+        self.call(main.continue_handler, chat_id, context, text="🛍️ continue ")
+        self.call(main.payment_handler, chat_id, context, text="💳 Go to payment")
+        self.call(main.finish_handler, chat_id, context, text="♦ Cash 💷")
+
+    def owner_reports(self, chat_id):
+        context = make_context(self.bot, dict())
+        for handler, text in OWNER_FLOW:
+            self.call(handler, chat_id, context, text=text)
+
+    def summary(self):
+        out = dict()
+        for name, stats in self.stats.items():
+            samples = stats["latency"]
+            out[name] = {"calls": len(samples), "mean_ms": statistics.mean(samples),
+                         "p50_ms": percentile(samples, 50), "p95_ms": percentile(samples, 95),
+                         "p99_ms": percentile(samples, 99),
+                         "round_trips": stats["round_trips"] / len(samples), "rows": stats["rows"] / len(samples),
+                         "errors": stats["errors"]}
+        return out
+
+
+def load_journeys(directory, limit):
+    data = SeedData(directory)
+    clients = {order[0]: order[2] for order in data.order_()}
+    lines = dict()
+    for order_number, dish_number, quantity in data.dish_in_order():
+        if order_number in clients:
+            lines.setdefault(order_number, list()).append((dish_number, quantity))
+    return [(clients[order_number], lines[order_number]) for order_number in sorted(lines)][:limit]
+
+
+def placeholder_photos(directory, dish_names):
+    """Tiny stand-in photo per dish so selected_dish_handler goes through the file_id cache"""
+    for dish_name in dish_names:
+        try:
+            with open(os.path.join(directory, dish_name + ".png"), 'wb') as photo:
+                photo.write(dish_name.encode())
+        except OSError:
+            continue
+
+
+def print_summary(summary):
+    print(f"{'handler':<26} {'calls':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'trips':>7} {'rows':>9} "
+          f"{'errors':>6}")
+    for name, row in sorted(summary.items()):
+        print(f"{name:<26} {row['calls']:>6} {row['p50_ms']:>9.3f} {row['p95_ms']:>9.3f} {row['p99_ms']:>9.3f} "
+              f"{row['round_trips']:>7.2f} {row['rows']:>9.1f} {row['errors']:>6}")
+
+
+def regressions(summary, baseline, latency_tolerance=None):
+    found = list()
+    for name, row in summary.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        for key in ("round_trips", "rows", "errors"):
+            if row[key] > before.get(key, 0) + 1e-9:
+                found.append(f"{name}: {key} {before.get(key, 0):.2f} -> {row[key]:.2f}")
+        if latency_tolerance is not None and row["p95_ms"] > before["p95_ms"] * (1 + latency_tolerance):
+            found.append(f"{name}: p95 {before['p95_ms']:.3f}ms -> {row['p95_ms']:.3f}ms")
+    return found
+
+
+def run(directory, journeys, baseline_path=None, save_baseline=False, latency_tolerance=None):
+    replay = Replay()
+    main.dataSource.menu.refresh()
+    main.dataSource.rankings.refresh()
+    main.dataSource.dispatcher.refresh()
+    photo_directory = tempfile.mkdtemp()
+    placeholder_photos(photo_directory, main.dataSource.menu.number_by_name)
+    main.dishMedia = DishMediaCache(photo_directory, os.path.join(photo_directory, "dish_photos.json"))
+    journeys = load_journeys(directory, journeys)
+    start = time.perf_counter()
+    for chat_id, (client_number, lines) in enumerate(journeys):
+        replay.journey(chat_id, client_number, lines)
+        if chat_id % 20 == 0:
+            replay.owner_reports(-1)
+    elapsed = time.perf_counter() - start
+    main.dataSource.cart.flush_all()
+    summary = replay.summary()
+    print_summary(summary)
+    print(f"{len(journeys)} journeys in {elapsed:.2f}s, {len(replay.bot.sent)} messages sent")
+    if baseline_path is None:
+        return 0
+    dialect = main.dataSource.backend.dialect
+    if save_baseline:
+        try:
+            with open(baseline_path, encoding='utf-8') as baseline_file:
+                stored = json.load(baseline_file)
+        except FileNotFoundError:
+            stored = dict()
+        stored[dialect] = {"journeys": len(journeys), "handlers": summary}
+        with open(baseline_path, 'w', encoding='utf-8') as baseline_file:
+            json.dump(stored, baseline_file, indent=1, sort_keys=True)
+        return 0
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file).get(dialect, dict())
+    if baseline.get("journeys") != len(journeys):
+        print(f"the {dialect} baseline replayed {baseline.get('journeys')} journeys, not {len(journeys)}: "
+              f"not compared, record a new one with --save-baseline")
+        return 2
+    found = regressions(summary, baseline["handlers"], latency_tolerance)
+    for regression in found:
+        print("REGRESSION", regression)
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--journeys", type=int, default=200)
+    parser.add_argument("--baseline", help="JSON file of per handler results to compare with")
+    parser.add_argument("--save-baseline", action='store_true', help="store this run as the baseline")
+    parser.add_argument("--latency-tolerance", type=float,
+                        help="also fail when a p95 latency grew by more than this fraction")
+    args = parser.parse_args()
+    sys.exit(run(args.data, args.journeys, args.baseline, args.save_baseline, args.latency_tolerance))
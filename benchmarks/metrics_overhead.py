@@ -0,0 +1,40 @@
+"""Cost of the query metrics: DataSource calls and a wrapped handler with metrics on vs off.
+
+Runs on the in-process SQLite backend, where queries take microseconds, so the relative overhead is
+the worst case; against Postgres the same absolute cost is hidden by the network round trip.
+Usage: python -m benchmarks.metrics_overhead [repeat]
+"""
+import statistics
+import sys
+from data_source import DataSource
+from storage_backends import SQLiteBackend
+from benchmarks.common import report, time_calls
+
+CLIENT = '+972500000000'
+
+
+def run(repeat):
+    backend = SQLiteBackend()
+    sources = {"off": DataSource(None, backend=backend, query_metrics=False),
+               "on": DataSource(None, backend=backend, query_metrics=True)}
+    order_number = sources["on"].new_order_number()
+    sources["on"].new_order(order_number, 1, CLIENT, None)
+    sources["on"].write_order_changes(order_number, [], [(10001, 2), (10002, 1)])
+    calls = {"get_current_lines": lambda ds: ds.get_current_lines(order_number),
+             "get_order_summary": lambda ds: ds.get_order_summary(order_number),
+             "load_favorite_dishes": lambda ds: ds.load_favorite_dishes(),
+             "handler(get_order_summary)": lambda ds: ds.metrics.handler(
+                 lambda update, context: ds.get_order_summary(order_number))(None, None)}
+    for name, call in calls.items():
+        means = dict()
+        for mode, source in sources.items():
+            time_calls(lambda: call(source), repeat // 10)
+            samples = time_calls(lambda: call(source), repeat)
+            report(f"{name} (metrics {mode})", samples)
+            means[mode] = statistics.mean(samples)
+        print(f"{'':<40} overhead {(means['on'] - means['off']) * 1000:.1f}us per call "
+              f"({(means['on'] / means['off'] - 1) * 100:+.1f}%)")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,54 @@
+"""Hundreds of simultaneous location_handler calls must open orders with distinct numbers.
+
+Creates the orders in the database pointed to by DATABASE_URL and deletes them afterwards.
+Usage: DATABASE_URL=postgresql://localhost/bothaichin python -m benchmarks.order_numbers [calls]
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+os.environ.setdefault("MODE", "dev")
+import main
+
+
+def fake_location_update(chat_id):
+    message = SimpleNamespace(reply_text=lambda *args, **kwargs: None)
+    return SimpleNamespace(message=message, effective_chat=SimpleNamespace(id=chat_id))
+
+
+def open_order(chat_id, client_number):
+    session = main.sessions.get(chat_id)
+    session.client_number, session.name = client_number, "load test"
+    main.location_handler(fake_location_update(chat_id), SimpleNamespace())
+    return session.order_number
+
+
+def run(calls, threads=50):
+    conn = main.dataSource.get_connection()
+    cur = conn.cursor()
+    cur.execute("select client_number from order_ limit 1")
+    client_number = cur.fetchone()[0]
+    cur.close()
+    main.dataSource.close_connection(conn)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as executor:
+        numbers = list(executor.map(open_order, range(calls), [client_number] * calls))
+    elapsed = time.perf_counter() - start
+    conn = main.dataSource.get_connection()
+    cur = conn.cursor()
+    cur.execute("select count(*) from order_ where order_number = any(%s)", (numbers,))
+    stored = cur.fetchone()[0]
+    cur.execute("delete from order_ where order_number = any(%s)", (numbers,))
+    cur.close()
+    conn.commit()
+    main.dataSource.close_connection(conn)
+    print(f"{calls} location_handler calls on {threads} threads in {elapsed:.2f}s: "
+          f"{len(set(numbers))} distinct order numbers, {stored} orders stored")
+    if len(set(numbers)) != calls or stored != calls:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,53 @@
+"""Per call latency of DataSource calls with a fresh connection per call vs the connection pool.
+
+Only calls that still reach the database every time are measured: the lines of an order, its
+summary, the new client check and a remark write. Menu lookups and rankings are served from memory.
+Usage: DATABASE_URL=postgresql://localhost/bothaichin python -m benchmarks.pool_latency [repeat]
+"""
+import os
+import sys
+import psycopg2
+from data_source import DataSource
+from benchmarks.common import report, time_calls
+
+
+class UnpooledDataSource(DataSource):
+    """DataSource as it was before pooling: connect and close on every call"""
+
+    def get_connection(self, backend=None):
+        return psycopg2.connect(self.database_url, sslmode='allow')
+
+    def close_connection(self, conn, backend=None):
+        if conn is not None:
+            conn.close()
+
+
+def last_order(data_source):
+    conn = data_source.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute("select order_number, client_number, remarks from order_ order by order_number desc limit 1")
+        row = cur.fetchone()
+        cur.close()
+        conn.commit()
+        return row
+    finally:
+        data_source.close_connection(conn)
+
+
+def run(database_url, repeat):
+    pooled = DataSource(database_url, min_connections=1, max_connections=4)
+    unpooled = UnpooledDataSource(database_url)
+    order_number, client_number, remarks = last_order(pooled)
+    calls = {"get_current_dishes": lambda ds: ds.get_current_dishes(order_number),
+             "get_order_summary": lambda ds: ds.get_order_summary(order_number),
+             "is_client_new": lambda ds: ds.is_client_new(client_number),
+             "set_remarks": lambda ds: ds.set_remarks(remarks, order_number)}
+    for name, call in calls.items():
+        report(f"{name} (connect per call)", time_calls(lambda: call(unpooled), repeat))
+        report(f"{name} (pooled)", time_calls(lambda: call(pooled), repeat))
+    pooled.close()
+
+
+if __name__ == '__main__':
+    run(os.environ.get("DATABASE_URL"), int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,113 @@
+"""Per update dispatch cost: the old chain of regex MessageHandlers vs the MessageRouter table.
+
+Every button label of the bot (plus dish buttons, the cart button with a total and a remark) is
+wrapped in a real telegram Update. The chain checks handlers in registration order until one
+matches; the router checks the single text handler and looks the label up. Also prints labels the
+two pick different handlers for, and the router's conflict report.
+Usage: python -m benchmarks.router_dispatch [repeat]
+"""
+import datetime
+import os
+import sys
+import time
+
+os.environ.setdefault("MODE", "dev")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+from telegram import Chat, Message, Update
+from telegram.ext import CallbackQueryHandler, Filters, MessageHandler
+import main
+
+LABELS = ["Order delivery 🛵", "Something else  🤷‍♂", "🆕 Undo 🔙", "Call us 📞", "My recommended dishes🙋",
+          "The most favorite🔝", "🌏 Appetizer🥟", "🌏 Soups🍜", "🌏 Wok mains🥘", "🌏 Pad Thai🫕", "🌏 side dish🍟",
+          "🌏 Crispy Chicken🍗", "🌏 Noodles🍝", "🌏 Salads🥗", "🌏 Special🥢", "🌏 Mains from sea🍤", "🌏 Sushi🍱",
+          "🌏 Sushi Sandwich🍣", "Your shopping cart is empty 🛒", "🛒Shopping cart (96 ₪)", "🔙 Back",
+          "🛍️ continue ", "✍️i have a remarks", "💳 Go to payment",
+          "I want to delete one or more dishes from the order🪚", "♦ Apple Pay 🍏", "♦ Credit Card 💳", "♦ Cash 💷",
+          "♦ Bit 🟦", "🆕 Make new order 🥳", "What is the status of my shipment?", "🆕",
+          "Show Income chart from the last week📊", "Show distribution of income per dishes types📊",
+          "The dishes that brought in the least money this month📉",
+          "The dishes that brought in the most money this month📈", "please ring twice 📝"]
+
+
+def handler_chain():
+    """The DEFAULT_GROUP handlers as main.py registered them before the router"""
+    return [MessageHandler(Filters.regex('Order delivery 🛵'), main.delivery_handler),
+            MessageHandler(Filters.contact, main.phone_number_handler),
+            MessageHandler(Filters.location, main.location_handler),
+            MessageHandler(Filters.regex("🌏"), main.dish_type_handler),
+            MessageHandler(Filters.regex("🥡"), main.selected_dish_handler),
+            CallbackQueryHandler(main.quantity_handler),
+            MessageHandler(Filters.regex("🔙 Back"), main.back_handler),
+            MessageHandler(Filters.regex("🛒Shopping cart"), main.shopping_cast_handler),
+            MessageHandler(Filters.regex("🛍️ continue"), main.continue_handler),
+            MessageHandler(Filters.regex("💳 Go to payment"), main.payment_handler),
+            MessageHandler(Filters.regex("♦"), main.finish_handler),
+            MessageHandler(Filters.regex("🆕"), main.start_command),
+            MessageHandler(Filters.regex("My recommended dishes🙋"), main.recommended_handler),
+            MessageHandler(Filters.regex("The most favorite🔝"), main.favorite_handler),
+            MessageHandler(Filters.regex("Something else  🤷‍♂"), main.something_else_handler),
+            MessageHandler(Filters.regex("The dishes that brought in the least money this month📉"),
+                           main.weakest_handler),
+            MessageHandler(Filters.regex("The dishes that brought in the most money this month📈"),
+                           main.best_handler),
+            MessageHandler(Filters.regex("I want to delete one or more dishes from the order🪚"),
+                           main.delete_dish_handler),
+            MessageHandler(Filters.regex("❌delete"), main.deleted_handler),
+            MessageHandler(Filters.regex("✍️i have a remarks"), main.remarks_handler),
+            MessageHandler(Filters.regex("📝"), main.done_command),
+            MessageHandler(Filters.regex("Show Income chart from the last week📊"), main.weekly_income_handler),
+            MessageHandler(Filters.regex("Show distribution of income per dishes types📊"),
+                           main.income_dish_type_handler)]
+
+
+def make_update(text):
+    chat = Chat(1, Chat.PRIVATE)
+    return Update(1, message=Message(1, datetime.datetime.now(), chat, text=text))
+
+
+def chain_dispatch(chain, update):
+    for handler in chain:
+        if handler.check_update(update):
+            return handler.callback
+    return None
+
+
+def router_dispatch(text_handler, router, update):
+    if text_handler.check_update(update):
+        route = router.resolve(update.message.text)
+        return None if route is None else route.callback
+    return None
+
+
+def timed(func, updates, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for update in updates:
+            func(update)
+    return (time.perf_counter() - start) / (repeat * len(updates)) * 1e6
+
+
+def run(repeat):
+    main.dataSource.menu.refresh()
+    labels = LABELS + ["🥡 " + main.dataSource.format_dish(number) for number in main.dataSource.menu.by_number]
+    labels += ["❌delete\t" + name for name in list(main.dataSource.menu.number_by_name)[:20]]
+    updates = [make_update(label) for label in labels]
+    chain = handler_chain()
+    router = main.build_router()
+    text_handler = MessageHandler(Filters.text, router.dispatch)
+    for conflict in router.conflicts(LABELS):
+        print("conflict:", conflict)
+    for update in updates:
+        old, new = chain_dispatch(chain, update), router_dispatch(text_handler, router, update)
+        if old is not new:
+            print(f"{update.message.text!r}: chain -> {getattr(old, '__name__', None)}, "
+                  f"router -> {getattr(new, '__name__', None)}")
+    chain_us = timed(lambda update: chain_dispatch(chain, update), updates, repeat)
+    router_us = timed(lambda update: router_dispatch(text_handler, router, update), updates, repeat)
+    lookup_us = timed(lambda update: router.resolve(update.message.text), updates, repeat)
+    print(f"{len(updates)} labels: handler chain {chain_us:.2f}us per update, router {router_us:.2f}us per update "
+          f"({chain_us / router_us:.1f}x), of which the route lookup {lookup_us:.2f}us")
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
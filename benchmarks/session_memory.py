@@ -0,0 +1,88 @@
+"""Memory per chat of the conversation state: the old context.user_data dict vs the sessions store.
+
+Fills both with `users` chats in the middle of an order (five dishes picked) and measures what they
+allocate with tracemalloc. The old layout held a private copy of the category keyboard, the selected
+dish name and a "chosen <dish>" key per dish picked; a Session keeps the ids only and the keyboards
+are shared. Then ages the store with a fake clock to show idle chats being evicted.
+Usage: python -m benchmarks.session_memory [users]
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+os.environ.setdefault("MODE", "dev")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+from telegram import KeyboardButton
+import main
+from sessions import SessionStore
+
+DISHES = ["Pad Thai Chicken", "Tom Yum", "Spring rolls", "Salmon sushi", "Fried rice"]
+
+
+def old_user_data(user_id):
+    """What location_handler, back_handler and quantity_handler used to leave in context.user_data"""
+    user_data = {"NAME": "load test", "CLIENT_NUMBER": f"+97250{user_id:07d}", "DELIVERY_MAN": '+972542562628',
+                 "ORDER_NUMBER": 100000 + user_id, "SUM": 96, "SELECTED_DISH_NAME": DISHES[-1]}
+    user_data["DISH_TYPE_KEYBOARD"] = [[KeyboardButton("🛒Shopping cart (96 ₪)")]] + [
+        [KeyboardButton(button.text) for button in row] for row in main.DISH_TYPE_ROWS]
+    for dish in DISHES:
+        user_data["chosen " + dish] = "true"
+    return user_data
+
+
+def fill_sessions(store, users):
+    for user_id in range(users):
+        session = store.get(user_id)
+        session.name, session.client_number = "load test", f"+97250{user_id:07d}"
+        session.open_order(100000 + user_id)
+        for dish_number in range(10001, 10001 + len(DISHES)):
+            session.selected_dish = dish_number
+            session.choose(dish_number)
+        main.dish_type_keyboard(96)
+
+
+def measure(fill):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = fill()
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return kept, allocated, elapsed
+
+
+def run(users):
+    def fill_old():
+        user_data = defaultdict(dict)
+        for user_id in range(users):
+            user_data[user_id].update(old_user_data(user_id))
+        return user_data
+
+    def fill_new():
+        store = SessionStore(clock=lambda: now[0])
+        fill_sessions(store, users)
+        return store
+
+    now = [0.0]
+    _, old_bytes, old_s = measure(fill_old)
+    store, new_bytes, new_s = measure(fill_new)
+    print(f"{users} chats, user_data dicts: {old_bytes / 1024 / 1024:7.2f}MiB "
+          f"({old_bytes / users:6.0f} bytes per chat, filled in {old_s:.2f}s)")
+    print(f"{users} chats, sessions:        {new_bytes / 1024 / 1024:7.2f}MiB "
+          f"({new_bytes / users:6.0f} bytes per chat, filled in {new_s:.2f}s), {old_bytes / new_bytes:.1f}x smaller")
+    now[0] = store.idle_timeout / 2
+    for user_id in range(users // 10):
+        store.get(user_id)
+    now[0] = store.idle_timeout + 1
+    evicted = store.evict_idle()
+    print(f"after the idle timeout: {evicted} sessions evicted, {len(store)} active ones kept")
+    return 0 if len(store) == users // 10 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000))
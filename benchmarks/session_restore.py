@@ -0,0 +1,85 @@
+"""Cost of saving the sessions and time to restore them after a restart, with a file and a table log.
+
+`sessions` chats each send `presses` updates in a row through a handler wrapped by
+SessionStore.persisted, with a flush every `flush_every` updates (the job queue flushes every second),
+so the updates a chat sends between two flushes share one record. Reports the records
+written per update, the flush cost per update, the time to restore the uncompacted log (replay and
+compaction) and the compacted one, and checks that every session comes back with the same state.
+The table log is the session_log table of a DataSource on an in-memory SQLite backend.
+Usage: python -m benchmarks.session_restore [sessions] [presses]
+"""
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from data_source import DataSource
+from sessions import SessionLog, SessionStore
+from storage_backends import SQLiteBackend
+
+
+def press(session, chat_id, step):
+    """What the ordering handlers change: contact, location, then picking dishes"""
+    if step == 0:
+        session.name, session.client_number = "restore test", f"+97250{chat_id:07d}"
+    elif step == 1:
+        session.open_order(100000 + chat_id)
+    else:
+        session.selected_dish = 10000 + step
+        session.choose(session.selected_dish)
+
+
+def fill(store, sessions, presses, flush_every):
+    def handler(update, context):
+        press(store.get(update.effective_chat.id), update.effective_chat.id, context.step)
+
+    handler = store.persisted(handler)
+    records = 0
+    flush_time = 0.0
+    updates = 0
+    for chat_id in range(sessions):
+        for step in range(presses):
+            handler(SimpleNamespace(effective_chat=SimpleNamespace(id=chat_id)), SimpleNamespace(step=step))
+            updates += 1
+            if updates % flush_every == 0:
+                start = time.perf_counter()
+                records += store.flush()
+                flush_time += time.perf_counter() - start
+    start = time.perf_counter()
+    records += store.flush()
+    flush_time += time.perf_counter() - start
+    return records, updates, flush_time
+
+
+def restore(make_log, expected):
+    store = SessionStore(log=make_log())
+    start = time.perf_counter()
+    restored = store.restore()
+    elapsed = time.perf_counter() - start
+    same = all(chat_id in store.sessions and store.sessions[chat_id].state() == state
+               for chat_id, state in expected.items())
+    return restored, elapsed, same, store.log_records
+
+
+def run(sessions, presses, flush_every=50):
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sessions.log")
+        data_source = DataSource(None, backend=SQLiteBackend(":memory:", None), query_metrics=False)
+        for name, make_log in (("file", lambda: SessionLog(path)), ("table", lambda: data_source)):
+            store = SessionStore(log=make_log(), compact_ratio=float("inf"))
+            records, updates, flush_time = fill(store, sessions, presses, flush_every)
+            expected = {chat_id: session.state() for chat_id, session in store.sessions.items()}
+            print(f"{name}: {updates} updates from {sessions} chats, {records} records "
+                  f"({records / updates:.2f} per update), flush {flush_time / updates * 1e6:.1f}us per update")
+            for label in ("uncompacted", "compacted"):
+                restored, elapsed, same, log_records = restore(make_log, expected)
+                print(f"{name}: restore {label:<11} {restored} sessions in {elapsed * 1000:8.1f}ms, "
+                      f"log now {log_records} records, states {'match' if same else 'DIFFER'}")
+                failed |= not same or restored != sessions
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(int(sys.argv[1]) if len(sys.argv) > 1 else 10000, int(sys.argv[2]) if len(sys.argv) > 2 else 6))
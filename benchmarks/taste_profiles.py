@@ -0,0 +1,76 @@
+"""Client taste profiles: GET_CLIENTS_DATA in Postgres vs the dish x feature matrix product.
+
+The SQL path runs against temporary dish / order_ / dish_in_order tables filled with the shipped CSVs
+scaled 10x, 100x and 1000x, so the real tables are not touched.
+Usage: DATABASE_URL=postgresql://localhost/bothaichin python -m benchmarks.taste_profiles [10 100 1000]
+"""
+import io
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+import psycopg2
+from data_source import GET_CLIENTS_DATA
+from menu_catalog import MenuCatalog
+from taste_store import client_taste_df, TASTE_COLUMNS
+from benchmarks.common import read_dish_csv, read_order_lines_csv, scale_order_lines
+
+CREATE_TABLES = """create temp table dish(dish_number int, dish_name text, price numeric, dish_type text,
+                    chiken boolean, spicy boolean, pastry boolean, fish boolean, tofu boolean, beef boolean,
+                    rice boolean, coconut_cream boolean, eggs boolean, sea_food boolean, curry boolean,
+                    fried boolean, vegetarian boolean, vegan boolean);
+                   create temp table order_(order_number int, client_number text);
+                   create temp table dish_in_order(order_number int, dish_number int, quantity int);"""
+
+
+def copy_rows(cur, table, rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(str(value) for value in row) + "\n")
+    buffer.seek(0)
+    cur.copy_from(buffer, table)
+
+
+def sql_profiles(database_url, dish_rows, lines):
+    conn = psycopg2.connect(database_url)
+    try:
+        cur = conn.cursor()
+        cur.execute(CREATE_TABLES)
+        copy_rows(cur, "dish", [row[:4] + [bool(flag) for flag in row[4:]] for row in dish_rows])
+        copy_rows(cur, "order_", {(order_number, client_number) for order_number, client_number, _, _ in lines})
+        copy_rows(cur, "dish_in_order", [(order_number, dish_number, quantity)
+                                         for order_number, _, dish_number, quantity in lines])
+        cur.execute("analyze dish; analyze order_; analyze dish_in_order")
+        start = time.perf_counter()
+        df = pd.read_sql_query(GET_CLIENTS_DATA, conn)
+        df.columns = ['client_number'] + TASTE_COLUMNS
+        df = df.astype({column: float for column in TASTE_COLUMNS}).pivot_table(index='client_number')
+        return df, time.perf_counter() - start
+    finally:
+        conn.close()
+
+
+def run(database_url, factors):
+    columns, dish_rows = read_dish_csv()
+    menu = MenuCatalog(lambda: (columns, dish_rows))
+    base = read_order_lines_csv()
+    for factor in factors:
+        lines = list(scale_order_lines(base, factor))
+        start = time.perf_counter()
+        matrix_df = client_taste_df(((client_number, dish_number) for _, client_number, dish_number, _ in lines),
+                                    menu)
+        matrix_time = time.perf_counter() - start
+        print(f"{factor:>5}x {len(lines):>9} lines  matrix {matrix_time * 1000:10.1f}ms", end="")
+        if database_url:
+            sql_df, sql_time = sql_profiles(database_url, dish_rows, lines)
+            sql_df.index = sql_df.index.astype(matrix_df.index.dtype)
+            sql_df = sql_df.sort_index()[matrix_df.columns]
+            identical = np.array_equal(sql_df.to_numpy(), matrix_df.to_numpy())
+            difference = np.abs(sql_df.to_numpy() - matrix_df.to_numpy()).max()
+            print(f"  sql {sql_time * 1000:10.1f}ms  identical={identical} max_diff={difference:.3g}", end="")
+        print()
+
+
+if __name__ == '__main__':
+    run(os.environ.get("DATABASE_URL"), [int(factor) for factor in sys.argv[1:]] or [10, 100, 1000])
@@ -0,0 +1,68 @@
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+import pandas as pd
+from matplotlib.figure import Figure
+
+
+def frame_digest(df, *extra):
+    digest = hashlib.sha1(pd.util.hash_pandas_object(df, index=True).values.tobytes())
+    digest.update(repr((list(df.columns),) + extra).encode())
+    return digest.hexdigest()
+
+
+class ChartService:
+    """Renders the owner report bar charts to PNG bytes with the Agg backend.
+
+    Every chart gets its own Figure (no pyplot global state) that is dropped after rendering, and
+    images are cached by a hash of the DataFrame they were drawn from. `report` also remembers the
+    DataFrame of each named report, so asking again while `version` is unchanged and the data is younger
+    than `data_ttl` seconds skips both the query and the rendering.
+    """
+
+    def __init__(self, data_ttl=300.0, max_images=32):
+        self.data_ttl = data_ttl
+        self.max_images = max_images
+        self._lock = threading.Lock()
+        self._images = OrderedDict()
+        self._reports = dict()
+
+    def render_bar(self, df, x, y):
+        key = frame_digest(df, x, y, 'bar')
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+                return image
+        fig = Figure()
+        ax = fig.add_subplot()
+        df.plot(x=x, y=y, kind='bar', ax=ax)
+        fig.tight_layout()
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png')
+        image = buffer.getvalue()
+        with self._lock:
+            self._images[key] = image
+            while len(self._images) > self.max_images:
+                self._images.popitem(last=False)
+        return image
+
+    def report(self, name, load_df, x, y, version=None):
+        with self._lock:
+            cached = self._reports.get(name)
+        if cached is not None and cached[0] == version and time.monotonic() - cached[1] < self.data_ttl:
+            df = cached[2]
+        else:
+            df = load_df()
+            with self._lock:
+                self._reports[name] = (version, time.monotonic(), df)
+        return self.render_bar(df, x, y)
+
+    def invalidate(self, name=None):
+        with self._lock:
+            if name is None:
+                self._reports.clear()
+            else:
+                self._reports.pop(name, None)
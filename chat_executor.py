@@ -0,0 +1,64 @@
+import functools
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger()
+
+
+class ChatExecutor:
+    """Runs handlers on a bounded thread pool while keeping the updates of one chat in order.
+
+    Each chat has a queue that at most one worker drains at a time, so different chats run in
+    parallel and one chat's updates never overtake each other. At most `max_queue` updates wait at
+    once; past that `submit` blocks the dispatcher until a worker frees a slot.
+    """
+
+    def __init__(self, workers=8, max_queue=1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(workers, thread_name_prefix="chat")
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_queue)
+        self._queues = dict()
+
+    def queue_depth(self):
+        with self._lock:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def submit(self, chat_id, func, *args):
+        self._slots.acquire()
+        with self._lock:
+            queue = self._queues.get(chat_id)
+            if queue is not None:
+                queue.append((func, args))
+                return
+            self._queues[chat_id] = deque([(func, args)])
+        self._pool.submit(self._drain, chat_id)
+
+    def _drain(self, chat_id):
+        while True:
+            with self._lock:
+                queue = self._queues[chat_id]
+                if not queue:
+                    del self._queues[chat_id]
+                    return
+                func, args = queue.popleft()
+            try:
+                func(*args)
+            except Exception as error:
+                logger.exception(error)
+            finally:
+                self._slots.release()
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def handler(self, callback):
+        """Wrap a telegram handler callback so it runs on the executor, in order per chat"""
+        @functools.wraps(callback)
+        def submit_update(update, context):
+            chat = update.effective_chat
+            self.submit(chat.id if chat is not None else None, callback, update, context)
+        return submit_update
@@ -0,0 +1,87 @@
+import logging
+import threading
+import time
+import psycopg2
+from psycopg2 import extensions, pool
+
+logger = logging.getLogger()
+
+
+class ConnectionPool:
+    """Thread safe pool of warm psycopg2 connections with a health check on checkout"""
+
+    def __init__(self, database_url, min_size=1, max_size=10, health_check_interval=30.0, acquire_timeout=10.0,
+                 **connect_kwargs):
+        self.database_url = database_url
+        self.min_size = min_size
+        self.max_size = max_size
+        self.health_check_interval = health_check_interval
+        self.acquire_timeout = acquire_timeout
+        self.connect_kwargs = connect_kwargs
+        self._pool = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._last_used = dict()
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = pool.ThreadedConnectionPool(self.min_size, self.max_size, self.database_url,
+                                                             **self.connect_kwargs)
+        return self._pool
+
+    def _is_healthy(self, conn):
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn), 0)
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("select 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            return False
+
+    def getconn(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise pool.PoolError("connection pool exhausted")
+        try:
+            connection_pool = self._get_pool()
+            conn = connection_pool.getconn()
+            if not self._is_healthy(conn):
+                self._last_used.pop(id(conn), None)
+                connection_pool.putconn(conn, close=True)
+                conn = connection_pool.getconn()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn):
+        close = conn.closed != 0
+        if not close and conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except (Exception, psycopg2.DatabaseError) as error:
+                logger.error(error)
+                close = True
+        if close:
+            self._last_used.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.closeall()
+                self._pool = None
+            self._last_used.clear()
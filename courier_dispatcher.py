@@ -0,0 +1,119 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+class CourierDispatcher:
+    """Gives each new order to the courier with the fewest orders in flight.
+
+    Couriers are the (name, phone_number) rows `loader` returns from delivery_person. In-flight counts
+    are kept in a heap of (in flight, sequence, phone_number) entries: an assignment or a release pushes
+    a fresh entry for its courier and outdated entries are dropped when they reach the top, so both
+    are O(log n). Between couriers with the same load, the one whose load changed first wins.
+    An order is released by `release` once delivered; `job` releases it `delivery_time` seconds after
+    `dispatched`, and an order never dispatched (the customer left) `abandon_after` seconds after
+    it was assigned. Until a refresh loads at least one courier, `assign` and `job` try again.
+    """
+
+    def __init__(self, loader, delivery_time=2400.0, abandon_after=3600.0, clock=time.monotonic):
+        self.loader = loader
+        self.delivery_time = delivery_time
+        self.abandon_after = abandon_after
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._heap = list()
+        self._latest = dict()
+        self.couriers = dict()
+        self.in_flight = dict()
+        self.orders = dict()
+        self.loaded = False
+        self.assigned = 0
+
+    def _push(self, phone_number):
+        sequence = next(self._sequence)
+        self._latest[phone_number] = sequence
+        heapq.heappush(self._heap, (self.in_flight[phone_number], sequence, phone_number))
+
+    def _rebuild(self):
+        self._latest = dict()
+        self._heap = list()
+        for phone_number in self.couriers:
+            self._push(phone_number)
+
+    def refresh(self):
+        """Reload the couriers, keeping the in-flight orders of those still listed"""
+        rows = self.loader()
+        with self._lock:
+            if not rows:
+                logger.warning("no couriers loaded from delivery_person")
+                return False
+            self.loaded = True
+            self.couriers = {phone_number: name for name, phone_number in rows}
+            for phone_number in self.couriers:
+                self.in_flight.setdefault(phone_number, 0)
+            self._rebuild()
+        return True
+
+    def assign(self, order_number):
+        """The phone number of the courier now carrying the order, None when there are no couriers"""
+        if not self.loaded:
+            self.refresh()
+        with self._lock:
+            while self._heap:
+                load, sequence, phone_number = self._heap[0]
+                if self._latest.get(phone_number) == sequence and phone_number in self.couriers:
+                    break
+                heapq.heappop(self._heap)
+            else:
+                return None
+            self.in_flight[phone_number] = load + 1
+            sequence = next(self._sequence)
+            self._latest[phone_number] = sequence
+            heapq.heapreplace(self._heap, (load + 1, sequence, phone_number))
+            self.orders[order_number] = [phone_number, self.clock() + self.abandon_after]
+            self.assigned += 1
+            return phone_number
+
+    def dispatched(self, order_number):
+        """The order left the kitchen: release it `delivery_time` seconds from now"""
+        with self._lock:
+            order = self.orders.get(order_number)
+            if order is not None:
+                order[1] = self.clock() + self.delivery_time
+
+    def release(self, order_number):
+        with self._lock:
+            order = self.orders.pop(order_number, None)
+            if order is None:
+                return False
+            phone_number = order[0]
+            self.in_flight[phone_number] -= 1
+            if phone_number in self.couriers:
+                self._push(phone_number)
+                if len(self._heap) > 2 * len(self.couriers) + 16:
+                    self._rebuild()
+            return True
+
+    def release_due(self):
+        now = self.clock()
+        with self._lock:
+            due = [order_number for order_number, order in self.orders.items() if order[1] <= now]
+        for order_number in due:
+            self.release(order_number)
+        return len(due)
+
+    def job(self, context=None):
+        """Job queue callback"""
+        if not self.loaded:
+            self.refresh()
+        self.release_due()
+
+    def depths(self):
+        """Orders in flight per courier phone number"""
+        with self._lock:
+            return {phone_number: self.in_flight[phone_number] for phone_number in self.couriers}
@@ -1,409 +1,659 @@
-import psycopg2
-import logging
-import pandas as pd
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-
-logger = logging.getLogger()
-
-ADD_NEW_CLIENT = """insert into client(phone_number, name) values(%s, %s)"""
-
-ADD_NEW_ORDER = """insert into order_(order_number, shipping, client_number, delivery_phone_number)
-                    values(%s, %s, %s, %s)"""
-
-ADD_NEW_DISH_IN_ORDER = """insert into dish_in_order(order_number, dish_number, quantity)
-                            values(%s, %s, %s)"""
-
-DELETE_DISH_FROM_ORDER = """delete from dish_in_order where dish_number = %s and order_number = %s"""
-
-SELECT_DISHES = """SELECT * FROM dish where dish_type like %s"""
-
-GET_LAST_ORDER_NUMBER = """select max(order_number) from order_"""
-
-GET_DISH_NUMBER = """select dish_number from dish where dish_name = %s"""
-
-GET_SUM_PRICE = """select sum(d.price * dio.quantity)
-                    from dish_in_order dio join dish d on dio.dish_number = d.dish_number 
-                    where dio.order_number = %s"""
-
-GET_CLIENTS_DATA = """select o.client_number, sum(d.price) / count(dio.*) as AVG_price,
-                        sum(cast(cast(d.chiken as int) as numeric)) / count(dio.*) as chicken,
-                        sum(cast(cast(d.spicy as int) as numeric)) / count(dio.*) as spicy,
-                        sum(cast(cast(d.pastry as int) as numeric)) / count(dio.*) as pastry,
-                        sum(cast(cast(d.fish as int) as numeric)) / count(dio.*) as fish,
-                        sum(cast(cast(d.tofu as int) as numeric)) / count(dio.*) as tofu,
-                        sum(cast(cast(d.beef as int) as numeric)) / count(dio.*) as beef,
-                        sum(cast(cast(d.rice as int) as numeric)) / count(dio.*) as rice,
-                        sum(cast(cast(d.coconut_cream as int) as numeric)) / count(dio.*) as coconut_cream,
-                        sum(cast(cast(d.eggs as int) as numeric)) / count(dio.*) as eggs,
-                        sum(cast(cast(d.sea_food as int) as numeric)) / count(dio.*) as sea_food,
-                        sum(cast(cast(d.curry as int) as numeric)) / count(dio.*) as curry,
-                        sum(cast(cast(d.fried as int) as numeric)) / count(dio.*) as fried,
-                        sum(cast(cast(d.vegetarian as int) as numeric)) / count(dio.*) as vegetarian,
-                        sum(cast(cast(d.vegan as int) as numeric)) / count(dio.*) as vegan
-                        from order_ o join dish_in_order dio on o.order_number = dio.order_number
-                                        join dish d on d.dish_number = dio.dish_number
-                        group by o.client_number"""
-
-GET_RECOMMENDED_DISHES = """ select q.dish_name, q.price
-                            from (select o1.client_number,d1.dish_name, d1.price,
-                             cast(count(d1.dish_name) as numeric) /
-                            cast((select count(*) from order_ o2 where 
-                             o2.client_number = o1.client_number) as numeric) as rating
-                              from dish_in_order dio1 join dish d1 
-                              on dio1.dish_number = d1.dish_number 
-                              join order_ o1 on o1.order_number = dio1.order_number
-                              where o1.client_number = %s 
-                             or o1.client_number = %s
-                             or o1.client_number = %s 
-                             or o1.client_number = %s
-                             group by o1.client_number,d1.dish_name, d1.price) q 
-                             group by q.dish_name, q.price
-                             order by sum(q.rating) desc 
-                             LIMIT 5"""
-
-GET_DISHES_CURRENT_ORDER = """select d.dish_name, dio.quantity from dish d join dish_in_order dio on d.dish_number
-                                = dio.dish_number where dio.order_number = %s"""
-
-IS_CLIENT_NEW = """select client_number from order_ where client_number = %s"""
-
-GET_FAVORITE = """ select q.dish_name, q.price
-                            from (select o1.client_number,d1.dish_name, d1.price,
-                             cast(count(d1.dish_name) as numeric) /
-                            cast((select count(*) from order_ o2 where 
-                             o2.client_number = o1.client_number) as numeric) as rating
-                              from dish_in_order dio1 join dish d1 
-                              on dio1.dish_number = d1.dish_number 
-                              join order_ o1 on o1.order_number = dio1.order_number
-                             group by o1.client_number,d1.dish_name, d1.price) q 
-                             group by q.dish_name, q.price
-                             order by sum(q.rating) desc 
-                             LIMIT 5"""
-
-GET_INCOME = """select  o.order_time, sum(d.price * dio.quantity) as daily_income
-                    from order_ o join dish_in_order dio on o.order_number = dio.order_number
-                        join dish d on d.dish_number = dio.dish_number 
-                    WHERE o.order_time BETWEEN current_date - INTERVAL '1 week' AND current_date  
-                    group by o.order_time"""
-
-GET_DELIVERY_PERSON = """select d.name, d.phone_number
-                            from delivery_person d join order_ o on d.phone_number = o.delivery_phone_number
-                            where o.order_number = %s"""
-
-GET_LESS_SEAL_DISHES = """select d.dish_name, sum(dio.quantity), sum(dio.quantity * d.price)
-                            from dish d join dish_in_order dio on d.dish_number = dio.dish_number
-                                join order_ o on o.order_number = dio.order_number
-                            where date_part('month',o.order_time) = date_part('month', CURRENT_DATE) 
-                                and date_part('year',o.order_time) = date_part('year', CURRENT_DATE)
-                            group by d.dish_name
-                            order by sum(dio.quantity * d.price)  
-                            limit 5"""
-
-GET_BEST_SELLERS = """select d.dish_name, sum(dio.quantity), sum(dio.quantity * d.price)
-                        from dish d join dish_in_order dio on d.dish_number = dio.dish_number
-                            join order_ o on o.order_number = dio.order_number
-                        where date_part('month',o.order_time) = date_part('month', CURRENT_DATE) 
-                            and date_part('year',o.order_time) = date_part('year', CURRENT_DATE)
-                        group by d.dish_name
-                        order by sum(dio.quantity * d.price)  desc
-                        limit 5"""
-
-GET_DISH_TYPE_INCOME = """select d.dish_type, sum(d.price * dio.quantity) as income
-                            from dish d join dish_in_order dio on d.dish_number = dio.dish_number 
-                            group by d.dish_type"""
-
-SET_REMARKS = """update order_ set remarks = %s where order_number = %s"""
-
-GET_REMARK = """select remarks from order_ where order_number = %s"""
-
-class DataSource:
-    def __init__(self, database_url):
-        self.database_url = database_url
-
-    def get_connection(self):
-        return psycopg2.connect(self.database_url, sslmode='allow')
-
-    @staticmethod
-    def close_connection(conn):
-        if conn is not None:
-            conn.close()
-
-    def new_row(self, query, *args):
-        conn = None
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(query, args)
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-
-    def new_client(self, phone_number, name):
-        self.new_row(ADD_NEW_CLIENT, phone_number, name)
-
-    def new_order(self, order_number, shipping, client_number, delivery_phone_number):
-        self.new_row(ADD_NEW_ORDER, order_number, shipping, client_number, delivery_phone_number)
-
-    def new_dish_in_order(self, order_number, dish_number, quantity):
-        self.new_row(ADD_NEW_DISH_IN_ORDER, order_number, dish_number, quantity)
-
-    def delete_dish_from_order(self, dish_number, order_number):
-        self.new_row(DELETE_DISH_FROM_ORDER, dish_number, order_number)
-
-    def set_remarks(self, remarks, order_number):
-        self.new_row(SET_REMARKS, remarks, order_number)
-
-    def get_last_order(self):
-        conn = None
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(GET_LAST_ORDER_NUMBER)
-            number = cur.fetchall()[0]
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            return number[0]
-
-    def get_dishes(self, dish_type):
-        conn = None
-        dishes = list()
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(SELECT_DISHES, (dish_type,))
-            for row in cur.fetchall():
-                add_dish = row[1] + "\t" + str(row[2]) + "₪"
-                dishes.append(add_dish)
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            return dishes
-
-    def get_dish_number(self, dish_name):
-        conn = None
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(GET_DISH_NUMBER, (dish_name,))
-            dish_number = cur.fetchall()[0]
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            return dish_number[0]
-
-    def get_sum_price(self, order_number):
-        conn = None
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(GET_SUM_PRICE, (order_number,))
-            sum_price = cur.fetchall()[0]
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            return sum_price[0]
-
-    def get_clients_taste_df(self):
-        conn = None
-        try:
-            conn = self.get_connection()
-            sql_query = pd.read_sql_query(GET_CLIENTS_DATA, conn)
-            df = pd.DataFrame(sql_query,
-                              columns=['client_number', 'avg_price', 'chicken', 'spicy', 'pastry', 'fish', 'tofu',
-                                       'beef', 'rice', 'coconut_cream', 'eggs', 'sea_food', 'curry', 'fried',
-                                       'vegetarian', 'vegan'])
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            data_f = df.pivot_table(index='client_number')
-            return data_f
-
-    def get_recommendation_dishes(self, user):
-        df = self.get_clients_taste_df()
-        normal_df = self.normalize(df)
-        similarity_df = self.get_similarity(normal_df)
-        close_users = similarity_df.sort_values(by=[user], ascending=False)
-        top_close = list(close_users.head(5).index)
-        top_close = top_close[1:]
-        recommendation_dishes = self.get_top_recommended_dishes(top_close[0], top_close[1], top_close[2], top_close[3])
-        return recommendation_dishes
-
-    def normalize(self, df_min_max_scaled):
-        columns = list(df_min_max_scaled.columns)
-        for column in columns:
-            df_min_max_scaled[column] = (df_min_max_scaled[column] - df_min_max_scaled[column].min()) / (
-                    df_min_max_scaled[column].max()
-                    - df_min_max_scaled[column].min())
-        return df_min_max_scaled
-
-    def get_similarity(self, normal_df):
-        similarity = cosine_similarity(normal_df)
-        similarity_df = pd.DataFrame(similarity)
-        similarity_df.index = normal_df.index
-        similarity_df.columns = normal_df.index
-        return similarity_df
-
-    def get_top_recommended_dishes(self, client1, client2, client3, client4):
-        conn = None
-        dishes = list()
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(GET_RECOMMENDED_DISHES, (client1, client2, client3, client4,))
-            for row in cur.fetchall():
-                add_dish = row[0] + "\t" + str(row[1]) + "₪"
-                dishes.append(add_dish)
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            return dishes
-
-    def get_current_dishes(self, order_number):
-        conn = None
-        dishes = list()
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(GET_DISHES_CURRENT_ORDER, (order_number,))
-            for row in cur.fetchall():
-                dishes.append(row)
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            out = [item for dish in dishes for item in dish]
-            return out
-
-    def is_client_new(self, client_number):
-        conn = None
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(IS_CLIENT_NEW, (client_number,))
-            is_new = len(cur.fetchall()) < 2
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            return is_new
-
-    def get_favorite_dishes(self):
-        conn = None
-        dishes = list()
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(GET_FAVORITE)
-            for row in cur.fetchall():
-                add_dish = row[0] + "\t" + str(row[1]) + "₪"
-                dishes.append(add_dish)
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            return dishes
-
-    def get_income_df(self, query, col1, col2):
-        conn = None
-        try:
-            conn = self.get_connection()
-            sql_query = pd.read_sql_query(query, conn)
-            df = pd.DataFrame(sql_query,
-                              columns=[col1, col2])
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            return df
-
-    def get_last_week_income_df(self):
-        return self.get_income_df(GET_INCOME, 'order_time', 'daily_income')
-
-    def get_dish_type_income_df(self):
-        return self.get_income_df(GET_DISH_TYPE_INCOME, 'dish_type', 'income')
-
-    def get_delivery_person(self, order_number):
-        conn = None
-        dishes = list()
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(GET_DELIVERY_PERSON, (order_number,))
-            for row in cur.fetchall():
-                dishes.append(row)
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            out = [item for dish in dishes for item in dish]
-            return out
-
-    def get_seal_dishes(self, query):
-        conn = None
-        dishes = list()
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(query)
-            for row in cur.fetchall():
-                add_dish = row[0] + "\t\tsold\t" + str(row[1]) + "\t\tand generated\t" + str(row[2]) + " ₪"
-                dishes.append(add_dish)
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            return dishes
-
-    def get_less_seal_dishes(self):
-        return self.get_seal_dishes(GET_LESS_SEAL_DISHES)
-
-    def get_best_seal_dishes(self):
-        return self.get_seal_dishes(GET_BEST_SELLERS)
-
-    def get_remark(self, order_number):
-        conn = None
-        try:
-            conn = self.get_connection()
-            cur = conn.cursor()
-            cur.execute(GET_REMARK, (order_number,))
-            remark = cur.fetchall()
-            cur.close()
-            conn.commit()
-        except (Exception, psycopg2.DatabaseError) as error:
-            logger.error(error)
-        finally:
-            self.close_connection(conn)
-            temp = remark[0]
-            remark = temp[0]
-            return remark
-
+import psycopg2
+import logging
+import json
+import os
+import datetime
+from storage_backends import PostgresBackend
+from menu_catalog import MenuCatalog
+from taste_store import TasteStore
+from recommender import RecommenderEngine
+from order_cart import OrderCart
+from order_allocator import OrderNumberAllocator
+from sales_rollup import SalesRollup
+from income_store import IncomeStore
+from query_metrics import QueryMetrics
+from rankings import RankingSnapshot
+from courier_dispatcher import CourierDispatcher
+import pandas as pd
+
+logger = logging.getLogger()
+
+ADD_NEW_CLIENT = """insert into client(phone_number, name) values(%s, %s)"""
+
+ADD_NEW_ORDER = """insert into order_(order_number, shipping, client_number, delivery_phone_number)
+                    values(%s, %s, %s, %s)"""
+
+ADD_NEW_DISH_IN_ORDER = """insert into dish_in_order(order_number, dish_number, quantity)
+                            values(%s, %s, %s)"""
+
+DELETE_DISH_FROM_ORDER = """delete from dish_in_order where dish_number = %s and order_number = %s"""
+
+SELECT_ALL_DISHES = """SELECT * FROM dish"""
+
+GET_DISH_NUMBER = """select dish_number from dish where dish_name = %s"""
+
+GET_CLIENTS_DATA = """select o.client_number, sum(d.price) / count(dio.*) as AVG_price,
+                        sum(cast(cast(d.chiken as int) as numeric)) / count(dio.*) as chicken,
+                        sum(cast(cast(d.spicy as int) as numeric)) / count(dio.*) as spicy,
+                        sum(cast(cast(d.pastry as int) as numeric)) / count(dio.*) as pastry,
+                        sum(cast(cast(d.fish as int) as numeric)) / count(dio.*) as fish,
+                        sum(cast(cast(d.tofu as int) as numeric)) / count(dio.*) as tofu,
+                        sum(cast(cast(d.beef as int) as numeric)) / count(dio.*) as beef,
+                        sum(cast(cast(d.rice as int) as numeric)) / count(dio.*) as rice,
+                        sum(cast(cast(d.coconut_cream as int) as numeric)) / count(dio.*) as coconut_cream,
+                        sum(cast(cast(d.eggs as int) as numeric)) / count(dio.*) as eggs,
+                        sum(cast(cast(d.sea_food as int) as numeric)) / count(dio.*) as sea_food,
+                        sum(cast(cast(d.curry as int) as numeric)) / count(dio.*) as curry,
+                        sum(cast(cast(d.fried as int) as numeric)) / count(dio.*) as fried,
+                        sum(cast(cast(d.vegetarian as int) as numeric)) / count(dio.*) as vegetarian,
+                        sum(cast(cast(d.vegan as int) as numeric)) / count(dio.*) as vegan
+                        from order_ o join dish_in_order dio on o.order_number = dio.order_number
+                                        join dish d on d.dish_number = dio.dish_number
+                        group by o.client_number"""
+
+GET_DISHES_CURRENT_ORDER = """select dish_number, quantity from dish_in_order where order_number = %s"""
+
+IS_CLIENT_NEW = """select client_number from order_ where client_number = %s"""
+
+GET_FAVORITE = """ select q.dish_name, q.price
+                            from (select o1.client_number,d1.dish_name, d1.price,
+                             cast(count(d1.dish_name) as numeric) /
+                            cast((select count(*) from order_ o2 where 
+                             o2.client_number = o1.client_number) as numeric) as rating
+                              from dish_in_order dio1 join dish d1 
+                              on dio1.dish_number = d1.dish_number 
+                              join order_ o1 on o1.order_number = dio1.order_number
+                             group by o1.client_number,d1.dish_name, d1.price) q 
+                             group by q.dish_name, q.price
+                             order by sum(q.rating) desc 
+                             LIMIT 5"""
+
+GET_DAILY_DISH_SALES = """select cast(o.order_time as date), dio.dish_number, sum(dio.quantity)
+                            from order_ o join dish_in_order dio on o.order_number = dio.order_number
+                            where o.order_time is not null
+                            group by 1, 2"""
+
+GET_DELIVERY_PERSONS = """select name, phone_number from delivery_person"""
+
+GET_MONTHLY_DISH_SALES = """select date_part('year', o.order_time), date_part('month', o.order_time),
+                                dio.dish_number, sum(dio.quantity)
+                            from order_ o join dish_in_order dio on o.order_number = dio.order_number
+                            where o.order_time is not null
+                            group by 1, 2, 3"""
+
+GET_ORDER_SALES = """select cast(o.order_time as date), dio.dish_number, sum(dio.quantity)
+                        from order_ o left join dish_in_order dio on dio.order_number = o.order_number
+                        where o.order_number = %s
+                        group by 1, 2"""
+
+GET_ORDER_SUMMARY = """select o.remarks, dp.name, dp.phone_number, dio.dish_number, dio.quantity
+                        from order_ o left join delivery_person dp on dp.phone_number = o.delivery_phone_number
+                                      left join dish_in_order dio on dio.order_number = o.order_number
+                        where o.order_number = %s"""
+
+GET_ORDER_LINES = """select o.order_number, o.client_number, dio.dish_number, dio.quantity
+                        from order_ o left join dish_in_order dio on o.order_number = dio.order_number"""
+
+SET_REMARKS = """update order_ set remarks = %s where order_number = %s"""
+
+GET_ORDER_DISHES_SINCE = """select order_number, dish_number from dish_in_order where order_number >= %s"""
+
+CREATE_SESSION_LOG = """create table if not exists session_log(seq bigserial primary key, chat_id bigint not null,
+                            state text)"""
+
+ADD_SESSION_RECORD = """insert into session_log(chat_id, state) values(%s, %s)"""
+
+GET_SESSION_RECORDS = """select chat_id, state from session_log order by seq"""
+
+DELETE_SESSION_RECORDS = """delete from session_log"""
+
+SQLITE_QUERIES = {
+    GET_CLIENTS_DATA: """select o.client_number, sum(d.price) * 1.0 / count(*) as avg_price,
+                        sum(d.chiken) * 1.0 / count(*) as chicken, sum(d.spicy) * 1.0 / count(*) as spicy,
+                        sum(d.pastry) * 1.0 / count(*) as pastry, sum(d.fish) * 1.0 / count(*) as fish,
+                        sum(d.tofu) * 1.0 / count(*) as tofu, sum(d.beef) * 1.0 / count(*) as beef,
+                        sum(d.rice) * 1.0 / count(*) as rice,
+                        sum(d.coconut_cream) * 1.0 / count(*) as coconut_cream,
+                        sum(d.eggs) * 1.0 / count(*) as eggs, sum(d.sea_food) * 1.0 / count(*) as sea_food,
+                        sum(d.curry) * 1.0 / count(*) as curry, sum(d.fried) * 1.0 / count(*) as fried,
+                        sum(d.vegetarian) * 1.0 / count(*) as vegetarian, sum(d.vegan) * 1.0 / count(*) as vegan
+                        from order_ o join dish_in_order dio on o.order_number = dio.order_number
+                                        join dish d on d.dish_number = dio.dish_number
+                        group by o.client_number""",
+    GET_FAVORITE: """select q.dish_name, q.price
+                        from (select o1.client_number, d1.dish_name, d1.price,
+                                count(d1.dish_name) * 1.0 /
+                                (select count(*) from order_ o2 where o2.client_number = o1.client_number) as rating
+                              from dish_in_order dio1 join dish d1 on dio1.dish_number = d1.dish_number
+                                join order_ o1 on o1.order_number = dio1.order_number
+                              group by o1.client_number, d1.dish_name, d1.price) q
+                        group by q.dish_name, q.price
+                        order by sum(q.rating) desc
+                        LIMIT 5""",
+    GET_DAILY_DISH_SALES: """select o.order_time, dio.dish_number, sum(dio.quantity)
+                            from order_ o join dish_in_order dio on o.order_number = dio.order_number
+                            where o.order_time is not null
+                            group by o.order_time, dio.dish_number""",
+    GET_MONTHLY_DISH_SALES: """select cast(strftime('%Y', o.order_time) as integer),
+                                cast(strftime('%m', o.order_time) as integer), dio.dish_number, sum(dio.quantity)
+                            from order_ o join dish_in_order dio on o.order_number = dio.order_number
+                            where o.order_time is not null
+                            group by 1, 2, 3""",
+    GET_ORDER_SALES: """select o.order_time, dio.dish_number, sum(dio.quantity)
+                        from order_ o left join dish_in_order dio on dio.order_number = o.order_number
+                        where o.order_number = %s
+                        group by o.order_time, dio.dish_number""",
+    CREATE_SESSION_LOG: """create table if not exists session_log(seq integer primary key autoincrement,
+                            chat_id integer not null, state text)""",
+}
+
+QUERY_NAMES = {query: name for name, query in list(globals().items())
+               if name.isupper() and isinstance(query, str) and name != 'SQLITE_QUERIES'}
+
+class OrderSummary:
+    """Everything the continue, back and finish screens show about an order, read together"""
+
+    def __init__(self, lines, dishes, total, remark, courier):
+        self.lines = lines
+        self.dishes = dishes
+        self.total = total
+        self.remark = remark
+        self.courier = courier
+
+
+class DataSource:
+    def __init__(self, database_url, min_connections=1, max_connections=10, menu_ttl=3600.0,
+                 neighbour_block_size=None, recommend_neighbours=4, recommend_mode='user',
+                 recommendations_path=None, cart_flush_after=60.0, order_block_size=20, backend=None,
+                 query_metrics=True, rankings_interval=300.0, analytics_backend=None, delivery_time=2400.0):
+        self.database_url = database_url
+        self.backend = backend or PostgresBackend(database_url, min_connections, max_connections)
+        self.analytics = analytics_backend or self.backend
+        self.queries = SQLITE_QUERIES if self.backend.dialect == 'sqlite' else dict()
+        self.metrics = QueryMetrics(query_metrics, dict(self.backend.query_names))
+        self.metrics.query_names.update((self.sql(query), name) for query, name in QUERY_NAMES.items())
+        self.menu = MenuCatalog(self.load_menu, ttl=menu_ttl)
+        self.taste = TasteStore(self.load_order_lines, self.menu, block_size=neighbour_block_size)
+        self.recommender = RecommenderEngine(self.load_order_lines, self.taste, neighbours=recommend_neighbours)
+        self.recommend_mode = recommend_mode
+        self.recommendations_path = recommendations_path
+        self.precomputed = dict()
+        self.precomputed_mtime = None
+        self.cart = OrderCart(self.write_order_changes, flush_after=cart_flush_after)
+        self.order_numbers = OrderNumberAllocator(self.reserve_order_numbers, block_size=order_block_size)
+        self.data_version = 0
+        self.sales = SalesRollup(self.load_monthly_sales, self.menu, order_loader=self.load_order_sales)
+        self.income = IncomeStore(self.load_daily_sales, self.menu, order_loader=self.load_order_sales)
+        self.order_listeners = [self.taste, self.recommender, self.sales, self.income]
+        self.rankings = RankingSnapshot({'favorites': self.load_favorite_dishes,
+                                         'sellers': self.load_best_and_less_seal_dishes}, rankings_interval,
+                                        defaults={'favorites': [], 'sellers': ([], [])})
+        self.metrics.gauge("rankings_staleness_s", self.rankings.staleness)
+        self.metrics.gauge("rankings_refresh_s", lambda: self.rankings.last_duration)
+        self.session_log_ready = False
+        self.dispatcher = CourierDispatcher(self.load_delivery_persons, delivery_time=delivery_time)
+        self.metrics.gauge("couriers_in_flight", self.dispatcher.depths)
+        self.metrics.gauge("orders_in_flight", lambda: len(self.dispatcher.orders))
+
+    def get_connection(self, backend=None):
+        """A connection of `backend`: the ordering flow's by default, `self.analytics` for the reports"""
+        return self.metrics.connection((backend or self.backend).getconn)
+
+    def close_connection(self, conn, backend=None):
+        if conn is not None:
+            (backend or self.backend).putconn(self.metrics.release(conn))
+
+    def close(self):
+        self.cart.flush_all()
+        self.backend.closeall()
+        if self.analytics is not self.backend:
+            self.analytics.closeall()
+
+    def sql(self, query):
+        """The query in the dialect and parameter style of the storage backend"""
+        return self.backend.sql(self.queries.get(query, query))
+
+    def new_row(self, query, *args):
+        conn = None
+        done = False
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            cur.execute(self.sql(query), args)
+            cur.close()
+            conn.commit()
+            done = True
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn)
+        return done
+
+    def new_client(self, phone_number, name):
+        self.new_row(ADD_NEW_CLIENT, phone_number, name)
+
+    def new_order(self, order_number, shipping, client_number, delivery_phone_number):
+        if not self.new_row(ADD_NEW_ORDER, order_number, shipping, client_number, delivery_phone_number):
+            return False
+        self.data_version += 1
+        for listener in self.order_listeners:
+            listener.add_order(order_number, client_number)
+        return True
+
+    def new_dish_in_order(self, order_number, dish_number, quantity):
+        if self.new_row(ADD_NEW_DISH_IN_ORDER, order_number, dish_number, quantity):
+            self.data_version += 1
+            for listener in self.order_listeners:
+                listener.add_dish(order_number, dish_number, quantity)
+
+    def delete_dish_from_order(self, dish_number, order_number):
+        if self.new_row(DELETE_DISH_FROM_ORDER, dish_number, order_number):
+            self.data_version += 1
+            for listener in self.order_listeners:
+                listener.remove_dish(order_number, dish_number)
+
+    def set_remarks(self, remarks, order_number):
+        self.new_row(SET_REMARKS, remarks, order_number)
+
+    def write_order_changes(self, order_number, deleted, added):
+        conn = None
+        done = False
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            self.backend.write_order_lines(cur, order_number, deleted, added)
+            cur.close()
+            conn.commit()
+            done = True
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn)
+        if done:
+            self.data_version += 1
+            for listener in self.order_listeners:
+                for dish_number in deleted:
+                    listener.remove_dish(order_number, dish_number)
+                for dish_number, quantity in added:
+                    listener.add_dish(order_number, dish_number, quantity)
+        return done
+
+    def add_session_records(self, records, replace=False):
+        """Append (chat_id, state) records to the session log, or replace the whole log with them"""
+        conn = None
+        done = False
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            if not self.session_log_ready:
+                cur.execute(self.sql(CREATE_SESSION_LOG))
+            if replace:
+                cur.execute(self.sql(DELETE_SESSION_RECORDS))
+            if records:
+                self.backend.execute_batch(cur, ADD_SESSION_RECORD, records)
+            cur.close()
+            conn.commit()
+            self.session_log_ready = True
+            done = True
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn)
+        return done
+
+    def get_session_records(self):
+        """The session log in write order, or None when it could not be read"""
+        conn = None
+        records = None
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            if not self.session_log_ready:
+                cur.execute(self.sql(CREATE_SESSION_LOG))
+                conn.commit()
+                self.session_log_ready = True
+            cur.execute(self.sql(GET_SESSION_RECORDS))
+            records = cur.fetchall()
+            cur.close()
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn)
+        return records
+
+    def load_order_dishes(self, first_order_number):
+        """{order_number: dish numbers} stored in dish_in_order from `first_order_number` on, None on error"""
+        conn = None
+        dishes = None
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            cur.execute(self.sql(GET_ORDER_DISHES_SINCE), (first_order_number,))
+            dishes = dict()
+            for order_number, dish_number in cur.fetchall():
+                dishes.setdefault(order_number, set()).add(dish_number)
+            cur.close()
+            conn.commit()
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+            dishes = None
+        finally:
+            self.close_connection(conn)
+        return dishes
+
+    def reserve_order_numbers(self, count):
+        conn = None
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            numbers = self.backend.reserve_order_numbers(cur, count)
+            cur.close()
+            conn.commit()
+            return numbers
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            raise
+        finally:
+            self.close_connection(conn)
+
+    def new_order_number(self):
+        """The next order number, None when no block of numbers could be reserved"""
+        try:
+            return self.order_numbers.next_number()
+        except (Exception, psycopg2.DatabaseError) as error:
+            self.metrics.record_error(error)
+            return None
+
+    def load_menu(self):
+        conn = None
+        columns = list()
+        rows = list()
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            cur.execute(self.sql(SELECT_ALL_DISHES))
+            columns = [column[0].lower() for column in cur.description]
+            rows = cur.fetchall()
+            cur.close()
+            conn.commit()
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn)
+            return columns, rows
+
+    def get_dishes(self, dish_type):
+        return [dish['dish_name'] + "\t" + str(dish['price']) + "₪" for dish in self.menu.get_dishes(dish_type)]
+
+    def get_dish_number(self, dish_name):
+        """None for a name that is not a dish; the menu is reloaded only when the dish table has it"""
+        dish_number = self.menu.get_dish_number(dish_name)
+        if dish_number is None:
+            dish_number = self.query_dish_number(dish_name)
+            if dish_number is not None:
+                self.menu.invalidate()
+        return dish_number
+
+    def query_dish_number(self, dish_name):
+        conn = None
+        dish_number = None
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            cur.execute(self.sql(GET_DISH_NUMBER), (dish_name,))
+            row = cur.fetchone()
+            cur.close()
+            conn.commit()
+            if row is not None:
+                dish_number = row[0]
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn)
+        return dish_number
+
+    def load_order_lines(self):
+        conn = None
+        rows = list()
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            cur.execute(self.sql(GET_ORDER_LINES))
+            rows = cur.fetchall()
+            cur.close()
+            conn.commit()
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn)
+            return rows
+
+    def format_dish(self, dish_number):
+        dish = self.menu.get_dish(dish_number)
+        return dish['dish_name'] + "\t" + str(dish['price']) + "₪"
+
+    def get_current_dish_numbers(self, order_number):
+        current_dishes = self.get_current_dishes(order_number)
+        return [self.menu.get_dish_number(dish_name) for dish_name in current_dishes[::2]]
+
+    def get_precomputed_dishes(self, user):
+        if self.recommendations_path is None:
+            return None
+        try:
+            mtime = os.path.getmtime(self.recommendations_path)
+            if mtime != self.precomputed_mtime:
+                with open(self.recommendations_path, encoding='utf-8') as artifact:
+                    self.precomputed = json.load(artifact)["clients"]
+                self.precomputed_mtime = mtime
+        except (OSError, ValueError, KeyError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        client = self.precomputed.get(str(user))
+        return None if client is None else client["dishes"]
+
+    def get_recommendation_dishes(self, user, order_number=None):
+        exclude = self.get_current_dish_numbers(order_number) if order_number is not None else list()
+        dish_numbers = self.get_precomputed_dishes(user)
+        if dish_numbers is None:
+            dish_numbers = self.recommender.recommend(user, exclude=exclude, mode=self.recommend_mode)
+        else:
+            dish_numbers = [dish for dish in dish_numbers if dish not in exclude][:self.recommender.top_n]
+        if not dish_numbers:
+            current_dishes = [self.format_dish(dish_number) for dish_number in exclude]
+            return [dish for dish in self.get_favorite_dishes() if dish not in current_dishes]
+        return [self.format_dish(dish_number) for dish_number in dish_numbers]
+
+    def get_current_lines(self, order_number):
+        with self.cart.settled(order_number):
+            conn = None
+            lines = list()
+            try:
+                conn = self.get_connection()
+                cur = conn.cursor()
+                cur.execute(self.sql(GET_DISHES_CURRENT_ORDER), (order_number,))
+                lines = cur.fetchall()
+                cur.close()
+                conn.commit()
+            except (Exception, psycopg2.DatabaseError) as error:
+                logger.error(error)
+                self.metrics.record_error(error)
+            finally:
+                self.close_connection(conn)
+                return self.cart.merge_lines(order_number, lines)
+
+    def get_current_dishes(self, order_number):
+        out = list()
+        for dish_number, quantity in self.get_current_lines(order_number):
+            out += [self.menu.get_dish(dish_number)['dish_name'], quantity]
+        return out
+
+    def get_order_summary(self, order_number):
+        """Lines (with the buffered cart changes), total, remark and courier of an order in one query"""
+        with self.cart.settled(order_number):
+            conn = None
+            rows = list()
+            try:
+                conn = self.get_connection()
+                cur = conn.cursor()
+                cur.execute(self.sql(GET_ORDER_SUMMARY), (order_number,))
+                rows = cur.fetchall()
+                cur.close()
+                conn.commit()
+            except (Exception, psycopg2.DatabaseError) as error:
+                logger.error(error)
+                self.metrics.record_error(error)
+            finally:
+                self.close_connection(conn)
+            lines = self.cart.merge_lines(order_number, [(row[3], row[4]) for row in rows if row[3] is not None])
+        dishes = list()
+        for dish_number, quantity in lines:
+            dishes += [self.menu.get_dish(dish_number)['dish_name'], quantity]
+        total = sum(self.menu.get_price(dish_number) * quantity for dish_number, quantity in lines) if lines else None
+        remark = rows[0][0] if rows else None
+        courier = [rows[0][1], rows[0][2]] if rows and rows[0][1] is not None else list()
+        return OrderSummary(lines, dishes, total, remark, courier)
+
+    def is_client_new(self, client_number):
+        conn = None
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            cur.execute(self.sql(IS_CLIENT_NEW), (client_number,))
+            is_new = len(cur.fetchall()) < 2
+            cur.close()
+            conn.commit()
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn)
+            return is_new
+
+    def get_favorite_dishes(self):
+        return list(self.rankings.get('favorites'))
+
+    def load_favorite_dishes(self):
+        conn = None
+        dishes = list()
+        try:
+            conn = self.get_connection(self.analytics)
+            cur = conn.cursor()
+            cur.execute(self.sql(GET_FAVORITE))
+            for row in cur.fetchall():
+                add_dish = row[0] + "\t" + str(row[1]) + "₪"
+                dishes.append(add_dish)
+            cur.close()
+            conn.commit()
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn, self.analytics)
+            return dishes
+
+    def load_daily_sales(self):
+        """None when the query failed, so the report fails rather than showing no sales"""
+        conn = None
+        rows = None
+        try:
+            conn = self.get_connection(self.analytics)
+            cur = conn.cursor()
+            cur.execute(self.sql(GET_DAILY_DISH_SALES))
+            rows = cur.fetchall()
+            cur.close()
+            conn.commit()
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn, self.analytics)
+            return rows
+
+    def get_income_df(self, start, end, granularity='day'):
+        return pd.DataFrame(self.income.income(start, end, granularity, skip_empty=True),
+                            columns=['order_time', 'daily_income'])
+
+    def get_last_week_income_df(self):
+        today = datetime.date.today()
+        return self.get_income_df(today - datetime.timedelta(weeks=1), today)
+
+    def get_dish_type_income_df(self):
+        return pd.DataFrame(list(self.income.income_by_type().items()), columns=['dish_type', 'income'])
+
+    def load_delivery_persons(self):
+        conn = None
+        rows = list()
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            cur.execute(self.sql(GET_DELIVERY_PERSONS))
+            rows = cur.fetchall()
+            cur.close()
+            conn.commit()
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn)
+            return rows
+
+    def load_monthly_sales(self):
+        """None when the query failed, so the report fails rather than showing no sales"""
+        conn = None
+        rows = None
+        try:
+            conn = self.get_connection(self.analytics)
+            cur = conn.cursor()
+            cur.execute(self.sql(GET_MONTHLY_DISH_SALES))
+            rows = cur.fetchall()
+            cur.close()
+            conn.commit()
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn, self.analytics)
+            return rows
+
+    def load_order_sales(self, order_number):
+        """(day the order was opened, {dish_number: quantity}) for the sales stores, None if unknown or on error"""
+        conn = None
+        order = None
+        try:
+            conn = self.get_connection()
+            cur = conn.cursor()
+            cur.execute(self.sql(GET_ORDER_SALES), (order_number,))
+            rows = cur.fetchall()
+            cur.close()
+            conn.commit()
+            if rows and rows[0][0] is not None:
+                order = (rows[0][0], {dish_number: quantity for _, dish_number, quantity in rows
+                                      if dish_number is not None})
+        except (Exception, psycopg2.DatabaseError) as error:
+            logger.error(error)
+            self.metrics.record_error(error)
+        finally:
+            self.close_connection(conn)
+        return order
+
+    @staticmethod
+    def get_seal_dishes(rows):
+        return [row[0] + "\t\tsold\t" + str(row[1]) + "\t\tand generated\t" + str(row[2]) + " ₪" for row in rows]
+
+    def load_best_and_less_seal_dishes(self, k=5):
+        best, less = self.sales.top_bottom(k)
+        return self.get_seal_dishes(best), self.get_seal_dishes(less)
+
+    def get_less_seal_dishes(self):
+        return self.rankings.get('sellers')[1]
+
+    def get_best_seal_dishes(self):
+        return self.rankings.get('sellers')[0]
@@ -0,0 +1,108 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from telegram.error import TelegramError
+
+logger = logging.getLogger()
+
+
+class DishMediaCache:
+    """Sends dish photos by Telegram file_id once they have been uploaded.
+
+    The file_id Telegram returns for the first upload is stored in a JSON map keyed by dish name and
+    photo checksum, so a changed photo is uploaded again. Photo bytes are kept in a bounded LRU to
+    retry an upload (or a stale file_id) without going back to the disk.
+    """
+
+    def __init__(self, directory=".", map_path="dish_photos.json", max_photos=32):
+        self.directory = directory
+        self.map_path = map_path
+        self.max_photos = max_photos
+        self._lock = threading.Lock()
+        self._photos = OrderedDict()
+        self._checksums = dict()
+        self.file_ids = self._load_map()
+
+    def _load_map(self):
+        try:
+            with open(self.map_path, encoding='utf-8') as map_file:
+                return json.load(map_file)
+        except FileNotFoundError:
+            return dict()
+        except (OSError, ValueError) as error:
+            logger.error(error)
+            return dict()
+
+    def _save_map(self):
+        temp_path = self.map_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as map_file:
+            json.dump(self.file_ids, map_file)
+        os.replace(temp_path, self.map_path)
+
+    def photo_path(self, dish_name):
+        return os.path.join(self.directory, dish_name + ".png")
+
+    def _read(self, dish_name):
+        """(key, photo bytes or None) where key is dish name and checksum of the current photo file"""
+        path = self.photo_path(dish_name)
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            cached = self._checksums.get(dish_name)
+            if cached is not None and cached[0] == signature:
+                photo = self._photos.get(cached[1])
+                if photo is not None:
+                    self._photos.move_to_end(cached[1])
+                return cached[1], photo
+        with open(path, 'rb') as photo_file:
+            photo = photo_file.read()
+        key = dish_name + ":" + hashlib.sha1(photo).hexdigest()
+        with self._lock:
+            self._checksums[dish_name] = (signature, key)
+            self._photos[key] = photo
+            while len(self._photos) > self.max_photos:
+                self._photos.popitem(last=False)
+        return key, photo
+
+    def _upload(self, bot, chat_id, dish_name, key, photo):
+        if photo is None:
+            key, photo = self._read(dish_name)
+        message = bot.send_photo(chat_id, photo=photo)
+        with self._lock:
+            self.file_ids[key] = message.photo[-1].file_id
+            try:
+                self._save_map()
+            except OSError as error:
+                logger.error(error)
+        return message
+
+    def send_photo(self, bot, chat_id, dish_name):
+        try:
+            key, photo = self._read(dish_name)
+        except OSError as error:
+            logger.error(error)
+            return None
+        file_id = self.file_ids.get(key)
+        if file_id is not None:
+            try:
+                return bot.send_photo(chat_id, photo=file_id)
+            except TelegramError as error:
+                logger.error(f"cached photo of {dish_name} was rejected: {error}")
+                with self._lock:
+                    self.file_ids.pop(key, None)
+        return self._upload(bot, chat_id, dish_name, key, photo)
+
+    def prewarm(self, dish_names, bot=None, chat_id=None):
+        """Checksum every photo and, given a chat to upload to, upload the ones without a file_id"""
+        for dish_name in dish_names:
+            try:
+                key, photo = self._read(dish_name)
+                if bot is not None and chat_id is not None and key not in self.file_ids:
+                    self._upload(bot, chat_id, dish_name, key, photo)
+            except FileNotFoundError:
+                continue
+            except (OSError, TelegramError) as error:
+                logger.error(error)
@@ -0,0 +1,190 @@
+import datetime
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger()
+
+GRANULARITIES = ('day', 'week', 'month')
+
+
+class IncomeStore:
+    """Daily income buckets kept as a day x dish quantity array, updated as order lines are written.
+
+    `loader` returns (day, dish_number, quantity) rows aggregated over all orders. New orders are
+    counted on the day they were opened. An order opened before the store started is looked up once
+    with `order_loader(order_number)`, as in SalesRollup; only when that fails, or the first change
+    seen to such an order removes a line, the store rebuilds on the next read. Changes written while
+    `build` is loading are replayed on its result. Income is quantity times the current menu price, so
+    a query touches only the buckets of its range and never dish_in_order.
+    """
+
+    def __init__(self, loader, menu, today=datetime.date.today, order_loader=None):
+        self.loader = loader
+        self.menu = menu
+        self.today = today
+        self.order_loader = order_loader
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._built = False
+        self._journal = None
+        self.first_day = None
+        self.dish_column = dict()
+        self.quantities = np.zeros((0, 0), dtype=np.int64)
+        self.order_day = dict()
+        self.order_lines = dict()
+
+    def _column(self, dish_number):
+        column = self.dish_column.get(dish_number)
+        if column is None:
+            column = self.dish_column[dish_number] = len(self.dish_column)
+            if column >= self.quantities.shape[1]:
+                self.quantities = np.hstack([self.quantities, np.zeros((self.quantities.shape[0],
+                                                                         max(16, column)), dtype=np.int64)])
+        return column
+
+    def _row(self, day):
+        if self.first_day is None:
+            self.first_day = day
+        if day < self.first_day:
+            shift = (self.first_day - day).days
+            self.quantities = np.vstack([np.zeros((shift, self.quantities.shape[1]), dtype=np.int64),
+                                         self.quantities])
+            self.first_day = day
+        row = (day - self.first_day).days
+        if row >= self.quantities.shape[0]:
+            grow = max(row + 1 - self.quantities.shape[0], 32)
+            self.quantities = np.vstack([self.quantities, np.zeros((grow, self.quantities.shape[1]),
+                                                                   dtype=np.int64)])
+        return row
+
+    def _add(self, day, dish_number, quantity):
+        row = self._row(day)
+        column = self._column(dish_number)
+        self.quantities[row, column] += quantity
+
+    def build(self):
+        with self._build_lock:
+            with self._lock:
+                self._journal = list()
+            try:
+                rows = self.loader()
+                if rows is None:
+                    raise RuntimeError("daily sales could not be loaded")
+            except Exception:
+                with self._lock:
+                    self._journal = None
+                raise
+            with self._lock:
+                self.first_day = None
+                self.dish_column = dict()
+                self.quantities = np.zeros((0, 0), dtype=np.int64)
+                for day, dish_number, quantity in rows:
+                    self._add(day, dish_number, quantity)
+                for day, dish_number, quantity in self._journal:
+                    self._add(day, dish_number, quantity)
+                self._journal = None
+                self._built = True
+
+    def ensure_built(self):
+        if not self._built:
+            self.build()
+
+    def add_order(self, order_number, client_number):
+        with self._lock:
+            self.order_day[order_number] = self.today()
+
+    def _change(self, day, dish_number, quantity):
+        if self._built:
+            self._add(day, dish_number, quantity)
+        if self._journal is not None:
+            self._journal.append((day, dish_number, quantity))
+
+    def _look_up(self, order_number):
+        """(day opened, lines stored now) of an order opened before the store started"""
+        order = self.order_loader(order_number) if self.order_loader is not None else None
+        if order is None:
+            return None, None
+        return order
+
+    def add_dish(self, order_number, dish_number, quantity):
+        lines = None
+        if order_number not in self.order_day:
+            day, lines = self._look_up(order_number)
+        with self._lock:
+            if order_number not in self.order_day:
+                if lines is None:
+                    self._built = False
+                    return
+                self.order_day[order_number] = day
+                for line_dish, line_quantity in lines.items():
+                    self.order_lines[(order_number, line_dish)] = line_quantity
+            else:
+                key = (order_number, dish_number)
+                self.order_lines[key] = self.order_lines.get(key, 0) + quantity
+            self._change(self.order_day[order_number], dish_number, quantity)
+
+    def remove_dish(self, order_number, dish_number):
+        with self._lock:
+            day = self.order_day.get(order_number)
+            if day is None:
+                self._built = False
+                return
+            quantity = self.order_lines.pop((order_number, dish_number), 0)
+            if quantity:
+                self._change(day, dish_number, -quantity)
+
+    def _prices(self):
+        prices = np.zeros(self.quantities.shape[1])
+        for dish_number, column in self.dish_column.items():
+            price = self.menu.get_price(dish_number)
+            if price is not None:
+                prices[column] = float(price)
+        return prices
+
+    def _range(self, start, end):
+        """Rows of the array between two dates (inclusive), clipped to the stored days"""
+        if self.first_day is None:
+            return 0, 0
+        first = max((start - self.first_day).days, 0)
+        last = min((end - self.first_day).days + 1, self.quantities.shape[0])
+        return first, max(first, last)
+
+    def income(self, start, end, granularity='day', skip_empty=False):
+        """[(period_start, income)] for every day, week (from Monday) or month between start and end"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {GRANULARITIES}")
+        self.ensure_built()
+        days = [start + datetime.timedelta(days=offset) for offset in range(max((end - start).days + 1, 0))]
+        daily = np.zeros(len(days))
+        with self._lock:
+            first, last = self._range(start, end)
+            if last > first:
+                offset = (self.first_day - start).days + first
+                daily[offset:offset + last - first] = self.quantities[first:last] @ self._prices()
+        if granularity == 'day':
+            periods = days
+        elif granularity == 'week':
+            periods = [day - datetime.timedelta(days=day.weekday()) for day in days]
+        else:
+            periods = [day.replace(day=1) for day in days]
+        boundaries = [index for index, period in enumerate(periods) if index == 0 or period != periods[index - 1]]
+        if not boundaries:
+            return list()
+        totals = np.add.reduceat(daily, boundaries)
+        return [(periods[index], total) for index, total in zip(boundaries, totals.tolist())
+                if total or not skip_empty]
+
+    def income_by_type(self, start=None, end=None):
+        """{dish_type: income} over the days between start and end (all days when not given)"""
+        self.ensure_built()
+        with self._lock:
+            first, last = self._range(start or datetime.date.min, end or datetime.date.max)
+            per_dish = self.quantities[first:last].sum(axis=0) * self._prices()
+            columns = dict(self.dish_column)
+        by_type = dict()
+        for dish_number, column in columns.items():
+            dish = self.menu.get_dish(dish_number)
+            if dish is not None and per_dish[column]:
+                by_type[dish['dish_type']] = by_type.get(dish['dish_type'], 0) + float(per_dish[column])
+        return by_type
@@ -1,339 +1,519 @@
-from telegram.ext import (Updater, CommandHandler, ConversationHandler, MessageHandler,
-                          Filters, CallbackContext, CallbackQueryHandler)
-from telegram import KeyboardButton, ReplyKeyboardMarkup, Update, InlineKeyboardButton, InlineKeyboardMarkup
-from data_source import DataSource
-import os
-import logging
-import sys
-import matplotlib.pyplot as plt
-import random
-
-print("Bot started.....")
-MODE = os.getenv("MODE")
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-logger = logging.getLogger()
-
-TOKEN = os.getenv("TOKEN")
-DELIVERY_MEN = ['+972542562628', '+972544969475', '+972505852703']
-dataSource = DataSource(os.environ.get("DATABASE_URL"))
-
-if MODE == "dev":
-    def run():
-        logger.info("Start in DEV mode")
-        updater.start_polling()
-elif MODE == "prod":
-    def run():
-        logger.info("Start in PROD mode")
-        updater.start_webhook(listen="0.0.0.0", port=int(os.environ.get("PORT", "8443")), url_path=TOKEN,
-                              webhook_url="https://{}.herokuapp.com/{}".format(os.environ.get("APP_NAME"), TOKEN))
-else:
-    logger.error("No mode specified!")
-    sys.exit(1)
-
-
-def start_command(update, context):
-    buttons = [[KeyboardButton("Order delivery 🛵")], [KeyboardButton("Something else  🤷‍♂")]]
-    context.bot.send_message(chat_id=update.effective_chat.id, text="Hello customer What would you like to do?",
-                             reply_markup=ReplyKeyboardMarkup(buttons))
-
-
-def something_else_handler(update, context):
-    buttons = [[KeyboardButton("🆕 Undo 🔙")], [KeyboardButton("Call us 📞")]]
-    context.bot.send_message(chat_id=update.effective_chat.id, text="You are welcome to visit the restaurant website"
-                                                                    "\nhttps://thaichin.co.il/",
-                             reply_markup=ReplyKeyboardMarkup(buttons))
-
-
-def call_handler(update, context):
-    buttons = [KeyboardButton("🆕 Undo 🔙")]
-    context.bot.send_message(chat_id=update.effective_chat.id, text="Dial the number: 04-953-3333",
-                             reply_markup=ReplyKeyboardMarkup(buttons))
-
-
-def delivery_handler(update: Update, context: CallbackContext):
-    """Request a phone number from the user"""
-    con_keyboard = [[KeyboardButton(text="Send my phone number 📲", request_contact=True)]]
-    update.message.reply_text("Please share your phone number", reply_markup=ReplyKeyboardMarkup(con_keyboard))
-
-
-def phone_number_handler(update: Update, context: CallbackContext):
-    """Location request for delivery"""
-    contact = update.effective_message.contact
-    if isinstance(contact.last_name, str):
-        context.user_data["NAME"] = contact.first_name + " " + contact.last_name
-    else:
-        context.user_data["NAME"] = contact.first_name
-
-    phone_number = "+" + contact.phone_number
-    if len(phone_number) > 13:
-        phone_number = phone_number[-13:]
-    context.user_data["CLIENT_NUMBER"] = phone_number
-    dataSource.new_client(phone_number, context.user_data["NAME"])
-    loc_keyboard = [[KeyboardButton(text="Send location 📍", request_location=True)]]
-    update.message.reply_text(f"Hey {context.user_data['NAME']} please share your location for delivery"
-                              , reply_markup=ReplyKeyboardMarkup(loc_keyboard))
-
-
-def location_handler(update: Update, context: CallbackContext):
-    global DELIVERY_MEN
-    context.user_data['DELIVERY_MAN'] = random.choice(DELIVERY_MEN)
-    context.user_data["ORDER_NUMBER"] = dataSource.get_last_order() + 1
-    dataSource.new_order(context.user_data["ORDER_NUMBER"], '1',
-                         context.user_data["CLIENT_NUMBER"], context.user_data['DELIVERY_MAN'])
-    context.user_data["DISH_TYPE_KEYBOARD"] = [[KeyboardButton("Your shopping cart is empty 🛒")],
-                                               [KeyboardButton("My recommended dishes🙋"),
-                                                KeyboardButton("The most favorite🔝")],
-                                               [KeyboardButton("🌏 Appetizer🥟"), KeyboardButton("🌏 Soups🍜")],
-                                               [KeyboardButton("🌏 Wok mains🥘"), KeyboardButton("🌏 Pad Thai🫕")],
-                                               [KeyboardButton("🌏 side dish🍟"),
-                                                KeyboardButton("🌏 Crispy Chicken🍗")],
-                                               [KeyboardButton("🌏 Noodles🍝"), KeyboardButton("🌏 Salads🥗")],
-                                               [KeyboardButton("🌏 Special🥢"), KeyboardButton("🌏 Mains from sea🍤")],
-                                               [KeyboardButton("🌏 Sushi🍱"), KeyboardButton("🌏 Sushi Sandwich🍣")]]
-    update.message.reply_text(
-        f"ok, {context.user_data['NAME']} "
-        f"let's choose dishes to order, you are also welcome to browse the menu:\nhttps://thaichin.co.il/menu/#mr-tab-0"
-        , reply_markup=ReplyKeyboardMarkup(context.user_data["DISH_TYPE_KEYBOARD"]))
-
-
-def recommended_handler(update: Update, context: CallbackContext):
-    dishes_keyboard = [[KeyboardButton("🔙 Back")]]
-    if dataSource.is_client_new(context.user_data["CLIENT_NUMBER"]):
-        best_sellers = dataSource.get_favorite_dishes()
-        for dish in best_sellers:
-            dishes_keyboard_sub = [KeyboardButton("🥡 " + dish)]
-            dishes_keyboard.append(dishes_keyboard_sub)
-    else:
-        reco_dishes = dataSource.get_recommendation_dishes(context.user_data["CLIENT_NUMBER"])
-        current_order_dishes = dataSource.get_current_dishes(context.user_data["ORDER_NUMBER"])
-        for dish in reco_dishes:
-            if dish[:-4] not in current_order_dishes:
-                dishes_keyboard_sub = [KeyboardButton("🥡 " + dish)]
-                dishes_keyboard.append(dishes_keyboard_sub)
-    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=ReplyKeyboardMarkup(dishes_keyboard),
-                             text="We hope you like the dishes we have chosen for you ☺️")
-
-
-def favorite_handler(update: Update, context: CallbackContext):
-    dishes_keyboard = [[KeyboardButton("🔙 Back")]]
-    best_sellers = dataSource.get_favorite_dishes()
-    current_order_dishes = dataSource.get_current_dishes(context.user_data["ORDER_NUMBER"])
-    for dish in best_sellers:
-        if dish[:-4] not in current_order_dishes:
-            dishes_keyboard_sub = [KeyboardButton("🥡 " + dish)]
-            dishes_keyboard.append(dishes_keyboard_sub)
-    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=ReplyKeyboardMarkup(dishes_keyboard),
-                             text="Enjoy our best selling dishes ☺️")
-
-
-def dish_type_handler(update: Update, context):
-    dishes = dataSource.get_dishes(update.message.text[2:-1])
-    dishes_keyboard = [[KeyboardButton("🔙 Back")]]
-    for dish in dishes:
-        dishes_keyboard_sub = [KeyboardButton("🥡 " + dish)]
-        dishes_keyboard.append(dishes_keyboard_sub)
-    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=ReplyKeyboardMarkup(dishes_keyboard),
-                             text="Select " + update.message.text[2:-1])
-
-
-def selected_dish_handler(update: Update, context: CallbackContext):
-    context.user_data["SELECTED_DISH_NAME"] = update.message.text[2:-4]
-    photo_name = context.user_data["SELECTED_DISH_NAME"] + ".png"
-    context.bot.sendPhoto(update.message.chat_id, photo=open(photo_name, 'rb'))
-    buttons = [[InlineKeyboardButton("I don't want this dish ⛔", callback_data='I dont want this dish ⛔')],
-               [InlineKeyboardButton("1", callback_data='1'), InlineKeyboardButton("2", callback_data='2'),
-                InlineKeyboardButton("3", callback_data='3')]]
-    replay_markup = InlineKeyboardMarkup(buttons)
-    update.message.reply_text("How many units would you like of this dish?", reply_markup=replay_markup)
-
-
-def quantity_handler(update: Update, context: CallbackContext):
-    if get_chosen_dish(context):
-        return
-    context.user_data["chosen " + context.user_data["SELECTED_DISH_NAME"]] = "true"
-    query = update.callback_query.data
-    update.callback_query.answer()
-    dish_number = dataSource.get_dish_number(context.user_data["SELECTED_DISH_NAME"])
-    update.callback_query.edit_message_reply_markup(None)
-    update.callback_query.answer()
-    if "1" in query or "2" in query or "3" in query:
-        quantity = int(query)
-        dataSource.new_dish_in_order(context.user_data["ORDER_NUMBER"], dish_number, quantity)
-
-
-def get_chosen_dish(context):
-    try:
-        return context.user_data["chosen " + context.user_data["SELECTED_DISH_NAME"]]
-    except KeyError:
-        return None
-
-
-def back_handler(update: Update, context: CallbackContext):
-    context.user_data["SUM"] = dataSource.get_sum_price(context.user_data["ORDER_NUMBER"])
-    if type(context.user_data["SUM"]) == int:
-        context.user_data["DISH_TYPE_KEYBOARD"][0] = [
-            KeyboardButton(f"🛒Shopping cart ({str(context.user_data['SUM'])} ₪)")]
-    update.message.reply_text("take your time 😊",
-                              reply_markup=ReplyKeyboardMarkup(context.user_data["DISH_TYPE_KEYBOARD"]))
-
-
-def shopping_cast_handler(update: Update, context: CallbackContext):
-    reco_dishes = dataSource.get_recommendation_dishes(context.user_data["CLIENT_NUMBER"])
-    dishes_keyboard = [[KeyboardButton("🔙 Back"), KeyboardButton("🛍️ continue ")]]
-    current_order_dishes = dataSource.get_current_dishes(context.user_data["ORDER_NUMBER"])
-    for dish in reco_dishes:
-        if dish[:-4] not in current_order_dishes:
-            dishes_keyboard_sub = [KeyboardButton("🥡 " + dish)]
-            dishes_keyboard.append(dishes_keyboard_sub)
-    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=ReplyKeyboardMarkup(dishes_keyboard),
-                             text="We've found some dishes you'll really love, would you like to add to the order?")
-
-
-def continue_handler(update: Update, context: CallbackContext):
-    keyboard = [[KeyboardButton("🔙 Back"), KeyboardButton("✍️i have a remarks")],
-                [KeyboardButton("💳 Go to payment")],
-                [KeyboardButton("I want to delete one or more dishes from the order🪚")]]
-    name = context.user_data["NAME"]
-    context.user_data["SUM"] = dataSource.get_sum_price(context.user_data["ORDER_NUMBER"])
-    sum_total = context.user_data["SUM"]
-    current_order_dishes = dataSource.get_current_dishes(context.user_data["ORDER_NUMBER"])
-    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=ReplyKeyboardMarkup(keyboard),
-                             text=f"Ok, {name}\nYour order cost {sum_total} ₪ and includes:")
-    for i in range(0, len(current_order_dishes), 2):
-        context.bot.send_message(chat_id=update.effective_chat.id,
-                                 text=f'{str(current_order_dishes[i + 1])}\t{str(current_order_dishes[i])}')
-    remark = dataSource.get_remark(context.user_data["ORDER_NUMBER"])
-    if isinstance(remark, str):
-        context.bot.send_message(chat_id=update.effective_chat.id, text=remark)
-
-
-def remarks_handler(update: Update, context: CallbackContext):
-    button = [[KeyboardButton("🛍️ continue ")]]
-    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=ReplyKeyboardMarkup(button),
-                             text="Write down your remarks, at the end of the message write down that emoji: 📝")
-
-
-def done_command(update: Update, context: CallbackContext):
-    remark = update.message.text
-    dataSource.set_remarks(remark, context.user_data["ORDER_NUMBER"])
-    context.bot.send_message(chat_id=update.effective_chat.id,
-                             reply_markup=ReplyKeyboardMarkup([[KeyboardButton("🛍️ continue ")]]),
-                             text="Your comment has been successfully registered")
-
-
-def delete_dish_handler(update: Update, context: CallbackContext):
-    keyboard = [[KeyboardButton("🔙 Back")]]
-    current_order_dishes = dataSource.get_current_dishes(context.user_data["ORDER_NUMBER"])
-    for i in range(0, len(current_order_dishes), 2):
-        dishes_keyboard_sub = [KeyboardButton("❌delete\t" + current_order_dishes[i])]
-        keyboard.append(dishes_keyboard_sub)
-    context.bot.send_message(chat_id=update.effective_chat.id,
-                             text="Select the dishes you want to remove from the order",
-                             reply_markup=ReplyKeyboardMarkup(keyboard))
-
-
-def deleted_handler(update: Update, context: CallbackContext):
-    current_order_dishes = dataSource.get_current_dishes(context.user_data["ORDER_NUMBER"])
-    dish_to_delete = update.message.text[8:]
-    if dish_to_delete in current_order_dishes:
-        dish_number = dataSource.get_dish_number(dish_to_delete)
-        dataSource.delete_dish_from_order(dish_number, context.user_data["ORDER_NUMBER"])
-        context.bot.send_message(chat_id=update.effective_chat.id,
-                                 text=f"{dish_to_delete} has been removed from your order")
-    else:
-        context.bot.send_message(chat_id=update.effective_chat.id, text=f"{dish_to_delete} is no longer in your order")
-
-
-def payment_handler(update: Update, context: CallbackContext):
-    keyboard = [[KeyboardButton("🔙 Back")], [KeyboardButton("♦ Apple Pay 🍏"), KeyboardButton("♦ Credit Card 💳")],
-                [KeyboardButton("♦ Cash 💷"), KeyboardButton("♦ Bit 🟦")]]
-    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=ReplyKeyboardMarkup(keyboard),
-                             text="How would you like to pay?")
-
-
-def finish_handler(update: Update, context: CallbackContext):
-    keyboard = [[KeyboardButton("🆕 Make new order 🥳")], [KeyboardButton("What is the status of my shipment?")]]
-    delivery_person_name = dataSource.get_delivery_person(context.user_data["ORDER_NUMBER"])[0]
-    delivery_person_number = dataSource.get_delivery_person(context.user_data["ORDER_NUMBER"])[1]
-    context.bot.send_message(chat_id=update.effective_chat.id,
-                             text=f"Excellent!, we have started working on your order and it will be out soon\n"
-                                  f"your delivery man is {delivery_person_name}\n and his phone number is:"
-                                  f" {delivery_person_number}",
-                             reply_markup=ReplyKeyboardMarkup(keyboard))
-
-
-def bos_command(update, context):
-    keyboard = [[KeyboardButton("🆕")],
-                [KeyboardButton("Show Income chart from the last week📊")],
-                [KeyboardButton("Show distribution of income per dishes types📊")],
-                [KeyboardButton("The dishes that brought in the least money this month📉")],
-                [KeyboardButton("The dishes that brought in the most money this month📈")]]
-    context.bot.send_message(chat_id=update.effective_chat.id,
-                             text="Hey Or",
-                             reply_markup=ReplyKeyboardMarkup(keyboard))
-
-
-def weakest_handler(update, context):
-    text = "the weakest dishes this month are:"
-    dishes = dataSource.get_less_seal_dishes()
-    for dish in dishes:
-        text += "\n\n" + dish
-    context.bot.send_message(chat_id=update.effective_chat.id, text=text)
-
-
-def best_handler(update, context):
-    text = "The best selling dishes this month are:"
-    dishes = dataSource.get_best_seal_dishes()
-    for dish in dishes:
-        text += "\n\n" + dish
-    context.bot.send_message(chat_id=update.effective_chat.id, text=text)
-
-
-def income_dish_type_handler(update: Update, context: CallbackContext):
-    dish_type_df = dataSource.get_dish_type_income_df()
-    dish_type_df.plot(x='dish_type', y='income', kind='bar')
-    plt.savefig('dish_type_bar.png')
-    context.bot.send_photo(chat_id=update.effective_chat.id, photo=open('dish_type_bar.png', 'rb'))
-
-
-def weekly_income_handler(update: Update, context: CallbackContext):
-    week_income_df = dataSource.get_last_week_income_df()
-    week_income_df.plot(x='order_time', y='daily_income', kind='bar')
-    plt.savefig('weekly_income_bar.png')
-    context.bot.send_photo(chat_id=update.effective_chat.id, photo=open('weekly_income_bar.png', 'rb'))
-
-
-if __name__ == '__main__':
-    updater = Updater(TOKEN, use_context=True)
-    updater.dispatcher.add_handler(CommandHandler("start", start_command))
-    updater.dispatcher.add_handler(CommandHandler("mypassword", bos_command))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex('Order delivery 🛵'), delivery_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.contact, phone_number_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.location, location_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("🌏"), dish_type_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("🥡"), selected_dish_handler))
-    updater.dispatcher.add_handler(CallbackQueryHandler(quantity_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("🔙 Back"), back_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("🛒Shopping cart"), shopping_cast_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("🛍️ continue"), continue_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("💳 Go to payment"), payment_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("♦"), finish_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("🆕"), start_command))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("My recommended dishes🙋"), recommended_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("The most favorite🔝"), favorite_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("Something else  🤷‍♂"), something_else_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("The dishes that brought in the least money this "
-                                                                "month📉"),
-                                                  weakest_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("The dishes that brought in the most money this"
-                                                                " month📈"), best_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("I want to delete one or more dishes from the "
-                                                                "order🪚"), delete_dish_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("❌delete"), deleted_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("✍️i have a remarks"), remarks_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("📝"), done_command))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("Show Income chart from the last week📊"),
-                                                  weekly_income_handler))
-    updater.dispatcher.add_handler(MessageHandler(Filters.regex("Show distribution of income per dishes types📊"),
-                                                  income_dish_type_handler))
-    run()
+from telegram.ext import (Updater, CommandHandler, ConversationHandler, MessageHandler,
+                          Filters, CallbackContext, CallbackQueryHandler)
+from telegram.ext.dispatcher import DEFAULT_GROUP
+from telegram import KeyboardButton, ReplyKeyboardMarkup, Update, InlineKeyboardButton, InlineKeyboardMarkup
+from data_source import DataSource
+from chat_executor import ChatExecutor
+from charts import ChartService
+from dish_media import DishMediaCache
+from storage_backends import PostgresBackend, SQLiteBackend
+from message_router import MessageRouter
+from sessions import SessionLog, SessionStore
+from analytics_lane import AnalyticsLane
+import functools
+import os
+import logging
+import sys
+import io
+
+print("Bot started.....")
+MODE = os.getenv("MODE")
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+TOKEN = os.getenv("TOKEN")
+ANALYTICS_STATEMENT_TIMEOUT = float(os.environ.get("ANALYTICS_STATEMENT_TIMEOUT", "30"))
+if os.environ.get("STORAGE_BACKEND") == "sqlite":
+    SQLITE_PATH = os.environ.get("SQLITE_PATH", ":memory:")
+    storageBackend = SQLiteBackend(SQLITE_PATH, os.environ.get("SEED_DATA", "data"))
+    # an in-memory database cannot be opened twice, the reports then share the ordering connection
+    analyticsBackend = None if SQLITE_PATH == ":memory:" else SQLiteBackend(SQLITE_PATH, None,
+                                                                            ANALYTICS_STATEMENT_TIMEOUT)
+else:
+    storageBackend = None
+    analyticsBackend = PostgresBackend(os.environ.get("ANALYTICS_DATABASE_URL") or os.environ.get("DATABASE_URL"),
+                                       max_connections=int(os.environ.get("ANALYTICS_POOL_MAX", "2")),
+                                       statement_timeout=ANALYTICS_STATEMENT_TIMEOUT)
+dataSource = DataSource(os.environ.get("DATABASE_URL"), min_connections=int(os.environ.get("DB_POOL_MIN", "1")),
+                        max_connections=int(os.environ.get("DB_POOL_MAX", "10")),
+                        menu_ttl=float(os.environ.get("MENU_TTL", "3600")),
+                        neighbour_block_size=int(os.environ.get("NEIGHBOUR_BLOCK_SIZE", "0")) or None,
+                        recommend_neighbours=int(os.environ.get("RECOMMEND_NEIGHBOURS", "4")),
+                        recommend_mode=os.environ.get("RECOMMEND_MODE", "user"),
+                        recommendations_path=os.environ.get("RECOMMENDATIONS_PATH"),
+                        cart_flush_after=float(os.environ.get("CART_FLUSH_AFTER", "60")),
+                        order_block_size=int(os.environ.get("ORDER_BLOCK_SIZE", "20")),
+                        backend=storageBackend,
+                        query_metrics=os.environ.get("QUERY_METRICS", "1") == "1",
+                        rankings_interval=float(os.environ.get("RANKINGS_REFRESH", "300")),
+                        analytics_backend=analyticsBackend,
+                        delivery_time=float(os.environ.get("DELIVERY_TIME", "2400")))
+# SQLite serves every statement on one in-process connection, so handler workers only add hand-off latency
+HANDLER_WORKERS = int(os.environ.get("HANDLER_WORKERS", "0" if storageBackend is not None else "8"))
+chatExecutor = ChatExecutor(workers=HANDLER_WORKERS,
+                            max_queue=int(os.environ.get("HANDLER_QUEUE_DEPTH", "1000"))) if HANDLER_WORKERS else None
+charts = ChartService(data_ttl=float(os.environ.get("REPORT_TTL", "300")))
+analytics = AnalyticsLane(max_pending=int(os.environ.get("ANALYTICS_QUEUE_DEPTH", "8")))
+dataSource.metrics.gauge("analytics_pending", lambda: analytics.pending)
+dataSource.metrics.gauge("analytics_failed", lambda: analytics.failed)
+dishMedia = DishMediaCache(map_path=os.environ.get("DISH_PHOTOS_MAP", "dish_photos.json"))
+OWNER_CHAT_IDS = {int(chat_id) for chat_id in os.environ.get("OWNER_CHAT_IDS", "").split(",") if chat_id.strip()}
+SESSION_LOG = os.environ.get("SESSION_LOG", "sessions.log")
+if SESSION_LOG == "table":
+    sessionLog = dataSource
+elif SESSION_LOG:
+    sessionLog = SessionLog(SESSION_LOG)
+else:
+    sessionLog = None
+sessions = SessionStore(idle_timeout=float(os.environ.get("SESSION_IDLE_TIMEOUT", "3600")), log=sessionLog,
+                        order_dishes=dataSource.load_order_dishes)
+
+if MODE == "dev":
+    def run():
+        logger.info("Start in DEV mode")
+        updater.start_polling()
+elif MODE == "prod":
+    def run():
+        logger.info("Start in PROD mode")
+        updater.start_webhook(listen="0.0.0.0", port=int(os.environ.get("PORT", "8443")), url_path=TOKEN,
+                              webhook_url="https://{}.herokuapp.com/{}".format(os.environ.get("APP_NAME"), TOKEN))
+else:
+    logger.error("No mode specified!")
+    sys.exit(1)
+
+
+START_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton("Order delivery 🛵")],
+                                     [KeyboardButton("Something else  🤷‍♂")]])
+SOMETHING_ELSE_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton("🆕 Undo 🔙")], [KeyboardButton("Call us 📞")]])
+CALL_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton("🆕 Undo 🔙")]])
+CONTACT_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton(text="Send my phone number 📲", request_contact=True)]])
+LOCATION_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton(text="Send location 📍", request_location=True)]])
+DISH_TYPE_ROWS = [[KeyboardButton("My recommended dishes🙋"), KeyboardButton("The most favorite🔝")],
+                  [KeyboardButton("🌏 Appetizer🥟"), KeyboardButton("🌏 Soups🍜")],
+                  [KeyboardButton("🌏 Wok mains🥘"), KeyboardButton("🌏 Pad Thai🫕")],
+                  [KeyboardButton("🌏 side dish🍟"), KeyboardButton("🌏 Crispy Chicken🍗")],
+                  [KeyboardButton("🌏 Noodles🍝"), KeyboardButton("🌏 Salads🥗")],
+                  [KeyboardButton("🌏 Special🥢"), KeyboardButton("🌏 Mains from sea🍤")],
+                  [KeyboardButton("🌏 Sushi🍱"), KeyboardButton("🌏 Sushi Sandwich🍣")]]
+EMPTY_CART_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton("Your shopping cart is empty 🛒")]] + DISH_TYPE_ROWS)
+CONTINUE_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton("🔙 Back"), KeyboardButton("✍️i have a remarks")],
+                                         [KeyboardButton("💳 Go to payment")],
+                                         [KeyboardButton("I want to delete one or more dishes from the order🪚")]])
+REMARKS_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton("🛍️ continue ")]])
+PAYMENT_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton("🔙 Back")],
+                                        [KeyboardButton("♦ Apple Pay 🍏"), KeyboardButton("♦ Credit Card 💳")],
+                                        [KeyboardButton("♦ Cash 💷"), KeyboardButton("♦ Bit 🟦")]])
+FINISH_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton("🆕 Make new order 🥳")],
+                                       [KeyboardButton("What is the status of my shipment?")]])
+QUANTITY_KEYBOARD = InlineKeyboardMarkup([[InlineKeyboardButton("I don't want this dish ⛔",
+                                                                callback_data='I dont want this dish ⛔')],
+                                          [InlineKeyboardButton("1", callback_data='1'),
+                                           InlineKeyboardButton("2", callback_data='2'),
+                                           InlineKeyboardButton("3", callback_data='3')]])
+BOS_KEYBOARD = ReplyKeyboardMarkup([[KeyboardButton("🆕")],
+                                    [KeyboardButton("Show Income chart from the last week📊")],
+                                    [KeyboardButton("Show distribution of income per dishes types📊")],
+                                    [KeyboardButton("The dishes that brought in the least money this month📉")],
+                                    [KeyboardButton("The dishes that brought in the most money this month📈")]])
+KEYBOARDS = [START_KEYBOARD, SOMETHING_ELSE_KEYBOARD, EMPTY_CART_KEYBOARD, CONTINUE_KEYBOARD, REMARKS_KEYBOARD,
+             PAYMENT_KEYBOARD, FINISH_KEYBOARD, BOS_KEYBOARD]
+
+
+@functools.lru_cache(maxsize=512)
+def dish_type_keyboard(total):
+    """The category keyboard with the cart total on its first button, shared by every chat with that total"""
+    if type(total) != int:
+        return EMPTY_CART_KEYBOARD
+    return ReplyKeyboardMarkup([[KeyboardButton(f"🛒Shopping cart ({str(total)} ₪)")]] + DISH_TYPE_ROWS)
+
+
+def keyboard_labels(keyboards):
+    return [button.text for keyboard in keyboards for row in keyboard.keyboard for button in row]
+
+
+def requires_order(handler):
+    """Handlers of an open order: a chat whose session expired is sent back to the start"""
+    @functools.wraps(handler)
+    def check_session(update, context):
+        session = sessions.get(update.effective_chat.id)
+        if session.order_number is None:
+            context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=START_KEYBOARD,
+                                     text="Your order has expired, what would you like to do?")
+            return
+        return handler(update, context, session)
+    return check_session
+
+
+def owner_only(handler):
+    """Owner commands: chats not listed in OWNER_CHAT_IDS are ignored"""
+    @functools.wraps(handler)
+    def check_owner(update, context):
+        if update.effective_chat.id not in OWNER_CHAT_IDS:
+            logger.warning(f"{handler.__name__} refused to chat {update.effective_chat.id}")
+            return
+        return handler(update, context)
+    return check_owner
+
+
+def start_command(update, context):
+    context.bot.send_message(chat_id=update.effective_chat.id, text="Hello customer What would you like to do?",
+                             reply_markup=START_KEYBOARD)
+
+
+def something_else_handler(update, context):
+    context.bot.send_message(chat_id=update.effective_chat.id, text="You are welcome to visit the restaurant website"
+                                                                    "\nhttps://thaichin.co.il/",
+                             reply_markup=SOMETHING_ELSE_KEYBOARD)
+
+
+def call_handler(update, context):
+    context.bot.send_message(chat_id=update.effective_chat.id, text="Dial the number: 04-953-3333",
+                             reply_markup=CALL_KEYBOARD)
+
+
+def delivery_handler(update: Update, context: CallbackContext):
+    """Request a phone number from the user"""
+    update.message.reply_text("Please share your phone number", reply_markup=CONTACT_KEYBOARD)
+
+
+def phone_number_handler(update: Update, context: CallbackContext):
+    """Location request for delivery"""
+    session = sessions.get(update.effective_chat.id)
+    contact = update.effective_message.contact
+    if isinstance(contact.last_name, str):
+        session.name = contact.first_name + " " + contact.last_name
+    else:
+        session.name = contact.first_name
+
+    phone_number = "+" + contact.phone_number
+    if len(phone_number) > 13:
+        phone_number = phone_number[-13:]
+    session.client_number = phone_number
+    dataSource.new_client(phone_number, session.name)
+    update.message.reply_text(f"Hey {session.name} please share your location for delivery"
+                              , reply_markup=LOCATION_KEYBOARD)
+
+
+def location_handler(update: Update, context: CallbackContext):
+    session = sessions.get(update.effective_chat.id)
+    if session.client_number is None:
+        update.message.reply_text("Please share your phone number first", reply_markup=CONTACT_KEYBOARD)
+        return
+    order_number = dataSource.new_order_number()
+    if order_number is not None:
+        delivery_man = dataSource.dispatcher.assign(order_number)
+        if not dataSource.new_order(order_number, '1', session.client_number, delivery_man):
+            dataSource.dispatcher.release(order_number)
+            order_number = None
+    if order_number is None:
+        update.message.reply_text("Sorry, we couldn't open your order, please send your location again")
+        return
+    session.open_order(order_number)
+    update.message.reply_text(
+        f"ok, {session.name} "
+        f"let's choose dishes to order, you are also welcome to browse the menu:\nhttps://thaichin.co.il/menu/#mr-tab-0"
+        , reply_markup=EMPTY_CART_KEYBOARD)
+
+
+@requires_order
+def recommended_handler(update: Update, context: CallbackContext, session):
+    dishes_keyboard = [[KeyboardButton("🔙 Back")]]
+    if dataSource.is_client_new(session.client_number):
+        best_sellers = dataSource.get_favorite_dishes()
+        for dish in best_sellers:
+            dishes_keyboard_sub = [KeyboardButton("🥡 " + dish)]
+            dishes_keyboard.append(dishes_keyboard_sub)
+    else:
+        reco_dishes = dataSource.get_recommendation_dishes(session.client_number, session.order_number)
+        for dish in reco_dishes:
+            dishes_keyboard_sub = [KeyboardButton("🥡 " + dish)]
+            dishes_keyboard.append(dishes_keyboard_sub)
+    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=ReplyKeyboardMarkup(dishes_keyboard),
+                             text="We hope you like the dishes we have chosen for you ☺️")
+
+
+@requires_order
+def favorite_handler(update: Update, context: CallbackContext, session):
+    dishes_keyboard = [[KeyboardButton("🔙 Back")]]
+    best_sellers = dataSource.get_favorite_dishes()
+    current_order_dishes = dataSource.get_current_dishes(session.order_number)
+    for dish in best_sellers:
+        if dish[:-4] not in current_order_dishes:
+            dishes_keyboard_sub = [KeyboardButton("🥡 " + dish)]
+            dishes_keyboard.append(dishes_keyboard_sub)
+    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=ReplyKeyboardMarkup(dishes_keyboard),
+                             text="Enjoy our best selling dishes ☺️")
+
+
+def dish_type_handler(update: Update, context):
+    dishes = dataSource.get_dishes(update.message.text[2:-1])
+    dishes_keyboard = [[KeyboardButton("🔙 Back")]]
+    for dish in dishes:
+        dishes_keyboard_sub = [KeyboardButton("🥡 " + dish)]
+        dishes_keyboard.append(dishes_keyboard_sub)
+    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=ReplyKeyboardMarkup(dishes_keyboard),
+                             text="Select " + update.message.text[2:-1])
+
+
+@requires_order
+def selected_dish_handler(update: Update, context: CallbackContext, session):
+    dish_name = update.message.text[2:-4]
+    session.selected_dish = dataSource.get_dish_number(dish_name)
+    if session.selected_dish is None:
+        update.message.reply_text("Sorry, dish not found, please choose a dish from the menu")
+        return
+    dishMedia.send_photo(context.bot, update.message.chat_id, dish_name)
+    update.message.reply_text("How many units would you like of this dish?", reply_markup=QUANTITY_KEYBOARD)
+
+
+@requires_order
+def quantity_handler(update: Update, context: CallbackContext, session):
+    if session.selected_dish is None or not session.choose(session.selected_dish):
+        return
+    query = update.callback_query.data
+    update.callback_query.answer()
+    update.callback_query.edit_message_reply_markup(None)
+    update.callback_query.answer()
+    if "1" in query or "2" in query or "3" in query:
+        quantity = int(query)
+        dataSource.cart.add(session.order_number, session.selected_dish, quantity)
+        session.add_line(session.selected_dish)
+
+
+@requires_order
+def back_handler(update: Update, context: CallbackContext, session):
+    total = dataSource.get_order_summary(session.order_number).total
+    update.message.reply_text("take your time 😊", reply_markup=dish_type_keyboard(total))
+
+
+@requires_order
+def shopping_cast_handler(update: Update, context: CallbackContext, session):
+    reco_dishes = dataSource.get_recommendation_dishes(session.client_number, session.order_number)
+    dishes_keyboard = [[KeyboardButton("🔙 Back"), KeyboardButton("🛍️ continue ")]]
+    for dish in reco_dishes:
+        dishes_keyboard_sub = [KeyboardButton("🥡 " + dish)]
+        dishes_keyboard.append(dishes_keyboard_sub)
+    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=ReplyKeyboardMarkup(dishes_keyboard),
+                             text="We've found some dishes you'll really love, would you like to add to the order?")
+
+
+@requires_order
+def continue_handler(update: Update, context: CallbackContext, session):
+    name = session.name
+    dataSource.cart.flush(session.order_number)
+    summary = dataSource.get_order_summary(session.order_number)
+    sum_total = summary.total
+    current_order_dishes = summary.dishes
+    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=CONTINUE_KEYBOARD,
+                             text=f"Ok, {name}\nYour order cost {sum_total} ₪ and includes:")
+    for i in range(0, len(current_order_dishes), 2):
+        context.bot.send_message(chat_id=update.effective_chat.id,
+                                 text=f'{str(current_order_dishes[i + 1])}\t{str(current_order_dishes[i])}')
+    remark = summary.remark
+    if isinstance(remark, str):
+        context.bot.send_message(chat_id=update.effective_chat.id, text=remark)
+
+
+def remarks_handler(update: Update, context: CallbackContext):
+    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=REMARKS_KEYBOARD,
+                             text="Write down your remarks, at the end of the message write down that emoji: 📝")
+
+
+@requires_order
+def done_command(update: Update, context: CallbackContext, session):
+    remark = update.message.text
+    dataSource.set_remarks(remark, session.order_number)
+    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=REMARKS_KEYBOARD,
+                             text="Your comment has been successfully registered")
+
+
+@requires_order
+def delete_dish_handler(update: Update, context: CallbackContext, session):
+    keyboard = [[KeyboardButton("🔙 Back")]]
+    current_order_dishes = dataSource.get_current_dishes(session.order_number)
+    for i in range(0, len(current_order_dishes), 2):
+        dishes_keyboard_sub = [KeyboardButton("❌delete\t" + current_order_dishes[i])]
+        keyboard.append(dishes_keyboard_sub)
+    context.bot.send_message(chat_id=update.effective_chat.id,
+                             text="Select the dishes you want to remove from the order",
+                             reply_markup=ReplyKeyboardMarkup(keyboard))
+
+
+@requires_order
+def deleted_handler(update: Update, context: CallbackContext, session):
+    current_order_dishes = dataSource.get_current_dishes(session.order_number)
+    dish_to_delete = update.message.text[8:]
+    if dish_to_delete in current_order_dishes:
+        dish_number = dataSource.get_dish_number(dish_to_delete)
+        if dish_number is None:
+            context.bot.send_message(chat_id=update.effective_chat.id, text=f"{dish_to_delete}: dish not found")
+            return
+        dataSource.cart.remove(session.order_number, dish_number)
+        session.remove_line(dish_number)
+        context.bot.send_message(chat_id=update.effective_chat.id,
+                                 text=f"{dish_to_delete} has been removed from your order")
+    else:
+        context.bot.send_message(chat_id=update.effective_chat.id, text=f"{dish_to_delete} is no longer in your order")
+
+
+@requires_order
+def payment_handler(update: Update, context: CallbackContext, session):
+    dataSource.cart.flush(session.order_number)
+    context.bot.send_message(chat_id=update.effective_chat.id, reply_markup=PAYMENT_KEYBOARD,
+                             text="How would you like to pay?")
+
+
+@requires_order
+def finish_handler(update: Update, context: CallbackContext, session):
+    dataSource.cart.flush(session.order_number)
+    dataSource.dispatcher.dispatched(session.order_number)
+    courier = dataSource.get_order_summary(session.order_number).courier
+    text = "Excellent!, we have started working on your order and it will be out soon"
+    if courier:
+        delivery_person_name, delivery_person_number = courier
+        text += f"\nyour delivery man is {delivery_person_name}\n and his phone number is: {delivery_person_number}"
+    context.bot.send_message(chat_id=update.effective_chat.id, text=text, reply_markup=FINISH_KEYBOARD)
+
+
+def bos_command(update, context):
+    context.bot.send_message(chat_id=update.effective_chat.id,
+                             text="Hey Or",
+                             reply_markup=BOS_KEYBOARD)
+
+
+def weakest_handler(update, context):
+    text = "the weakest dishes this month are:"
+    dishes = dataSource.get_less_seal_dishes()
+    for dish in dishes:
+        text += "\n\n" + dish
+    context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+
+def best_handler(update, context):
+    text = "The best selling dishes this month are:"
+    dishes = dataSource.get_best_seal_dishes()
+    for dish in dishes:
+        text += "\n\n" + dish
+    context.bot.send_message(chat_id=update.effective_chat.id, text=text)
+
+
+def income_dish_type_handler(update: Update, context: CallbackContext):
+    chart = charts.report("dish_type_income", dataSource.get_dish_type_income_df, 'dish_type', 'income',
+                          dataSource.data_version)
+    context.bot.send_photo(chat_id=update.effective_chat.id, photo=io.BytesIO(chart))
+
+
+def weekly_income_handler(update: Update, context: CallbackContext):
+    chart = charts.report("weekly_income", dataSource.get_last_week_income_df, 'order_time', 'daily_income',
+                          dataSource.data_version)
+    context.bot.send_photo(chat_id=update.effective_chat.id, photo=io.BytesIO(chart))
+
+
+@owner_only
+def metrics_command(update: Update, context: CallbackContext):
+    """/metrics [json|reset]: the query, connection and handler timings since the start (or last reset)"""
+    args = update.message.text.split()[1:]
+    if "reset" in args:
+        dataSource.metrics.reset()
+        context.bot.send_message(chat_id=update.effective_chat.id, text="Metrics were reset")
+    elif "json" in args:
+        context.bot.send_document(chat_id=update.effective_chat.id, filename="metrics.json",
+                                  document=io.BytesIO(dataSource.metrics.to_json().encode()))
+    else:
+        context.bot.send_message(chat_id=update.effective_chat.id, text=dataSource.metrics.to_text()[:4096])
+
+
+@owner_only
+def profile_command(update: Update, context: CallbackContext):
+    """/profile starts sampling the running handlers, the next /profile stops and sends the hottest code"""
+    profiler = dataSource.metrics.stop_profiler()
+    if profiler is None:
+        dataSource.metrics.start_profiler(float(os.environ.get("PROFILE_INTERVAL", "0.005")))
+        context.bot.send_message(chat_id=update.effective_chat.id, text="Profiling handlers, send /profile to stop")
+    else:
+        context.bot.send_message(chat_id=update.effective_chat.id, text=profiler.report())
+
+
+@owner_only
+def refresh_command(update: Update, context: CallbackContext):
+    """/refresh recomputes the favourites and best/worst sellers now instead of at the next scheduled run"""
+    duration = dataSource.rankings.refresh()
+    context.bot.send_message(chat_id=update.effective_chat.id, text=f"Rankings refreshed in {duration:.2f}s")
+
+
+REPORT_HANDLERS = {weakest_handler, best_handler, income_dish_type_handler, weekly_income_handler, refresh_command}
+
+
+def build_router():
+    """The text message routes, highest priority first"""
+    router = MessageRouter()
+    router.add("Order delivery 🛵", delivery_handler, kind='exact')
+    router.add("🌏", dish_type_handler)
+    router.add("🥡", selected_dish_handler)
+    router.add("🔙 Back", back_handler, kind='exact')
+    router.add("🛒Shopping cart", shopping_cast_handler)
+    router.add("🛍️ continue", continue_handler)
+    router.add("💳 Go to payment", payment_handler, kind='exact')
+    router.add("♦", finish_handler)
+    router.add("🆕", start_command)
+    router.add("My recommended dishes🙋", recommended_handler, kind='exact')
+    router.add("The most favorite🔝", favorite_handler, kind='exact')
+    router.add("Something else  🤷‍♂", something_else_handler, kind='exact')
+    router.add("The dishes that brought in the least money this month📉", weakest_handler, kind='exact')
+    router.add("The dishes that brought in the most money this month📈", best_handler, kind='exact')
+    router.add("I want to delete one or more dishes from the order🪚", delete_dish_handler, kind='exact')
+    router.add("❌delete", deleted_handler)
+    router.add("✍️i have a remarks", remarks_handler, kind='exact')
+    router.add("📝", done_command, kind='contains')
+    router.add("Show Income chart from the last week📊", weekly_income_handler, kind='exact')
+    router.add("Show distribution of income per dishes types📊", income_dish_type_handler, kind='exact')
+    return router
+
+
+def shutdown():
+    """Let the running handlers finish, then write the buffered carts and the sessions"""
+    if chatExecutor is not None:
+        chatExecutor.shutdown()
+    analytics.shutdown()
+    dataSource.cart.flush_all()
+    sessions.flush()
+    dataSource.close()
+
+
+if __name__ == '__main__':
+    dataSource.menu.refresh()
+    dataSource.dispatcher.refresh()
+    updater = Updater(TOKEN, use_context=True)
+    updater.job_queue.run_repeating(dataSource.rankings.job, interval=dataSource.rankings.interval, first=0)
+    sessions.restore()
+    updater.job_queue.run_repeating(dataSource.dispatcher.job, interval=60)
+    if dataSource.cart.flush_after:
+        updater.job_queue.run_repeating(dataSource.cart.job, interval=max(dataSource.cart.flush_after / 4, 1))
+    updater.job_queue.run_repeating(sessions.job, interval=max(sessions.idle_timeout / 4, 60))
+    updater.job_queue.run_repeating(sessions.flush_job, interval=float(os.environ.get("SESSION_FLUSH", "1")))
+    dishMedia.prewarm(dataSource.menu.number_by_name, updater.bot, os.environ.get("DISH_PHOTOS_CHAT_ID"))
+    updater.dispatcher.add_handler(CommandHandler("start", start_command))
+    updater.dispatcher.add_handler(CommandHandler("mypassword", bos_command))
+    updater.dispatcher.add_handler(CommandHandler("metrics", metrics_command))
+    updater.dispatcher.add_handler(CommandHandler("profile", profile_command))
+    updater.dispatcher.add_handler(CommandHandler("refresh", refresh_command))
+    updater.dispatcher.add_handler(MessageHandler(Filters.contact, phone_number_handler))
+    updater.dispatcher.add_handler(MessageHandler(Filters.location, location_handler))
+    updater.dispatcher.add_handler(CallbackQueryHandler(quantity_handler))
+    router = build_router()
+    for conflict in router.conflicts(keyboard_labels(KEYBOARDS)):
+        logger.warning(f"message route conflict: {conflict}")
+    router.wrap(dataSource.metrics.handler)
+    router.wrap(analytics.handler, only=REPORT_HANDLERS)
+    updater.dispatcher.add_handler(MessageHandler(Filters.text, router.dispatch))
+    for handler in updater.dispatcher.handlers[DEFAULT_GROUP]:
+        if handler.callback in REPORT_HANDLERS:
+            handler.callback = analytics.handler(dataSource.metrics.handler(handler.callback))
+        elif handler.callback != router.dispatch:
+            handler.callback = dataSource.metrics.handler(handler.callback)
+        handler.callback = sessions.persisted(handler.callback)
+        if chatExecutor is not None:
+            handler.callback = chatExecutor.handler(handler.callback)
+    run()
+    updater.idle()
+    shutdown()
@@ -0,0 +1,97 @@
+import logging
+import re
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger()
+
+
+def like_to_regex(pattern):
+    """Translate a SQL LIKE pattern ('%' and '_' wildcards) to a compiled regex"""
+    parts = [".*" if char == "%" else "." if char == "_" else re.escape(char) for char in pattern]
+    return re.compile("".join(parts) + r"\Z", re.DOTALL)
+
+
+class MenuCatalog:
+    """In memory copy of the dish table, indexed by type, name and number.
+
+    `loader` returns (columns, rows) for the whole dish table. The catalog is reloaded lazily
+    once `ttl` seconds have passed or after `invalidate()`.
+    """
+
+    def __init__(self, loader, ttl=3600.0):
+        self.loader = loader
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._loaded_at = None
+        self.columns = list()
+        self.by_type = dict()
+        self.number_by_name = dict()
+        self.by_number = dict()
+        self._feature_matrix = None
+
+    def refresh(self):
+        columns, rows = self.loader()
+        if not rows:
+            logger.error("menu catalog refresh returned no dishes, keeping the previous menu")
+            return
+        by_type = dict()
+        number_by_name = dict()
+        by_number = dict()
+        for row in rows:
+            dish = dict(zip(columns, row))
+            by_type.setdefault(dish['dish_type'], list()).append(dish)
+            number_by_name[dish['dish_name']] = dish['dish_number']
+            by_number[dish['dish_number']] = dish
+        with self._lock:
+            self.columns = list(columns)
+            self.by_type = by_type
+            self.number_by_name = number_by_name
+            self.by_number = by_number
+            self._feature_matrix = None
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+
+    def is_stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _ensure_fresh(self):
+        if self.is_stale():
+            self.refresh()
+
+    def get_dishes(self, dish_type):
+        """Dishes whose dish_type matches the LIKE pattern, in menu order"""
+        self._ensure_fresh()
+        if "%" not in dish_type and "_" not in dish_type:
+            return list(self.by_type.get(dish_type, list()))
+        regex = like_to_regex(dish_type)
+        return [dish for key, dishes in self.by_type.items() if regex.match(key) for dish in dishes]
+
+    def get_dish_number(self, dish_name):
+        self._ensure_fresh()
+        return self.number_by_name.get(dish_name)
+
+    def get_dish(self, dish_number):
+        self._ensure_fresh()
+        return self.by_number.get(dish_number)
+
+    def get_price(self, dish_number):
+        dish = self.get_dish(dish_number)
+        return None if dish is None else dish['price']
+
+    def feature_matrix(self, features):
+        """(dish_numbers, prices, flags) for the whole menu, flags being a dish x feature uint8 matrix"""
+        self._ensure_fresh()
+        with self._lock:
+            if self._feature_matrix is None or self._feature_matrix[0] != features:
+                dishes = list(self.by_number.values())
+                dish_numbers = [dish['dish_number'] for dish in dishes]
+                prices = np.array([float(dish['price']) for dish in dishes])
+                flags = np.array([[int(dish[feature]) for feature in features] for dish in dishes],
+                                 dtype=np.uint8).reshape(len(dishes), len(features))
+                self._feature_matrix = (list(features), (dish_numbers, prices, flags))
+            return self._feature_matrix[1]
@@ -0,0 +1,124 @@
+import logging
+
+logger = logging.getLogger()
+
+MATCH_KINDS = ('exact', 'prefix', 'suffix', 'contains')
+
+
+class Route:
+    def __init__(self, key, callback, kind, priority):
+        self.key = key
+        self.callback = callback
+        self.target = callback
+        self.kind = kind
+        self.priority = priority
+
+    def __repr__(self):
+        return f"{self.kind} {self.key!r} -> {self.callback.__name__}"
+
+
+class MessageRouter:
+    """Dispatches a text message to its handler by button label instead of trying regexes in turn.
+
+    Routes are exact labels, label prefixes (the emoji a group of buttons starts with, or a label
+    followed by a changing part such as the cart total), suffixes or substrings (the 📝 anywhere in a
+    remark, as its regex filter matched). They are kept in one dict per kind keyed by the label; a text
+    is looked up as a whole and by its prefixes and suffixes of the few registered lengths, and only
+    the handful of substring keys is scanned, so the cost does not grow with the number of routes.
+    When several routes match, the one added first wins, like the order of the old handler chain.
+    """
+
+    def __init__(self):
+        self.tables = {kind: dict() for kind in MATCH_KINDS}
+        self.lengths = {kind: list() for kind in MATCH_KINDS}
+        self.routes = list()
+
+    def add(self, key, callback, kind='prefix'):
+        if kind not in MATCH_KINDS:
+            raise ValueError(f"kind must be one of {MATCH_KINDS}")
+        route = Route(key, callback, kind, len(self.routes))
+        self.routes.append(route)
+        table = self.tables[kind]
+        if key in table:
+            return route
+        table[key] = route
+        if len(key) not in self.lengths[kind]:
+            self.lengths[kind] = sorted(self.lengths[kind] + [len(key)])
+        return route
+
+    def wrap(self, decorator, only=None):
+        """Apply `decorator` to the callback of every route (e.g. QueryMetrics.handler), or only to the
+        routes added with a callback in `only`"""
+        for route in self.routes:
+            if only is None or route.target in only:
+                route.callback = decorator(route.callback)
+
+    def candidates(self, text):
+        found = list()
+        route = self.tables['exact'].get(text)
+        if route is not None:
+            found.append(route)
+        prefixes = self.tables['prefix']
+        for length in self.lengths['prefix']:
+            if length > len(text):
+                break
+            route = prefixes.get(text[:length])
+            if route is not None:
+                found.append(route)
+        suffixes = self.tables['suffix']
+        stripped = text.rstrip()
+        for length in self.lengths['suffix']:
+            if length > len(stripped):
+                break
+            route = suffixes.get(stripped[-length:])
+            if route is not None:
+                found.append(route)
+        found.extend(route for key, route in self.tables['contains'].items() if key in text)
+        return found
+
+    def resolve(self, text):
+        """The route of a message text, or None"""
+        if not text:
+            return None
+        best = self.tables['exact'].get(text)
+        prefixes = self.tables['prefix']
+        for length in self.lengths['prefix']:
+            route = prefixes.get(text[:length])
+            if route is not None and (best is None or route.priority < best.priority):
+                best = route
+        if self.lengths['suffix']:
+            stripped = text.rstrip()
+            suffixes = self.tables['suffix']
+            for length in self.lengths['suffix']:
+                route = suffixes.get(stripped[-length:])
+                if route is not None and (best is None or route.priority < best.priority):
+                    best = route
+        for key, route in self.tables['contains'].items():
+            if key in text and (best is None or route.priority < best.priority):
+                best = route
+        return best
+
+    def dispatch(self, update, context):
+        """MessageHandler callback"""
+        route = self.resolve(update.message.text)
+        if route is not None:
+            return route.callback(update, context)
+
+    def conflicts(self, labels=()):
+        """Routes that can never win and labels matched by more than one route, as readable lines"""
+        lines = list()
+        for route in self.routes:
+            if self.tables[route.kind].get(route.key) is not route:
+                lines.append(f"{route} is unreachable: same key as {self.tables[route.kind][route.key]}")
+                continue
+            winner = self.resolve(route.key)
+            if winner is not route and winner is not None and route.kind != 'suffix':
+                lines.append(f"{route} is taken by {winner} for its own label")
+        for label in labels:
+            found = self.candidates(label)
+            if len(found) > 1:
+                winner = min(found, key=lambda route: route.priority)
+                lines.append(f"{label!r} matches {', '.join(map(repr, found))}; {winner} wins")
+            elif not found:
+                lines.append(f"{label!r} matches no route")
+        return lines
@@ -0,0 +1,55 @@
+import numpy as np
+
+
+class NeighbourIndex:
+    """Cosine top-k neighbour search over the rows of a matrix without building the NxN similarity.
+
+    Rows are normalized to unit length once, so a query is one matrix-vector product followed by an
+    argpartition. With `block_size` set the product is computed block by block and only the running
+    top-k is kept, which bounds the temporary memory for large client counts.
+    """
+
+    def __init__(self, ids, matrix, block_size=None):
+        self.ids = list(ids)
+        self.row_of = {item: row for row, item in enumerate(self.ids)}
+        matrix = np.asarray(matrix, dtype=np.float64)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self.unit = matrix / norms
+        self.block_size = block_size
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def _top(rows, scores, k):
+        if len(scores) > k:
+            keep = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[keep], scores[keep]
+        order = np.lexsort((rows, -scores))
+        return rows[order], scores[order]
+
+    def search(self, vector, k, exclude_row=None):
+        """(rows, scores) of the k rows most similar to `vector`, best first"""
+        norm = np.linalg.norm(vector)
+        query = np.asarray(vector, dtype=np.float64) / (norm if norm else 1)
+        block_size = self.block_size or len(self.ids) or 1
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_scores = np.zeros(0)
+        for start in range(0, len(self.ids), block_size):
+            scores = self.unit[start:start + block_size] @ query
+            rows = np.arange(start, start + len(scores))
+            if exclude_row is not None and start <= exclude_row < start + len(scores):
+                keep = rows != exclude_row
+                rows, scores = rows[keep], scores[keep]
+            best_rows, best_scores = self._top(np.concatenate([best_rows, rows]),
+                                               np.concatenate([best_scores, scores]), k)
+        return best_rows, best_scores
+
+    def neighbours(self, item, k):
+        """(ids, scores) of the k nearest neighbours of an indexed item, excluding the item itself"""
+        row = self.row_of.get(item)
+        if row is None or k <= 0:
+            return list(), list()
+        rows, scores = self.search(self.unit[row], k, exclude_row=row)
+        return [self.ids[i] for i in rows], scores.tolist()
@@ -0,0 +1,25 @@
+import logging
+import threading
+from collections import deque
+
+logger = logging.getLogger()
+
+
+class OrderNumberAllocator:
+    """Hands out order numbers from blocks reserved in one round trip.
+
+    `reserve(count)` returns `count` unused order numbers (DataSource.reserve_order_numbers takes them
+    from a database sequence, so several bot processes never hand out the same number).
+    """
+
+    def __init__(self, reserve, block_size=20):
+        self.reserve = reserve
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._numbers = deque()
+
+    def next_number(self):
+        with self._lock:
+            if not self._numbers:
+                self._numbers.extend(self.reserve(self.block_size))
+            return self._numbers.popleft()
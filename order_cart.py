@@ -0,0 +1,101 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+class PendingOrder:
+    def __init__(self, due):
+        self.added = list()
+        self.deleted = set()
+        self.due = due
+
+
+class OrderCart:
+    """Write-behind buffer of the dish_in_order changes of open orders.
+
+    Adds and deletes are kept per order number and written by `flush` in one transaction, which runs
+    when the customer continues to the summary or payment, or from `job` once `flush_after` seconds
+    passed since the first buffered change. `merge_lines` applies the buffered changes to the lines
+    read from the database. `writer(order_number, deleted, added)` writes the changes and returns True
+    once committed. Flushes of an order are serialised with the readers that hold `settled`, so a
+    summary never reads between the moment changes leave the buffer and their commit.
+    """
+
+    def __init__(self, writer, flush_after=60.0, clock=time.monotonic, stripes=64):
+        self.writer = writer
+        self.flush_after = flush_after
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._order_locks = [threading.RLock() for _ in range(stripes)]
+        self.pending = dict()
+
+    def _pending(self, order_number):
+        order = self.pending.get(order_number)
+        if order is None:
+            order = self.pending[order_number] = PendingOrder(self.clock() + (self.flush_after or 0))
+        return order
+
+    def settled(self, order_number):
+        """Lock to hold while the lines of the order are read and merged; flushes of the order wait on it"""
+        return self._order_locks[hash(order_number) % len(self._order_locks)]
+
+    def add(self, order_number, dish_number, quantity):
+        with self._lock:
+            self._pending(order_number).added.append((dish_number, quantity))
+
+    def remove(self, order_number, dish_number):
+        with self._lock:
+            order = self._pending(order_number)
+            order.added = [line for line in order.added if line[0] != dish_number]
+            order.deleted.add(dish_number)
+
+    def has_pending(self, order_number):
+        return order_number in self.pending
+
+    def flush(self, order_number):
+        with self.settled(order_number):
+            with self._lock:
+                order = self.pending.pop(order_number, None)
+            if order is None:
+                return True
+            if self.writer(order_number, sorted(order.deleted), order.added):
+                return True
+            with self._lock:
+                merged = self._pending(order_number)
+                merged.added = [line for line in order.added if line[0] not in merged.deleted] + merged.added
+                merged.deleted |= order.deleted
+                merged.due = min(merged.due, order.due)
+            return False
+
+    def flush_due(self):
+        """Flush the orders whose first buffered change is `flush_after` seconds old"""
+        if not self.flush_after:
+            return 0
+        now = self.clock()
+        with self._lock:
+            due = [order_number for order_number, order in self.pending.items() if order.due <= now]
+        for order_number in due:
+            self.flush(order_number)
+        return len(due)
+
+    def flush_all(self):
+        failed = 0
+        for order_number in list(self.pending):
+            failed += not self.flush(order_number)
+        if failed:
+            logger.error(f"{failed} orders kept unflushed cart changes")
+        return failed == 0
+
+    def job(self, context=None):
+        """Job queue callback"""
+        self.flush_due()
+
+    def merge_lines(self, order_number, lines):
+        """(dish_number, quantity) lines read from the database with the buffered changes applied"""
+        with self._lock:
+            order = self.pending.get(order_number)
+            if order is None:
+                return list(lines)
+            return [line for line in lines if line[0] not in order.deleted] + list(order.added)
@@ -0,0 +1,342 @@
+import bisect
+import functools
+import json
+import logging
+import sys
+import threading
+import time
+from collections import Counter
+
+logger = logging.getLogger()
+
+BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram:
+    """Count, sum, max and fixed log scale buckets of millisecond samples"""
+
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(BUCKETS_MS) + 1)
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.buckets[bisect.bisect_left(BUCKETS_MS, value)] += 1
+
+    def percentile(self, pct):
+        """Upper bound of the bucket holding the pct-th sample"""
+        if not self.count:
+            return 0.0
+        rank = pct / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min(BUCKETS_MS[index], self.max) if index < len(BUCKETS_MS) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {"count": self.count, "mean_ms": self.total / self.count if self.count else 0.0,
+                "p50_ms": self.percentile(50), "p95_ms": self.percentile(95), "p99_ms": self.percentile(99),
+                "max_ms": self.max, "buckets": dict(zip([str(bound) for bound in BUCKETS_MS] + ["inf"], self.buckets))}
+
+
+class QueryStats:
+    __slots__ = ('latency', 'rows', 'errors')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.rows = 0
+        self.errors = 0
+
+
+class QueryMetrics:
+    """In-process timers for DataSource queries, connection checkouts and bot handlers.
+
+    Queries are named after their constant in data_source (`query_names` maps the SQL text sent to
+    the backend to that name). Each name keeps a latency histogram (execute and fetch), the rows
+    fetched and the errors raised. When `enabled` is False nothing is wrapped or recorded.
+    """
+
+    def __init__(self, enabled=True, query_names=None):
+        self.enabled = enabled
+        self.query_names = query_names or dict()
+        self.started = time.time()
+        self._lock = threading.Lock()
+        self.queries = dict()
+        self.handlers = dict()
+        self.acquire = Histogram()
+        self.acquire_errors = 0
+        self.errors = Counter()
+        self.gauges = dict()
+        self.profiler = None
+        self._handler_threads = set()
+
+    def reset(self):
+        with self._lock:
+            self.started = time.time()
+            self.queries = dict()
+            self.handlers = dict()
+            self.acquire = Histogram()
+            self.acquire_errors = 0
+            self.errors = Counter()
+
+    def gauge(self, name, read):
+        """Report `read()` under `name` in every dump (a current value rather than a histogram)"""
+        self.gauges[name] = read
+
+    def record_query(self, name, elapsed, rows=0, error=False):
+        with self._lock:
+            stats = self.queries.get(name)
+            if stats is None:
+                stats = self.queries[name] = QueryStats()
+            stats.latency.add(elapsed * 1000)
+            stats.rows += rows
+            stats.errors += error
+
+    def record_acquire(self, elapsed, error=False):
+        with self._lock:
+            if error:
+                self.acquire_errors += 1
+            else:
+                self.acquire.add(elapsed * 1000)
+
+    def record_error(self, error):
+        """Count an error a DataSource method logged and swallowed, by method and exception type"""
+        method = sys._getframe(1).f_code.co_name
+        with self._lock:
+            self.errors[f"{method}: {type(error).__name__}"] += 1
+
+    def record_handler(self, name, elapsed, error=False):
+        with self._lock:
+            stats = self.handlers.get(name)
+            if stats is None:
+                stats = self.handlers[name] = QueryStats()
+            stats.latency.add(elapsed * 1000)
+            stats.errors += error
+
+    def connection(self, acquire):
+        """A connection from `acquire()` whose cursors are timed, with the checkout timed too"""
+        if not self.enabled:
+            return acquire()
+        start = time.perf_counter()
+        try:
+            conn = acquire()
+        except Exception:
+            self.record_acquire(time.perf_counter() - start, error=True)
+            raise
+        self.record_acquire(time.perf_counter() - start)
+        return MetricsConnection(conn, self)
+
+    @staticmethod
+    def release(conn):
+        """The connection to hand back to the backend"""
+        return conn.conn if isinstance(conn, MetricsConnection) else conn
+
+    def handler(self, callback):
+        """Wrap a telegram handler callback to time it (and let the profiler sample it)"""
+        if not self.enabled:
+            return callback
+        name = callback.__name__
+
+        @functools.wraps(callback)
+        def timed_handler(update, context):
+            thread_id = threading.get_ident()
+            self._handler_threads.add(thread_id)
+            start = time.perf_counter()
+            error = False
+            try:
+                return callback(update, context)
+            except Exception:
+                error = True
+                raise
+            finally:
+                self.record_handler(name, time.perf_counter() - start, error)
+                self._handler_threads.discard(thread_id)
+        return timed_handler
+
+    def start_profiler(self, interval=0.005):
+        if self.profiler is None:
+            self.profiler = SamplingProfiler(self._handler_threads, interval)
+            self.profiler.start()
+        return self.profiler
+
+    def stop_profiler(self):
+        profiler, self.profiler = self.profiler, None
+        if profiler is not None:
+            profiler.stop()
+        return profiler
+
+    def snapshot(self):
+        gauges = {name: read() for name, read in self.gauges.items()}
+        with self._lock:
+            return {"uptime_s": time.time() - self.started, "gauges": gauges,
+                    "acquire": dict(self.acquire.to_dict(), errors=self.acquire_errors),
+                    "queries": {name: dict(stats.latency.to_dict(), rows=stats.rows, errors=stats.errors)
+                                for name, stats in self.queries.items()},
+                    "handlers": {name: dict(stats.latency.to_dict(), errors=stats.errors)
+                                 for name, stats in self.handlers.items()},
+                    "errors": dict(self.errors)}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=1, sort_keys=True)
+
+    def to_text(self):
+        snapshot = self.snapshot()
+        acquire = snapshot["acquire"]
+        lines = [f"uptime {snapshot['uptime_s']:.0f}s",
+                 f"connection acquire: n={acquire['count']} p50={acquire['p50_ms']:.2f}ms "
+                 f"p99={acquire['p99_ms']:.2f}ms max={acquire['max_ms']:.1f}ms errors={acquire['errors']}"]
+        lines += [f"{name}: {value:.3f}" if isinstance(value, float) else f"{name}: {value}"
+                  for name, value in sorted(snapshot["gauges"].items())]
+        for title in ("queries", "handlers"):
+            lines.append(f"{title} by total time:")
+            rows = sorted(snapshot[title].items(), key=lambda item: -item[1]['mean_ms'] * item[1]['count'])
+            for name, stats in rows:
+                lines.append(f"{name}: n={stats['count']} mean={stats['mean_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms "
+                             f"max={stats['max_ms']:.1f}ms" + (f" rows={stats['rows']}" if 'rows' in stats else "")
+                             + (f" errors={stats['errors']}" if stats['errors'] else ""))
+        if snapshot["errors"]:
+            lines.append("swallowed errors:")
+            lines += [f"{name}: {count}" for name, count in sorted(snapshot["errors"].items())]
+        return "\n".join(lines)
+
+
+class MetricsCursor:
+    """Times each statement from execute to its fetch and counts the rows it returned"""
+
+    def __init__(self, cursor, metrics):
+        self._cursor = cursor
+        self._metrics = metrics
+        self._name = None
+        self._elapsed = 0.0
+        self._rows = 0
+        self._template = None
+
+    def _finish(self):
+        if self._name is not None:
+            self._metrics.record_query(self._name, self._elapsed, self._rows)
+            self._name = None
+
+    def _run(self, method, query, *args, **kwargs):
+        self._finish()
+        name = self._metrics.query_names.get(query) or self._template or "other"
+        self._template = None
+        start = time.perf_counter()
+        try:
+            result = method(query, *args, **kwargs)
+        except Exception:
+            self._metrics.record_query(name, time.perf_counter() - start, error=True)
+            raise
+        self._name = name
+        self._elapsed = time.perf_counter() - start
+        self._rows = 0
+        return result
+
+    def execute(self, query, *args, **kwargs):
+        return self._run(self._cursor.execute, query, *args, **kwargs)
+
+    def executemany(self, query, *args, **kwargs):
+        return self._run(self._cursor.executemany, query, *args, **kwargs)
+
+    def mogrify(self, query, *args):
+        # psycopg2's execute_batch mogrifies each row with the statement, then executes them joined
+        self._template = self._metrics.query_names.get(query)
+        return self._cursor.mogrify(query, *args)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        rows = method(*args)
+        self._elapsed += time.perf_counter() - start
+        self._rows += len(rows) if isinstance(rows, list) else rows is not None
+        self._finish()
+        return rows
+
+    def fetchall(self):
+        return self._fetch(self._cursor.fetchall)
+
+    def fetchone(self):
+        return self._fetch(self._cursor.fetchone)
+
+    def fetchmany(self, *args):
+        return self._fetch(self._cursor.fetchmany, *args)
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class MetricsConnection:
+    def __init__(self, conn, metrics):
+        self.conn = conn
+        self._metrics = metrics
+
+    def cursor(self, *args, **kwargs):
+        return MetricsCursor(self.conn.cursor(*args, **kwargs), self._metrics)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+class SamplingProfiler:
+    """Samples the stacks of the threads running a handler every `interval` seconds"""
+
+    def __init__(self, threads, interval=0.005, max_depth=40):
+        self.threads = threads
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.inclusive = Counter()
+        self.leaf = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id in list(self.threads):
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                self.samples += 1
+                seen = set()
+                depth = 0
+                while frame is not None and depth < self.max_depth:
+                    code = frame.f_code
+                    location = f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}"
+                    if depth == 0:
+                        self.leaf[location + f":{frame.f_lineno}"] += 1
+                    if location not in seen:
+                        self.inclusive[location] += 1
+                        seen.add(location)
+                    frame = frame.f_back
+                    depth += 1
+
+    def report(self, top=15):
+        if not self.samples:
+            return "no samples (no handler ran while profiling)"
+        lines = [f"{self.samples} samples every {self.interval * 1000:.0f}ms"]
+        for title, counter in (("inclusive:", self.inclusive), ("on cpu:", self.leaf)):
+            lines.append(title)
+            lines += [f"{count * 100 / self.samples:5.1f}% {location}" for location, count in counter.most_common(top)]
+        return "\n".join(lines)
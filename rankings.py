@@ -0,0 +1,62 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+class RankingSnapshot:
+    """Global rankings (the same for every customer) recomputed in the background and read from memory.
+
+    `loaders` maps a ranking name to a function computing it. `refresh` runs them all and swaps the
+    whole snapshot in one assignment, so readers see either the old rankings or the new ones. It runs
+    on the bot's job queue every `interval` seconds (`job`) and on the owner's /refresh command; the
+    first read before any refresh computes the snapshot in place. An empty result (its query failed
+    or there are no orders yet) keeps the previous value of that ranking, or its entry in `defaults`
+    when there is none yet.
+    """
+
+    def __init__(self, loaders, interval=300.0, defaults=None):
+        self.loaders = loaders
+        self.defaults = defaults or dict()
+        self.interval = interval
+        self._refresh_lock = threading.RLock()
+        self.snapshot = None
+        self.refreshed_at = None
+        self.last_duration = None
+        self.refresh_errors = 0
+
+    def refresh(self):
+        with self._refresh_lock:
+            start = time.perf_counter()
+            previous = self.snapshot or dict()
+            snapshot = dict()
+            for name, loader in self.loaders.items():
+                try:
+                    value = loader()
+                except Exception as error:
+                    logger.error(f"ranking {name} failed: {error}")
+                    self.refresh_errors += 1
+                    value = None
+                if not value:
+                    value = previous[name] if name in previous else self.defaults.get(name, value)
+                snapshot[name] = value
+            self.snapshot = snapshot
+            self.refreshed_at = time.time()
+            self.last_duration = time.perf_counter() - start
+            return self.last_duration
+
+    def job(self, context=None):
+        """Job queue callback"""
+        self.refresh()
+
+    def get(self, name):
+        if self.snapshot is None:
+            with self._refresh_lock:
+                if self.snapshot is None:
+                    self.refresh()
+        return self.snapshot.get(name)
+
+    def staleness(self):
+        """Seconds since the last refresh (None before the first one)"""
+        return None if self.refreshed_at is None else time.time() - self.refreshed_at
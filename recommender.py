@@ -0,0 +1,170 @@
+import logging
+import threading
+import time
+import numpy as np
+from scipy import sparse
+
+logger = logging.getLogger()
+
+
+class RecommenderEngine:
+    """Dish recommendations from a sparse client x dish matrix.
+
+    A cell holds the number of order lines (or the quantity, with weight='quantity') of a dish in the
+    client's orders divided by the client's number of orders - the same rating GET_RECOMMENDED_DISHES
+    and GET_FAVORITE compute in SQL. User based scores sum the ratings of the k nearest clients from
+    the TasteStore; item based scores weight each dish by its cosine similarity to the client's dishes.
+    `loader` returns (order_number, client_number, dish_number, quantity) rows for every order.
+    The matrix is rebuilt from the incremental counters at most once per `max_staleness` seconds.
+    """
+
+    def __init__(self, loader, taste, neighbours=4, item_neighbours=20, top_n=5, weight='lines',
+                 max_staleness=30.0):
+        self.loader = loader
+        self.taste = taste
+        self.neighbours = neighbours
+        self.item_neighbours = item_neighbours
+        self.top_n = top_n
+        self.weight = weight
+        self.max_staleness = max_staleness
+        self._lock = threading.RLock()
+        self._built = False
+        self._dirty = True
+        self._matrix_at = None
+        self.order_client = dict()
+        self.order_cells = dict()
+        self.client_orders = dict()
+        self.cells = dict()
+        self.client_row = dict()
+        self.dishes = list()
+        self.ratings = None
+        self.item_similarity = None
+
+    def build(self):
+        with self._lock:
+            self.order_client = dict()
+            self.order_cells = dict()
+            self.client_orders = dict()
+            self.cells = dict()
+            for order_number, client_number, dish_number, quantity in self.loader():
+                if order_number not in self.order_client:
+                    self._add_order(order_number, client_number)
+                if dish_number is not None:
+                    self._add_cell(order_number, dish_number, 1, quantity or 0)
+            self._built = True
+            self._dirty = True
+
+    def ensure_built(self):
+        if not self._built:
+            self.build()
+
+    def _add_order(self, order_number, client_number):
+        self.order_client[order_number] = client_number
+        self.client_orders[client_number] = self.client_orders.get(client_number, 0) + 1
+
+    def _add_cell(self, order_number, dish_number, lines, quantity):
+        client_number = self.order_client.get(order_number)
+        if client_number is None:
+            logger.error(f"recommender can't find the client of order {order_number}")
+            return
+        for key, counters in (((order_number, dish_number), self.order_cells),
+                              ((client_number, dish_number), self.cells)):
+            cell = counters.setdefault(key, [0, 0])
+            cell[0] += lines
+            cell[1] += quantity
+            if cell[0] <= 0:
+                del counters[key]
+        self._dirty = True
+
+    def add_order(self, order_number, client_number):
+        with self._lock:
+            if self._built and order_number not in self.order_client:
+                self._add_order(order_number, client_number)
+                self._dirty = True
+
+    def add_dish(self, order_number, dish_number, quantity):
+        with self._lock:
+            if self._built:
+                self._add_cell(order_number, dish_number, 1, quantity)
+
+    def remove_dish(self, order_number, dish_number):
+        with self._lock:
+            if self._built:
+                lines, quantity = self.order_cells.get((order_number, dish_number), (0, 0))
+                if lines:
+                    self._add_cell(order_number, dish_number, -lines, -quantity)
+
+    def _refresh_matrix(self):
+        self.ensure_built()
+        with self._lock:
+            fresh = self._matrix_at is not None and time.monotonic() - self._matrix_at < self.max_staleness
+            if not self._dirty or (fresh and self.ratings is not None):
+                return
+            clients = list(self.client_orders)
+            client_row = {client: row for row, client in enumerate(clients)}
+            dishes = sorted({dish for client, dish in self.cells})
+            dish_column = {dish: column for column, dish in enumerate(dishes)}
+            value = 0 if self.weight == 'lines' else 1
+            size = len(self.cells)
+            rows = np.fromiter((client_row[client] for client, dish in self.cells), dtype=np.int64, count=size)
+            columns = np.fromiter((dish_column[dish] for client, dish in self.cells), dtype=np.int64, count=size)
+            data = np.fromiter((cell[value] for cell in self.cells.values()), dtype=np.float64, count=size)
+            orders = np.fromiter((self.client_orders[client] for client in clients), dtype=np.float64,
+                                 count=len(clients))
+            data /= orders[rows]
+            self.ratings = sparse.csr_matrix((data, (rows, columns)), shape=(len(clients), len(dishes)))
+            self.client_row = client_row
+            self.dishes = dishes
+            self.item_similarity = None
+            self._dirty = False
+            self._matrix_at = time.monotonic()
+
+    def _item_similarity(self):
+        if self.item_similarity is None:
+            columns = self.ratings.tocsc()
+            norms = np.sqrt(np.asarray(columns.multiply(columns).sum(axis=0))).ravel()
+            norms[norms == 0] = 1
+            scale = sparse.diags(1 / norms)
+            similarity = (scale @ (columns.T @ columns) @ scale).tocsr()
+            similarity.setdiag(0)
+            similarity.eliminate_zeros()
+            self.item_similarity = self._keep_top(similarity, self.item_neighbours)
+        return self.item_similarity
+
+    @staticmethod
+    def _keep_top(matrix, k):
+        rows, columns, data = list(), list(), list()
+        for row in range(matrix.shape[0]):
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            values = matrix.data[start:end]
+            keep = np.argpartition(-values, k - 1)[:k] if len(values) > k else np.arange(len(values))
+            rows.extend([row] * len(keep))
+            columns.extend(matrix.indices[start:end][keep])
+            data.extend(values[keep])
+        return sparse.csr_matrix((data, (rows, columns)), shape=matrix.shape)
+
+    def user_scores(self, client_number, k=None):
+        """Sum of the ratings of the k nearest clients, one score per dish"""
+        neighbours = self.taste.nearest_clients(client_number, k or self.neighbours)
+        rows = [self.client_row[client] for client in neighbours if client in self.client_row]
+        if not rows:
+            return np.zeros(len(self.dishes))
+        return np.asarray(self.ratings[rows].sum(axis=0)).ravel()
+
+    def item_scores(self, client_number):
+        """Dishes similar to the ones the client rated, weighted by the client's ratings"""
+        row = self.client_row.get(client_number)
+        if row is None:
+            return np.zeros(len(self.dishes))
+        return np.asarray((self.ratings[row] @ self._item_similarity()).todense()).ravel()
+
+    def recommend(self, client_number, exclude=(), mode='user', n=None, k=None):
+        """Dish numbers with the highest scores, best first, skipping the dishes in `exclude`"""
+        self._refresh_matrix()
+        with self._lock:
+            scores = self.item_scores(client_number) if mode == 'item' else self.user_scores(client_number, k)
+            dishes = self.dishes
+        excluded = set(exclude)
+        candidates = [column for column in np.flatnonzero(scores > 0) if dishes[column] not in excluded]
+        candidates.sort(key=lambda column: (-scores[column], dishes[column]))
+        return [dishes[column] for column in candidates[:n or self.top_n]]
@@ -0,0 +1,140 @@
+import datetime
+import logging
+import threading
+
+logger = logging.getLogger()
+
+
+class SalesRollup:
+    """Quantity sold per (month, dish_number), kept current as order lines are written.
+
+    `loader` returns (year, month, dish_number, quantity) rows aggregated over all orders. New orders
+    are counted in the month they were opened. An order opened before the rollup started (e.g. before
+    a restart) is looked up once with `order_loader(order_number)`, which returns (day opened,
+    {dish_number: quantity} stored now) or None; only when that fails, or the first change seen to
+    such an order removes a line, the rollup rebuilds on the next read. Changes written while `build`
+    is loading are replayed on its result. Revenue is quantity times the current menu price.
+    """
+
+    def __init__(self, loader, menu, today=datetime.date.today, order_loader=None):
+        self.loader = loader
+        self.menu = menu
+        self.today = today
+        self.order_loader = order_loader
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        self._built = False
+        self._journal = None
+        self.months = dict()
+        self.order_month = dict()
+        self.order_lines = dict()
+
+    def current_month(self):
+        today = self.today()
+        return today.year, today.month
+
+    @staticmethod
+    def _count(months, month, dish_number, quantity):
+        dishes = months.setdefault(month, dict())
+        total = dishes.get(dish_number, 0) + quantity
+        if total > 0:
+            dishes[dish_number] = total
+        else:
+            dishes.pop(dish_number, None)
+
+    def build(self):
+        with self._build_lock:
+            with self._lock:
+                self._journal = list()
+            try:
+                rows = self.loader()
+                if rows is None:
+                    raise RuntimeError("monthly sales could not be loaded")
+                months = dict()
+                for year, month, dish_number, quantity in rows:
+                    self._count(months, (int(year), int(month)), dish_number, quantity)
+            except Exception:
+                with self._lock:
+                    self._journal = None
+                raise
+            with self._lock:
+                for month, dish_number, quantity in self._journal:
+                    self._count(months, month, dish_number, quantity)
+                self._journal = None
+                self.months = months
+                self._built = True
+
+    def ensure_built(self):
+        if not self._built:
+            self.build()
+
+    def _change(self, month, dish_number, quantity):
+        if self._built:
+            self._count(self.months, month, dish_number, quantity)
+        if self._journal is not None:
+            self._journal.append((month, dish_number, quantity))
+
+    def _look_up(self, order_number):
+        """Month of an order opened before the rollup started, with the lines it has stored now"""
+        order = self.order_loader(order_number) if self.order_loader is not None else None
+        if order is None:
+            return None, None
+        day, lines = order
+        return (day.year, day.month), lines
+
+    def add_order(self, order_number, client_number):
+        with self._lock:
+            self.order_month[order_number] = self.current_month()
+
+    def add_dish(self, order_number, dish_number, quantity):
+        lines = None
+        if order_number not in self.order_month:
+            month, lines = self._look_up(order_number)
+        with self._lock:
+            if order_number not in self.order_month:
+                if lines is None:
+                    self._built = False
+                    return
+                self.order_month[order_number] = month
+                for line_dish, line_quantity in lines.items():
+                    self.order_lines[(order_number, line_dish)] = line_quantity
+            else:
+                key = (order_number, dish_number)
+                self.order_lines[key] = self.order_lines.get(key, 0) + quantity
+            self._change(self.order_month[order_number], dish_number, quantity)
+
+    def remove_dish(self, order_number, dish_number):
+        with self._lock:
+            month = self.order_month.get(order_number)
+            if month is None:
+                self._built = False
+                return
+            quantity = self.order_lines.pop((order_number, dish_number), 0)
+            if quantity:
+                self._change(month, dish_number, -quantity)
+
+    def ranked(self, month=None, by='revenue'):
+        """(dish_name, quantity, revenue) of every dish sold in the month, best first.
+
+        Like the SQL it replaced, dishes listed twice on the menu under one name are ranked together.
+        """
+        self.ensure_built()
+        with self._lock:
+            dishes = dict(self.months.get(month or self.current_month(), dict()))
+        by_name = dict()
+        for dish_number, quantity in dishes.items():
+            dish = self.menu.get_dish(dish_number)
+            if dish is None:
+                logger.error(f"dish {dish_number} is not on the menu")
+                continue
+            sold, revenue = by_name.get(dish['dish_name'], (0, 0))
+            by_name[dish['dish_name']] = (sold + quantity, revenue + quantity * dish['price'])
+        rows = [(dish_name, sold, revenue) for dish_name, (sold, revenue) in by_name.items()]
+        column = 2 if by == 'revenue' else 1
+        rows.sort(key=lambda row: (-row[column], row[0]))
+        return rows
+
+    def top_bottom(self, k=5, month=None, by='revenue'):
+        """The k best and the k worst selling dishes of the month (worst first) from one ranking"""
+        rows = self.ranked(month, by)
+        return rows[:k], rows[::-1][:k]
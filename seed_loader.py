@@ -0,0 +1,256 @@
+"""Load the data/*.csv and DELIVERY_PERSON.xlsx seed files into Postgres with COPY.
+
+Usage: DATABASE_URL=... python seed_loader.py [--data data] [--batch 10000] [--parallel] [--defer-constraints]
+                                              [--truncate] [--scale 100]
+
+The files come out of a spreadsheet: ';' or ',' delimiters, a BOM, DD/MM/YYYY dates and phone numbers
+saved as 9,72502E+11. Those phone numbers lost their last digits, so they are repaired: a delivery
+phone is matched to the courier whose number rounds to it, and client numbers get a deterministic
+unique suffix (orders are spread over the clients sharing the rounded number). Order lines that lost
+their fields (10,,,00;1;) are skipped and counted. --scale N also writes N-1 synthetic copies of the
+order history (new order numbers, same clients and dishes) for load tests.
+"""
+import argparse
+import csv
+import io
+import logging
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import psycopg2
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+logger = logging.getLogger()
+
+TABLE_LEVELS = [['client', 'delivery_person', 'dish'], ['order_'], ['dish_in_order']]
+
+COLUMNS = {'client': ['phone_number', 'name', 'club_member'],
+           'delivery_person': ['name', 'phone_number'],
+           'dish': ['dish_number', 'dish_name', 'price', 'dish_type', 'chiken', 'spicy', 'pastry', 'fish', 'tofu',
+                    'beef', 'rice', 'coconut_cream', 'eggs', 'sea_food', 'curry', 'fried', 'vegetarian', 'vegan'],
+           'order_': ['order_number', 'shipping', 'client_number', 'order_time', 'delivery_phone_number', 'remarks'],
+           'dish_in_order': ['order_number', 'dish_number', 'quantity']}
+
+COPY_ROWS = """COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)"""
+
+TRUNCATE_TABLES = """truncate dish_in_order, order_, client, dish, delivery_person"""
+
+MANGLED_NUMBER = re.compile(r"^\d[.,]\d+E\+\d+$", re.IGNORECASE)
+
+
+def read_rows(path):
+    """Stream the rows of a seed CSV as dicts with lower case keys, whatever its delimiter"""
+    with open(path, encoding='utf-8-sig', newline='') as seed_file:
+        header = seed_file.readline()
+        delimiter = ';' if header.count(';') >= header.count(',') else ','
+        columns = [column.strip().lower() for column in header.strip().split(delimiter)]
+        for row in csv.reader(seed_file, delimiter=delimiter):
+            if any(field.strip() for field in row):
+                yield dict(zip(columns, (field.strip() for field in row)))
+
+
+def read_xlsx_rows(path):
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    columns = [str(column).strip().lower() for column in next(rows)]
+    for row in rows:
+        if any(value is not None for value in row):
+            yield dict(zip(columns, row))
+    workbook.close()
+
+
+def mangled_number(value):
+    """The rounded number a spreadsheet left of a phone number (9,72502E+11), or None"""
+    value = str(value).strip()
+    if MANGLED_NUMBER.match(value):
+        return int(round(float(value.replace(",", "."))))
+    return None
+
+
+def normalize_phone(value):
+    digits = re.sub(r"\D", "", str(value))
+    if digits.startswith("972"):
+        return "+" + digits
+    return "+972" + digits.lstrip("0")
+
+
+def normalize_date(value):
+    day, month, year = str(value).strip().split("/")
+    return f"{int(year):04d}-{int(month):02d}-{int(day):02d}"
+
+
+def significant(number, digits=6):
+    return int(round(number, digits - len(str(number))))
+
+
+class SeedData:
+    """Normalized rows of every seed table, streamed"""
+
+    def __init__(self, directory, scale=1):
+        self.directory = directory
+        self.scale = scale
+        self.repaired = dict()
+        self.skipped = dict()
+        self.client_phones = dict()
+        self.couriers = dict()
+        self.last_order = 0
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def count(self, counter, table):
+        counter[table] = counter.get(table, 0) + 1
+
+    def client(self):
+        for index, row in enumerate(read_rows(self.path("CLIENT.csv"))):
+            rounded = mangled_number(row['phone_number'])
+            if rounded is None:
+                phone = normalize_phone(row['phone_number'])
+            else:
+                phone = "+" + str(rounded)[:6] + f"{index:06d}"
+                self.client_phones.setdefault(rounded, list()).append(phone)
+                self.count(self.repaired, 'client')
+            yield phone, row['name'], row.get('club_member') or 0
+
+    def delivery_person(self):
+        for row in read_xlsx_rows(self.path("DELIVERY_PERSON.xlsx")):
+            phone = normalize_phone(row.get('delivery_phone_number') or row.get('phone_number'))
+            self.couriers.setdefault(significant(int(phone[1:])), list()).append(phone)
+            yield str(row['name']).strip(), phone
+
+    def dish(self):
+        for row in read_rows(self.path("DISH.csv")):
+            yield [row[column] for column in COLUMNS['dish'][:4]] + \
+                  [row[column] == '1' for column in COLUMNS['dish'][4:]]
+
+    def _repair(self, value, phones, order_number, table):
+        rounded = mangled_number(value)
+        if rounded is None:
+            return normalize_phone(value)
+        self.count(self.repaired, table)
+        candidates = phones.get(rounded) or [phone for group in phones.values() for phone in group]
+        return candidates[order_number % len(candidates)] if candidates else "+" + str(rounded)
+
+    def order_(self):
+        if not self.client_phones:
+            for _ in self.client():
+                pass
+        if not self.couriers:
+            for _ in self.delivery_person():
+                pass
+        orders = list()
+        for row in read_rows(self.path("ORDER_.csv")):
+            order_number = int(row['order_number'])
+            self.last_order = max(self.last_order, order_number)
+            orders.append((order_number, row['shipping'] or 1,
+                           self._repair(row['client_number'], self.client_phones, order_number, 'order_'),
+                           normalize_date(row['order_time']) if row['order_time'] else None,
+                           self._repair(row['delivery_phone_number'], self.couriers, order_number, 'order_'),
+                           row.get('remarks') or None))
+            yield orders[-1]
+        for copy in range(1, self.scale):
+            for order in orders:
+                yield (order[0] + copy * self.last_order,) + order[1:]
+
+    def dish_in_order(self):
+        if not self.last_order:
+            for row in read_rows(self.path("ORDER_.csv")):
+                self.last_order = max(self.last_order, int(row['order_number']))
+        lines = list()
+        for row in read_rows(self.path("DISH_IN_ORDER.csv")):
+            if not (row.get('dish_number', '').isdigit() and row.get('order_number', '').isdigit()):
+                self.count(self.skipped, 'dish_in_order')
+                continue
+            lines.append((int(row['order_number']), int(row['dish_number']), int(row.get('quantity') or 1)))
+            yield lines[-1]
+        for copy in range(1, self.scale):
+            for order_number, dish_number, quantity in lines:
+                yield order_number + copy * self.last_order, dish_number, quantity
+
+
+def copy_batches(cur, table, rows, batch_size):
+    statement = COPY_ROWS.format(table=table, columns=", ".join(COLUMNS[table]))
+    count = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count % batch_size == 0:
+            buffer.seek(0)
+            cur.copy_expert(statement, buffer)
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        buffer.seek(0)
+        cur.copy_expert(statement, buffer)
+    return count
+
+
+def load_table(database_url, data, table, batch_size, conn=None):
+    own_connection = conn is None
+    if own_connection:
+        conn = psycopg2.connect(database_url)
+    try:
+        start = time.perf_counter()
+        cur = conn.cursor()
+        count = copy_batches(cur, table, getattr(data, table)(), batch_size)
+        cur.close()
+        if own_connection:
+            conn.commit()
+        elapsed = time.perf_counter() - start
+        logger.info(f"{table}: {count} rows in {elapsed:.2f}s ({count / elapsed if elapsed else 0:.0f} rows/s)")
+        return count
+    finally:
+        if own_connection:
+            conn.close()
+
+
+def run(database_url, directory, batch_size=10000, parallel=False, defer_constraints=False, truncate=False,
+        scale=1):
+    data = SeedData(directory, scale)
+    start = time.perf_counter()
+    if truncate:
+        conn = psycopg2.connect(database_url)
+        conn.cursor().execute(TRUNCATE_TABLES)
+        conn.commit()
+        conn.close()
+    total = 0
+    if defer_constraints:
+        conn = psycopg2.connect(database_url)
+        try:
+            conn.cursor().execute("SET CONSTRAINTS ALL DEFERRED")
+            for level in TABLE_LEVELS:
+                for table in level:
+                    total += load_table(database_url, data, table, batch_size, conn)
+            conn.commit()
+        finally:
+            conn.close()
+    else:
+        for level in TABLE_LEVELS:
+            if parallel and len(level) > 1:
+                with ThreadPoolExecutor(len(level)) as executor:
+                    total += sum(executor.map(lambda table: load_table(database_url, data, table, batch_size),
+                                              level))
+            else:
+                total += sum(load_table(database_url, data, table, batch_size) for table in level)
+    elapsed = time.perf_counter() - start
+    logger.info(f"loaded {total} rows in {elapsed:.2f}s ({total / elapsed if elapsed else 0:.0f} rows/s), "
+                f"repaired phone numbers {data.repaired}, skipped rows {data.skipped}")
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default="data")
+    parser.add_argument("--batch", type=int, default=10000, help="rows per COPY")
+    parser.add_argument("--parallel", action='store_true', help="load independent tables at the same time")
+    parser.add_argument("--defer-constraints", action='store_true',
+                        help="load every table in one transaction with deferrable constraints checked at commit")
+    parser.add_argument("--truncate", action='store_true', help="empty the tables first")
+    parser.add_argument("--scale", type=int, default=1, help="multiply the order history for load tests")
+    args = parser.parse_args()
+    run(os.environ.get("DATABASE_URL"), args.data, args.batch, args.parallel, args.defer_constraints,
+        args.truncate, args.scale)
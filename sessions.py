@@ -0,0 +1,306 @@
+import functools
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger()
+
+
+class Session:
+    """What the bot remembers about one chat between updates: ids only, no keyboards.
+
+    `chosen` holds the dishes a quantity was picked for, declined ones included; `in_cart` the chosen
+    dishes put in the cart and not deleted since.
+    """
+
+    __slots__ = ('name', 'client_number', 'order_number', 'selected_dish', 'chosen', 'in_cart', 'last_seen',
+                 'saved', 'saved_at')
+
+    def __init__(self, last_seen):
+        self.name = None
+        self.client_number = None
+        self.order_number = None
+        self.selected_dish = None
+        self.chosen = None
+        self.in_cart = None
+        self.last_seen = last_seen
+        self.saved = None
+        self.saved_at = None
+
+    def state(self, saved_at=None):
+        """The session as a JSON array, as written to the session log with the (wall clock) time it was written"""
+        return json.dumps([self.name, self.client_number, self.order_number, self.selected_dish,
+                           sorted(self.chosen) if self.chosen else None,
+                           sorted(self.in_cart) if self.in_cart else None, saved_at])
+
+    def restore(self, state):
+        values = json.loads(state)
+        # records written before in_cart and the time were saved have 5 values
+        (self.name, self.client_number, self.order_number, self.selected_dish, chosen, in_cart,
+         self.saved_at) = values + [None] * (7 - len(values))
+        self.chosen = set(chosen) if chosen else None
+        self.in_cart = set(in_cart) if in_cart else None
+        self.saved = hash(self.state())
+
+    def open_order(self, order_number):
+        self.order_number = order_number
+        self.selected_dish = None
+        self.chosen = None
+        self.in_cart = None
+
+    def choose(self, dish_number):
+        """Remember a quantity was picked for the dish; False if it already was in this order"""
+        if self.chosen is None:
+            self.chosen = set()
+        elif dish_number in self.chosen:
+            return False
+        self.chosen.add(dish_number)
+        return True
+
+    def add_line(self, dish_number):
+        """Remember a cart line was added for the chosen dish"""
+        if self.in_cart is None:
+            self.in_cart = set()
+        self.in_cart.add(dish_number)
+
+    def remove_line(self, dish_number):
+        if self.in_cart:
+            self.in_cart.discard(dish_number)
+
+
+class SessionLog:
+    """Append-only file of session records: a chat id and its state per line, no state once dropped.
+
+    Has the same two methods as the session_log table of DataSource, so either can back a SessionStore.
+    """
+
+    def __init__(self, path, fsync=False):
+        self.path = path
+        self.fsync = fsync
+
+    def _write(self, path, mode, records):
+        with open(path, mode, encoding='utf-8') as log_file:
+            log_file.writelines(f"{chat_id}\t{state or ''}\n" for chat_id, state in records)
+            log_file.flush()
+            if self.fsync:
+                os.fsync(log_file.fileno())
+
+    def add_session_records(self, records, replace=False):
+        """Append (chat_id, state) records, or replace the whole file with them"""
+        try:
+            if replace:
+                self._write(self.path + ".tmp", 'w', records)
+                os.replace(self.path + ".tmp", self.path)
+            else:
+                self._write(self.path, 'a', records)
+            return True
+        except OSError as error:
+            logger.error(error)
+            return False
+
+    def get_session_records(self):
+        """The records in write order, or None when the file could not be read"""
+        try:
+            with open(self.path, encoding='utf-8') as log_file:
+                lines = log_file.read().split("\n")
+        except FileNotFoundError:
+            return list()
+        except OSError as error:
+            logger.error(error)
+            return None
+        records = list()
+        for line in lines:
+            chat_id, tab, state = line.partition("\t")
+            if tab:
+                records.append((int(chat_id), state or None))
+        return records
+
+
+class SessionStore:
+    """Sessions by chat id, dropped once idle for `idle_timeout` seconds.
+
+    `evict_idle` runs on the bot's job queue (`job`); an evicted chat starts a new session, so a
+    customer who comes back after the timeout is asked to start a new order.
+
+    With a `log` (a SessionLog or the DataSource session_log table) the sessions outlive a restart.
+    Handlers wrapped by `persisted` mark their chat once they return; `flush` (`flush_job`) writes one
+    record per marked chat whose state changed since it was last written, so however many updates
+    a chat sends between two flushes it costs at most one record; a chat whose state stays the same is
+    written again once its record is a quarter of `idle_timeout` old. Records carry the `wall_clock`
+    time they were written. `restore` replays the log at startup (the last record of a chat wins),
+    drops the sessions idle for longer than `idle_timeout` by then and rewrites the log as one record
+    per session; the log is compacted the same way once it holds `compact_ratio` times more records
+    than there are sessions.
+    Cart lines are buffered apart from the sessions and may not have reached the database when a
+    session was written, so with `order_dishes(first_order_number)` ({order_number: dish numbers
+    stored since that order}, None when it failed) `restore` forgets the dishes of a restored order
+    that were put in the cart but have no stored line; declined and deleted dishes stay chosen.
+    """
+
+    def __init__(self, idle_timeout=3600.0, clock=time.monotonic, log=None, compact_ratio=4, order_dishes=None,
+                 wall_clock=time.time):
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.log = log
+        self.compact_ratio = compact_ratio
+        self.order_dishes = order_dishes
+        self._lock = threading.Lock()
+        self.sessions = dict()
+        self._dirty = set()
+        self._dropped = set()
+        self.log_records = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    def get(self, chat_id):
+        now = self.clock()
+        session = self.sessions.get(chat_id)
+        if session is None:
+            with self._lock:
+                session = self.sessions.setdefault(chat_id, Session(now))
+        session.last_seen = now
+        return session
+
+    def evict_idle(self):
+        deadline = self.clock() - self.idle_timeout
+        with self._lock:
+            idle = [chat_id for chat_id, session in self.sessions.items() if session.last_seen < deadline]
+            for chat_id in idle:
+                if self.sessions.pop(chat_id).saved is not None:
+                    self._dropped.add(chat_id)
+                    self._dirty.add(chat_id)
+        if idle:
+            logger.info(f"evicted {len(idle)} idle sessions, {len(self.sessions)} left")
+        return len(idle)
+
+    def job(self, context=None):
+        """Job queue callback"""
+        self.evict_idle()
+
+    def mark(self, chat_id):
+        with self._lock:
+            self._dirty.add(chat_id)
+
+    def persisted(self, callback):
+        """Wrap a telegram handler callback to save its chat's session on the next flush"""
+        if self.log is None:
+            return callback
+
+        @functools.wraps(callback)
+        def saving_handler(update, context):
+            try:
+                return callback(update, context)
+            finally:
+                if update.effective_chat is not None:
+                    self.mark(update.effective_chat.id)
+        return saving_handler
+
+    def flush(self):
+        """Write the changed sessions of the marked chats; returns the number of records written"""
+        if self.log is None:
+            return 0
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+            dropped, self._dropped = self._dropped, set()
+        now = self.wall_clock()
+        records = list()
+        written = list()
+        for chat_id in dirty:
+            session = self.sessions.get(chat_id)
+            if session is None:
+                if chat_id in dropped:
+                    records.append((chat_id, None))
+                continue
+            digest = hash(session.state())
+            if digest != session.saved or now - (session.saved_at or 0) >= self.idle_timeout / 4:
+                records.append((chat_id, session.state(now)))
+                written.append((session, digest))
+        if not records:
+            return 0
+        if not self.log.add_session_records(records):
+            with self._lock:
+                self._dirty |= dirty
+                self._dropped |= dropped
+            return 0
+        for session, digest in written:
+            session.saved = digest
+            session.saved_at = now
+        self.log_records += len(records)
+        if self.log_records > self.compact_ratio * max(len(self.sessions), 1000):
+            self.compact()
+        return len(records)
+
+    def flush_job(self, context=None):
+        """Job queue callback"""
+        self.flush()
+
+    def compact(self):
+        """Rewrite the log as the current state of every session"""
+        now = self.wall_clock()
+        sessions = list(self.sessions.items())
+        for _, session in sessions:
+            if session.saved_at is None:
+                session.saved_at = now
+        records = [(chat_id, session.state(session.saved_at)) for chat_id, session in sessions]
+        if not self.log.add_session_records(records, replace=True):
+            return False
+        for _, session in sessions:
+            session.saved = hash(session.state())
+        self.log_records = len(records)
+        return True
+
+    def keep_stored_dishes(self):
+        """Drop the chosen dishes whose cart lines were lost with the buffered cart"""
+        orders = [session.order_number for session in self.sessions.values() if session.in_cart]
+        if self.order_dishes is None or not orders:
+            return
+        stored = self.order_dishes(min(orders))
+        if stored is None:
+            logger.error("could not read the stored order lines, keeping the chosen dishes of the saved sessions")
+            return
+        for session in self.sessions.values():
+            if session.in_cart:
+                lost = session.in_cart - stored.get(session.order_number, set())
+                session.chosen = session.chosen - lost or None
+                session.in_cart = session.in_cart - lost or None
+
+    def restore(self):
+        """Load the sessions the log holds and compact it; returns the number of sessions restored"""
+        if self.log is None:
+            return 0
+        records = self.log.get_session_records()
+        if records is None:
+            logger.error("could not read the session log, starting without the saved sessions")
+            return 0
+        states = dict()
+        for chat_id, state in records:
+            states[chat_id] = state
+        now = self.clock()
+        wall_now = self.wall_clock()
+        expired = 0
+        for chat_id, state in states.items():
+            if state is None:
+                continue
+            session = Session(now)
+            try:
+                session.restore(state)
+            except (ValueError, TypeError) as error:
+                logger.warning(f"skipped the saved session of chat {chat_id}: {error}")
+                continue
+            if session.saved_at is not None:
+                idle = max(wall_now - session.saved_at, 0)
+                if idle > self.idle_timeout:
+                    expired += 1
+                    continue
+                session.last_seen = now - idle
+            self.sessions[chat_id] = session
+        self.keep_stored_dishes()
+        self.log_records = len(records)
+        if self.log_records > len(self.sessions):
+            self.compact()
+        logger.info(f"restored {len(self.sessions)} sessions from {len(records)} records, {expired} expired")
+        return len(self.sessions)
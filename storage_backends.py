@@ -0,0 +1,191 @@
+import datetime
+import logging
+import sqlite3
+import threading
+import time
+from psycopg2.extras import execute_batch, execute_values
+from connection_pool import ConnectionPool
+
+logger = logging.getLogger()
+
+CREATE_ORDER_NUMBER_SEQUENCE = """create sequence if not exists order_number_seq;
+                                  select setval('order_number_seq', greatest(m.last_order, 1), m.last_order > 0)
+                                  from (select coalesce(max(order_number), 0) as last_order from order_) m,
+                                      order_number_seq s
+                                  where s.last_value + s.is_called::int <= m.last_order"""
+
+RESERVE_ORDER_NUMBERS = """select nextval('order_number_seq') from generate_series(1, %s)"""
+
+DELETE_ORDER_LINES = """delete from dish_in_order where order_number = %s and dish_number = any(%s)"""
+
+ADD_ORDER_LINES = """insert into dish_in_order(order_number, dish_number, quantity) values %s"""
+
+ORDER_LINE_VALUES = """(%s, %s, %s)"""
+
+SQLITE_SCHEMA = """create table if not exists client(phone_number text primary key, name text,
+                        club_member integer default 0);
+                   create table if not exists delivery_person(name text, phone_number text primary key);
+                   create table if not exists dish(dish_number integer primary key, dish_name text, price numeric,
+                        dish_type text, chiken integer, spicy integer, pastry integer, fish integer, tofu integer,
+                        beef integer, rice integer, coconut_cream integer, eggs integer, sea_food integer,
+                        curry integer, fried integer, vegetarian integer, vegan integer);
+                   create table if not exists order_(order_number integer primary key, shipping integer,
+                        client_number text, order_time date default current_date, delivery_phone_number text,
+                        remarks text);
+                   create table if not exists dish_in_order(order_number integer, dish_number integer,
+                        quantity integer);
+                   create index if not exists dish_in_order_order on dish_in_order(order_number);
+                   create index if not exists order_client on order_(client_number);
+                   create table if not exists order_number_seq(last_value integer);"""
+
+SQLITE_RESERVE_ORDER_NUMBERS = """update order_number_seq
+                                  set last_value = max(last_value, (select coalesce(max(order_number), 0)
+                                                                    from order_)) + ?"""
+
+SQLITE_LAST_ORDER_NUMBER = """select last_value from order_number_seq"""
+
+SQLITE_DELETE_ORDER_LINE = """delete from dish_in_order where order_number = ? and dish_number = ?"""
+
+SQLITE_ADD_ORDER_LINE = """insert into dish_in_order(order_number, dish_number, quantity) values(?, ?, ?)"""
+
+sqlite3.register_adapter(datetime.date, lambda day: day.isoformat())
+sqlite3.register_converter("date", lambda value: datetime.date.fromisoformat(value.decode()))
+
+
+class PostgresBackend:
+    """The production database: pooled psycopg2 connections to DATABASE_URL"""
+
+    dialect = 'postgres'
+    # execute_values mogrifies ORDER_LINE_VALUES per row, which names the joined insert in the metrics
+    query_names = {CREATE_ORDER_NUMBER_SEQUENCE: 'CREATE_ORDER_NUMBER_SEQUENCE',
+                   RESERVE_ORDER_NUMBERS: 'RESERVE_ORDER_NUMBERS',
+                   DELETE_ORDER_LINES: 'DELETE_ORDER_LINES',
+                   ORDER_LINE_VALUES: 'ADD_ORDER_LINES'}
+
+    def __init__(self, database_url, min_connections=1, max_connections=10, statement_timeout=None):
+        options = dict()
+        if statement_timeout:
+            options['options'] = f"-c statement_timeout={int(statement_timeout * 1000)}"
+        self.pool = ConnectionPool(database_url, min_size=min_connections, max_size=max_connections,
+                                   sslmode='allow', **options)
+        self.sequence_ready = False
+
+    def getconn(self):
+        return self.pool.getconn()
+
+    def putconn(self, conn):
+        self.pool.putconn(conn)
+
+    def closeall(self):
+        self.pool.closeall()
+
+    @staticmethod
+    def sql(query):
+        return query
+
+    @staticmethod
+    def execute_batch(cur, query, rows):
+        execute_batch(cur, query, rows)
+
+    @staticmethod
+    def write_order_lines(cur, order_number, deleted, added):
+        """One delete of the removed dishes and one multi-row insert of the added lines"""
+        if deleted:
+            cur.execute(DELETE_ORDER_LINES, (order_number, list(deleted)))
+        if added:
+            execute_values(cur, ADD_ORDER_LINES,
+                           [(order_number, dish_number, quantity) for dish_number, quantity in added],
+                           template=ORDER_LINE_VALUES, page_size=len(added))
+
+    def reserve_order_numbers(self, cur, count):
+        if not self.sequence_ready:
+            cur.execute(CREATE_ORDER_NUMBER_SEQUENCE)
+        cur.execute(RESERVE_ORDER_NUMBERS, (count,))
+        numbers = [row[0] for row in cur.fetchall()]
+        self.sequence_ready = True
+        return numbers
+
+
+class SQLiteBackend:
+    """An embedded database in the bot process (in memory by default) loaded from the seed files.
+
+    All calls share one connection, handed out to one thread at a time. With `statement_timeout`
+    (seconds) the statements of a checkout are interrupted once it has been held that long. A database
+    file is opened in WAL mode, so a second backend on the same file (the analytics lane) reads while
+    this one writes.
+    """
+
+    dialect = 'sqlite'
+    query_names = {SQLITE_RESERVE_ORDER_NUMBERS: 'RESERVE_ORDER_NUMBERS',
+                   SQLITE_LAST_ORDER_NUMBER: 'SQLITE_LAST_ORDER_NUMBER',
+                   SQLITE_DELETE_ORDER_LINE: 'DELETE_ORDER_LINES',
+                   SQLITE_ADD_ORDER_LINE: 'ADD_ORDER_LINES'}
+
+    def __init__(self, path=":memory:", data_directory="data", statement_timeout=None):
+        self._lock = threading.RLock()
+        self.statement_timeout = statement_timeout
+        self._deadline = None
+        self.conn = sqlite3.connect(path, check_same_thread=False, detect_types=sqlite3.PARSE_DECLTYPES)
+        if path != ":memory:":
+            self.conn.execute("pragma journal_mode=wal")
+        self.conn.executescript(SQLITE_SCHEMA)
+        if self.conn.execute("select count(*) from order_number_seq").fetchone()[0] == 0:
+            self.conn.execute("insert into order_number_seq(last_value) values(0)")
+        if data_directory is not None and self.conn.execute("select count(*) from dish").fetchone()[0] == 0:
+            self.load_seed(data_directory)
+        self.conn.commit()
+        if statement_timeout:
+            self.conn.set_progress_handler(self._past_deadline, 10000)
+
+    def _past_deadline(self):
+        return self._deadline is not None and time.monotonic() > self._deadline
+
+    def load_seed(self, data_directory):
+        from seed_loader import COLUMNS, TABLE_LEVELS, SeedData
+        data = SeedData(data_directory)
+        for level in TABLE_LEVELS:
+            for table in level:
+                columns = COLUMNS[table]
+                self.conn.executemany(f"insert or ignore into {table}({', '.join(columns)}) "
+                                      f"values({', '.join('?' * len(columns))})", getattr(data, table)())
+        logger.info(f"sqlite backend loaded seed data, skipped rows {data.skipped}")
+
+    def getconn(self):
+        self._lock.acquire()
+        if self.statement_timeout:
+            self._deadline = time.monotonic() + self.statement_timeout
+        return self.conn
+
+    def putconn(self, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        finally:
+            self._deadline = None
+            self._lock.release()
+
+    def closeall(self):
+        with self._lock:
+            self.conn.close()
+
+    @staticmethod
+    def sql(query):
+        return query.replace("%s", "?")
+
+    def execute_batch(self, cur, query, rows):
+        cur.executemany(self.sql(query), rows)
+
+    @staticmethod
+    def write_order_lines(cur, order_number, deleted, added):
+        """SQLite has no array parameters and runs in process, so one statement per line"""
+        if deleted:
+            cur.executemany(SQLITE_DELETE_ORDER_LINE, [(order_number, dish_number) for dish_number in deleted])
+        if added:
+            cur.executemany(SQLITE_ADD_ORDER_LINE,
+                            [(order_number, dish_number, quantity) for dish_number, quantity in added])
+
+    def reserve_order_numbers(self, cur, count):
+        cur.execute(SQLITE_RESERVE_ORDER_NUMBERS, (count,))
+        cur.execute(SQLITE_LAST_ORDER_NUMBER)
+        last = cur.fetchone()[0]
+        return list(range(last - count + 1, last + 1))
@@ -0,0 +1,180 @@
+import logging
+import threading
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from neighbour_index import NeighbourIndex
+
+logger = logging.getLogger()
+
+DISH_FEATURES = ['chiken', 'spicy', 'pastry', 'fish', 'tofu', 'beef', 'rice', 'coconut_cream', 'eggs', 'sea_food',
+                 'curry', 'fried', 'vegetarian', 'vegan']
+
+TASTE_COLUMNS = ['avg_price', 'chicken', 'spicy', 'pastry', 'fish', 'tofu', 'beef', 'rice', 'coconut_cream', 'eggs',
+                 'sea_food', 'curry', 'fried', 'vegetarian', 'vegan']
+
+
+def client_taste_sums(client_dishes, menu):
+    """Per client sums of price and dish features over its order lines, and its number of lines.
+
+    `client_dishes` yields one (client_number, dish_number) pair per order line. The sums are a sparse
+    client x dish line count matrix multiplied by the menu's dish x feature matrix.
+    """
+    dish_numbers, prices, flags = menu.feature_matrix(DISH_FEATURES)
+    column_of = {dish_number: column for column, dish_number in enumerate(dish_numbers)}
+    client_row = dict()
+    rows = list()
+    columns = list()
+    for client_number, dish_number in client_dishes:
+        column = column_of.get(dish_number)
+        if column is None:
+            logger.error(f"dish {dish_number} is not on the menu")
+            continue
+        rows.append(client_row.setdefault(client_number, len(client_row)))
+        columns.append(column)
+    counts = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, columns)),
+                               shape=(len(client_row), len(dish_numbers)))
+    sums = np.hstack([counts @ prices[:, None], counts @ flags])
+    return list(client_row), sums, np.asarray(counts.sum(axis=1), dtype=np.float64).ravel()
+
+
+def client_taste_df(client_dishes, menu):
+    """The GET_CLIENTS_DATA profiles as a frame indexed by client, computed from order lines"""
+    clients, sums, counts = client_taste_sums(client_dishes, menu)
+    df = pd.DataFrame(sums / counts[:, None], index=pd.Index(clients, name='client_number'), columns=TASTE_COLUMNS)
+    return df.sort_index()[sorted(TASTE_COLUMNS)]
+
+
+class TasteStore:
+    """Per client taste vectors (the GET_CLIENTS_DATA profile) kept up to date as order lines change.
+
+    For every client the store keeps the sum of price and dish features over its order lines and the
+    number of lines, so adding or deleting a line is O(features) and a profile is sums / count.
+    `loader` returns (order_number, client_number, dish_number, quantity) rows for every order
+    (dish_number is None for orders without lines) and `menu` is the MenuCatalog used to look up dish vectors.
+    """
+
+    def __init__(self, loader, menu, block_size=None):
+        self.loader = loader
+        self.menu = menu
+        self.block_size = block_size
+        self._lock = threading.RLock()
+        self._built = False
+        self._version = 0
+        self._index = None
+        self._index_version = None
+        self.order_client = dict()
+        self.order_lines = dict()
+        self.client_index = dict()
+        self.clients = list()
+        self.sums = np.zeros((0, len(TASTE_COLUMNS)))
+        self.counts = np.zeros(0)
+
+    def dish_vector(self, dish_number):
+        dish = self.menu.get_dish(dish_number)
+        if dish is None:
+            return None
+        return np.array([float(dish['price'])] + [float(dish[feature]) for feature in DISH_FEATURES])
+
+    def _row(self, client_number):
+        row = self.client_index.get(client_number)
+        if row is None:
+            row = len(self.clients)
+            if row == len(self.counts):
+                capacity = max(16, 2 * row)
+                self.sums = np.vstack([self.sums, np.zeros((capacity - row, len(TASTE_COLUMNS)))])
+                self.counts = np.concatenate([self.counts, np.zeros(capacity - row)])
+            self.client_index[client_number] = row
+            self.clients.append(client_number)
+        return row
+
+    def build(self):
+        with self._lock:
+            self.order_client = dict()
+            self.order_lines = dict()
+            client_dishes = list()
+            for order_number, client_number, dish_number, quantity in self.loader():
+                self.order_client[order_number] = client_number
+                if dish_number is not None and self.menu.get_dish(dish_number) is not None:
+                    key = (order_number, dish_number)
+                    self.order_lines[key] = self.order_lines.get(key, 0) + 1
+                    client_dishes.append((client_number, dish_number))
+            clients, sums, counts = client_taste_sums(client_dishes, self.menu)
+            self.clients = clients
+            self.client_index = {client_number: row for row, client_number in enumerate(clients)}
+            self.sums = sums
+            self.counts = counts
+            self._version += 1
+            self._built = True
+
+    def ensure_built(self):
+        if not self._built:
+            self.build()
+
+    def _apply(self, order_number, dish_number, sign, lines=1):
+        client_number = self.order_client.get(order_number)
+        vector = self.dish_vector(dish_number)
+        if client_number is None or vector is None:
+            logger.error(f"taste store can't apply dish {dish_number} to order {order_number}")
+            return
+        row = self._row(client_number)
+        self._version += 1
+        self.sums[row] += sign * lines * vector
+        self.counts[row] += sign * lines
+        key = (order_number, dish_number)
+        remaining = self.order_lines.get(key, 0) + sign * lines
+        if remaining > 0:
+            self.order_lines[key] = remaining
+        else:
+            self.order_lines.pop(key, None)
+
+    def add_order(self, order_number, client_number):
+        with self._lock:
+            self.order_client[order_number] = client_number
+
+    def add_dish(self, order_number, dish_number, quantity=1):
+        with self._lock:
+            if self._built:
+                self._apply(order_number, dish_number, 1)
+
+    def remove_dish(self, order_number, dish_number):
+        with self._lock:
+            if self._built:
+                lines = self.order_lines.get((order_number, dish_number), 0)
+                if lines:
+                    self._apply(order_number, dish_number, -1, lines)
+
+    def matrix(self):
+        """(clients, profiles) for every client with at least one order line"""
+        self.ensure_built()
+        with self._lock:
+            size = len(self.clients)
+            active = self.counts[:size] > 0
+            clients = [client for client, keep in zip(self.clients, active) if keep]
+            profiles = self.sums[:size][active] / self.counts[:size][active, None]
+        return clients, profiles
+
+    def normalized_matrix(self):
+        """Profiles min-max scaled per column, constant columns become 0"""
+        clients, profiles = self.matrix()
+        if not clients:
+            return clients, profiles
+        low = profiles.min(axis=0)
+        spread = profiles.max(axis=0) - low
+        spread[spread == 0] = 1
+        return clients, (profiles - low) / spread
+
+    def neighbour_index(self):
+        """NeighbourIndex over the normalized profiles, rebuilt only after the profiles changed"""
+        self.ensure_built()
+        with self._lock:
+            if self._index is None or self._index_version != self._version:
+                version = self._version
+                clients, normal = self.normalized_matrix()
+                self._index = NeighbourIndex(clients, normal, block_size=self.block_size)
+                self._index_version = version
+            return self._index
+
+    def nearest_clients(self, client_number, k=4):
+        clients, scores = self.neighbour_index().neighbours(client_number, k)
+        return clients
@@ -0,0 +1,34 @@
+"""CourierDispatcher when delivery_person is empty at startup"""
+from courier_dispatcher import CourierDispatcher
+
+COURIERS = [("Dana", "0501111111"), ("Noam", "0502222222")]
+
+
+def make_dispatcher(rosters):
+    loads = list()
+
+    def loader():
+        loads.append(rosters[min(len(loads), len(rosters) - 1)])
+        return loads[-1]
+
+    return CourierDispatcher(loader), loads
+
+
+def test_assign_loads_the_roster_again_while_it_is_empty():
+    dispatcher, loads = make_dispatcher([[], [], COURIERS])
+    assert not dispatcher.refresh()
+    assert dispatcher.assign(1) is None
+    assert not dispatcher.loaded
+    assert dispatcher.assign(2) == "0501111111"
+    assert dispatcher.assign(3) == "0502222222"
+    assert dispatcher.loaded and len(loads) == 3
+
+
+def test_job_loads_the_roster_again_while_it_is_empty():
+    dispatcher, loads = make_dispatcher([[], COURIERS])
+    dispatcher.refresh()
+    dispatcher.job()
+    assert dispatcher.loaded and len(loads) == 2
+    dispatcher.job()
+    assert len(loads) == 2
+    assert dispatcher.depths() == {"0501111111": 0, "0502222222": 0}
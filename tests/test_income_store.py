@@ -0,0 +1,97 @@
+"""IncomeStore against the income SQL it replaced, and its handling of concurrent changes"""
+import datetime
+
+import pytest
+
+from data_source import DataSource
+from income_store import IncomeStore
+from menu_catalog import MenuCatalog
+from storage_backends import SQLiteBackend
+
+DAILY_INCOME = """select o.order_time, sum(d.price * dio.quantity)
+                    from order_ o join dish_in_order dio on o.order_number = dio.order_number
+                        join dish d on d.dish_number = dio.dish_number
+                    where o.order_time is not null
+                    group by o.order_time
+                    order by o.order_time"""
+
+DISH_TYPE_INCOME = """select d.dish_type, sum(d.price * dio.quantity)
+                        from dish d join dish_in_order dio on d.dish_number = dio.dish_number
+                            join order_ o on o.order_number = dio.order_number
+                        where o.order_time is not null
+                        group by d.dish_type"""
+
+MENU = (['dish_number', 'dish_name', 'price', 'dish_type'],
+        [(1, 'Tom Yum', 40, 'Soups'), (2, 'Pad Thai', 50, 'Pad Thai'), (3, 'Spring rolls', 20, 'Appetizer')])
+TODAY = datetime.date(2026, 10, 18)
+
+
+@pytest.fixture(scope="module")
+def data_source():
+    data_source = DataSource(None, backend=SQLiteBackend(), query_metrics=False)
+    yield data_source
+    data_source.close()
+
+
+def sql_rows(data_source, query):
+    conn = data_source.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(query)
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        data_source.close_connection(conn)
+    return rows
+
+
+def test_income_matches_the_daily_income_sql(data_source):
+    expected = sql_rows(data_source, DAILY_INCOME)
+    assert expected
+    income = data_source.income.income(expected[0][0], expected[-1][0], skip_empty=True)
+    assert [day for day, _ in income] == [day for day, _ in expected]
+    assert [total for _, total in income] == pytest.approx([float(total) for _, total in expected])
+
+
+def test_income_by_type_matches_the_dish_type_income_sql(data_source):
+    expected = {dish_type: float(income) for dish_type, income in sql_rows(data_source, DISH_TYPE_INCOME)}
+    assert data_source.income.income_by_type() == pytest.approx(expected)
+
+
+def make_store(rows, order_loader=None):
+    menu = MenuCatalog(lambda: MENU)
+    return IncomeStore(lambda: list(rows), menu, today=lambda: TODAY, order_loader=order_loader)
+
+
+def test_changes_written_while_loading_are_kept():
+    store = make_store([])
+    store.add_order(100, "+972500000000")
+
+    def loader():
+        store.add_dish(100, 1, 2)
+        return [(TODAY, 2, 3)]
+
+    store.loader = loader
+    store.build()
+    assert store.income(TODAY, TODAY) == [(TODAY, 2 * 40 + 3 * 50)]
+    store.remove_dish(100, 1)
+    assert store.income(TODAY, TODAY) == [(TODAY, 3 * 50)]
+
+
+def test_an_order_from_before_the_start_is_looked_up_not_rebuilt():
+    opened = datetime.date(2026, 9, 30)
+    looked_up = list()
+
+    def order_loader(order_number):
+        looked_up.append(order_number)
+        return opened, {1: 2, 3: 1}
+
+    store = make_store([(opened, 3, 1)], order_loader)
+    store.build()
+    store.add_dish(7, 1, 2)
+    assert store._built
+    store.remove_dish(7, 3)
+    store.add_dish(7, 2, 1)
+    assert store._built and looked_up == [7]
+    assert store.income(opened, opened) == [(opened, 2 * 40 + 50)]
+    assert store.income_by_type() == {'Soups': 80, 'Pad Thai': 50}
@@ -0,0 +1,34 @@
+"""MessageRouter against the chain of regex MessageHandlers it replaced, for the bot's labels and remarks"""
+import os
+
+os.environ.setdefault("MODE", "dev")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ.setdefault("SESSION_LOG", "")
+import pytest
+
+import main
+from benchmarks.router_dispatch import LABELS, chain_dispatch, handler_chain, make_update
+
+REMARKS = ["please ring twice 📝", "please ring twice 📝  ", "📝 no onions", "no onions 📝 and extra rice", "📝"]
+
+
+@pytest.fixture(scope="module")
+def router():
+    return main.build_router()
+
+
+@pytest.mark.parametrize("text", LABELS + REMARKS)
+def test_router_picks_the_handler_of_the_chain(router, text):
+    route = router.resolve(text)
+    assert (route and route.target) is chain_dispatch(handler_chain(), make_update(text))
+
+
+@pytest.mark.parametrize("text", REMARKS)
+def test_the_remark_emoji_closes_a_remark_wherever_it_is(router, text):
+    assert router.resolve(text).target is main.done_command
+
+
+def test_a_button_label_wins_over_the_remark_emoji(router):
+    assert router.resolve("✍️i have a remarks").target is main.remarks_handler
+    assert router.resolve("🛒Shopping cart (96 ₪) 📝").target is main.shopping_cast_handler
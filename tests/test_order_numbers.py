@@ -0,0 +1,31 @@
+"""Order numbers handed out from several threads and allocators sharing the SQLite sequence"""
+from concurrent.futures import ThreadPoolExecutor
+
+from data_source import DataSource
+from order_allocator import OrderNumberAllocator
+from storage_backends import SQLiteBackend
+
+ALLOCATORS = 4
+THREADS_PER_ALLOCATOR = 4
+CALLS_PER_THREAD = 25
+BLOCK_SIZE = 5
+
+
+def test_numbers_are_unique_and_contiguous():
+    data_source = DataSource(None, backend=SQLiteBackend(':memory:'), query_metrics=False)
+    last_order = max(order_number for order_number, _, _, _ in data_source.load_order_lines())
+    allocators = [OrderNumberAllocator(data_source.reserve_order_numbers, block_size=BLOCK_SIZE)
+                  for _ in range(ALLOCATORS)]
+
+    def take(allocator):
+        return [allocator.next_number() for _ in range(CALLS_PER_THREAD)]
+
+    with ThreadPoolExecutor(ALLOCATORS * THREADS_PER_ALLOCATOR) as pool:
+        batches = list(pool.map(take, allocators * THREADS_PER_ALLOCATOR))
+    numbers = [number for batch in batches for number in batch]
+    total = ALLOCATORS * THREADS_PER_ALLOCATOR * CALLS_PER_THREAD
+    assert len(set(numbers)) == len(numbers) == total
+    assert sorted(numbers) == list(range(last_order + 1, last_order + 1 + total))
+    for batch in batches:
+        assert batch == sorted(batch)
+    data_source.close()
@@ -0,0 +1,83 @@
+"""Database round trips of the continue, back and finish screens, which read the order summary once.
+
+Each test opens an order through the handlers on the in-memory SQLite backend and counts the
+statements a screen sends: 1 for the summary, plus 1 on continue and finish when the cart has
+unwritten changes.
+"""
+import itertools
+import os
+from types import SimpleNamespace
+
+os.environ.setdefault("MODE", "dev")
+os.environ.setdefault("STORAGE_BACKEND", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ.setdefault("SESSION_LOG", "")
+import pytest
+
+import main
+from benchmarks.fakes import CountingBackend, FakeBot, QueryCounter, make_context, make_contact, make_update
+
+CLIENT = "972500000000"
+CHAT_IDS = itertools.count(1)
+
+
+@pytest.fixture(scope="module")
+def counter():
+    counter = QueryCounter()
+    backend = main.dataSource.backend
+    main.dataSource.backend = CountingBackend(backend, counter)
+    main.dataSource.menu.refresh()
+    yield counter
+    main.dataSource.backend = backend
+
+
+@pytest.fixture
+def chat(counter):
+    bot = FakeBot()
+    chat_id = next(CHAT_IDS)
+    context = make_context(bot, dict())
+    main.phone_number_handler(make_update(bot, chat_id, contact=make_contact(CLIENT, "summary")), context)
+    main.location_handler(make_update(bot, chat_id, location=True), context)
+    order_number = main.sessions.get(chat_id).order_number
+    assert order_number is not None
+    return SimpleNamespace(bot=bot, id=chat_id, context=context, order_number=order_number)
+
+
+def screen(counter, chat, handler, text):
+    counter.reset()
+    handler(make_update(chat.bot, chat.id, text=text), chat.context)
+    return counter.round_trips
+
+
+def test_back_reads_the_summary_once_with_the_cart_unwritten(counter, chat):
+    for dish_number, quantity in ((10001, 2), (10002, 1)):
+        main.dataSource.cart.add(chat.order_number, dish_number, quantity)
+        assert screen(counter, chat, main.back_handler, "🔙 Back") == 1
+
+
+def test_continue_writes_the_cart_then_reads_the_summary_once(counter, chat):
+    main.dataSource.cart.add(chat.order_number, 10001, 2)
+    assert screen(counter, chat, main.continue_handler, "🛍️ continue ") == 2
+    assert screen(counter, chat, main.continue_handler, "🛍️ continue ") == 1
+    assert screen(counter, chat, main.back_handler, "🔙 Back") == 1
+
+
+def test_finish_writes_the_cart_then_reads_the_summary_once(counter, chat):
+    main.dataSource.cart.add(chat.order_number, 10001, 2)
+    main.dataSource.cart.add(chat.order_number, 10002, 1)
+    main.dataSource.cart.flush(chat.order_number)
+    main.dataSource.cart.remove(chat.order_number, 10002)
+    assert screen(counter, chat, main.finish_handler, "♦ Cash 💷") == 2
+
+
+def test_summary_has_the_buffered_lines_remark_and_courier(counter, chat):
+    main.dataSource.cart.add(chat.order_number, 10001, 2)
+    main.dataSource.cart.add(chat.order_number, 10002, 1)
+    main.dataSource.cart.flush(chat.order_number)
+    main.dataSource.cart.remove(chat.order_number, 10002)
+    main.dataSource.set_remarks("ring twice", chat.order_number)
+    summary = main.dataSource.get_order_summary(chat.order_number)
+    assert summary.lines == [(10001, 2)]
+    assert summary.total == main.dataSource.menu.get_price(10001) * 2
+    assert summary.remark == "ring twice"
+    assert len(summary.courier) == 2
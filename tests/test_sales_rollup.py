@@ -0,0 +1,91 @@
+"""SalesRollup against the best/worst sellers SQL it replaced, and its handling of concurrent changes"""
+import datetime
+
+import pytest
+
+from data_source import DataSource
+from menu_catalog import MenuCatalog
+from sales_rollup import SalesRollup
+from storage_backends import SQLiteBackend
+
+SELLERS = """select d.dish_name, sum(dio.quantity), sum(dio.quantity * d.price)
+                from dish d join dish_in_order dio on d.dish_number = dio.dish_number
+                    join order_ o on o.order_number = dio.order_number
+                where cast(strftime('%Y', o.order_time) as integer) = ?
+                    and cast(strftime('%m', o.order_time) as integer) = ?
+                group by d.dish_name
+                order by {order}
+                limit 5"""
+
+MENU = (['dish_number', 'dish_name', 'price', 'dish_type'],
+        [(1, 'Tom Yum', 40, 'Soups'), (2, 'Pad Thai', 50, 'Pad Thai'), (3, 'Spring rolls', 20, 'Appetizer')])
+TODAY = datetime.date(2026, 10, 18)
+
+
+@pytest.fixture(scope="module")
+def data_source():
+    data_source = DataSource(None, backend=SQLiteBackend(), query_metrics=False)
+    yield data_source
+    data_source.close()
+
+
+def sql_sellers(data_source, month, order):
+    conn = data_source.get_connection()
+    try:
+        cur = conn.cursor()
+        cur.execute(SELLERS.format(order=order), month)
+        rows = cur.fetchall()
+        cur.close()
+    finally:
+        data_source.close_connection(conn)
+    return rows
+
+
+def test_top_bottom_matches_the_sellers_sql(data_source):
+    months = {(int(year), int(month)) for year, month, _, _ in data_source.load_monthly_sales()}
+    assert months
+    for month in sorted(months):
+        best, worst = data_source.sales.top_bottom(k=5, month=month)
+        for ranked, order in ((best, "sum(dio.quantity * d.price) desc, d.dish_name"),
+                              (worst, "sum(dio.quantity * d.price), d.dish_name desc")):
+            expected = sql_sellers(data_source, month, order)
+            assert [row[:2] for row in ranked] == [row[:2] for row in expected]
+            assert [float(row[2]) for row in ranked] == pytest.approx([float(row[2]) for row in expected])
+
+
+def make_rollup(rows, order_loader=None):
+    menu = MenuCatalog(lambda: MENU)
+    return SalesRollup(lambda: list(rows), menu, today=lambda: TODAY, order_loader=order_loader)
+
+
+def test_changes_written_while_loading_are_kept():
+    rollup = make_rollup([])
+    rollup.add_order(100, "+972500000000")
+
+    def loader():
+        rollup.add_dish(100, 1, 2)
+        return [(2026, 10, 2, 3)]
+
+    rollup.loader = loader
+    rollup.build()
+    assert rollup.months[(2026, 10)] == {1: 2, 2: 3}
+    rollup.remove_dish(100, 1)
+    assert rollup.months[(2026, 10)] == {2: 3}
+
+
+def test_an_order_from_before_the_start_is_looked_up_not_rebuilt():
+    looked_up = list()
+
+    def order_loader(order_number):
+        looked_up.append(order_number)
+        return datetime.date(2026, 9, 30), {1: 2, 3: 1}
+
+    rollup = make_rollup([(2026, 9, 3, 1)], order_loader)
+    rollup.build()
+    rollup.add_dish(7, 1, 2)
+    assert rollup._built
+    assert rollup.months[(2026, 9)] == {1: 2, 3: 1}
+    rollup.remove_dish(7, 3)
+    rollup.add_dish(7, 2, 1)
+    assert rollup._built and looked_up == [7]
+    assert rollup.months[(2026, 9)] == {1: 2, 2: 1}
@@ -0,0 +1,81 @@
+"""SessionStore restore: the chosen dishes it forgets, and the sessions it ages out"""
+from sessions import SessionLog, SessionStore
+
+ORDER = 10
+
+
+class Clock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def make_store(tmp_path, wall_clock, order_dishes=None):
+    return SessionStore(idle_timeout=3600, clock=Clock(100000.0), log=SessionLog(str(tmp_path / "sessions.log")),
+                        order_dishes=order_dishes, wall_clock=wall_clock)
+
+
+def test_only_dishes_lost_with_the_cart_are_forgotten(tmp_path):
+    wall_clock = Clock(1000.0)
+    store = make_store(tmp_path, wall_clock)
+    session = store.get(1)
+    session.open_order(ORDER)
+    for dish_number in (1, 2, 3, 4):
+        session.choose(dish_number)
+    session.add_line(1)
+    session.add_line(2)
+    session.add_line(4)
+    session.remove_line(4)
+    store.mark(1)
+    assert store.flush() == 1
+
+    requested = list()
+
+    def order_dishes(first_order_number):
+        requested.append(first_order_number)
+        return {ORDER: {1}}
+
+    restored = make_store(tmp_path, wall_clock, order_dishes)
+    assert restored.restore() == 1
+    session = restored.get(1)
+    assert requested == [ORDER]
+    assert session.chosen == {1, 3, 4}
+    assert session.in_cart == {1}
+
+
+def test_sessions_idle_past_the_timeout_are_not_restored(tmp_path):
+    wall_clock = Clock(0.0)
+    store = make_store(tmp_path, wall_clock)
+    store.get(1).open_order(ORDER)
+    store.mark(1)
+    store.flush()
+    wall_clock.now = 3000.0
+    store.get(2).open_order(ORDER + 1)
+    store.mark(2)
+    store.flush()
+
+    wall_clock.now = 4000.0
+    restored = make_store(tmp_path, wall_clock)
+    assert restored.restore() == 1
+    assert 1 not in restored.sessions
+    assert restored.sessions[2].order_number == ORDER + 1
+    assert restored.sessions[2].last_seen == restored.clock() - 1000.0
+    assert [chat_id for chat_id, _ in restored.log.get_session_records()] == [2]
+
+
+def test_an_unchanged_chat_is_written_again_before_it_would_age_out(tmp_path):
+    wall_clock = Clock(0.0)
+    store = make_store(tmp_path, wall_clock)
+    store.get(1).open_order(ORDER)
+    store.mark(1)
+    assert store.flush() == 1
+    store.mark(1)
+    assert store.flush() == 0
+    wall_clock.now = 900.0
+    store.mark(1)
+    assert store.flush() == 1
+
+    wall_clock.now = 900.0 + 3000.0
+    assert make_store(tmp_path, wall_clock).restore() == 1
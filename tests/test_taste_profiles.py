@@ -0,0 +1,42 @@
+"""The taste profiles of TasteStore and client_taste_df against GET_CLIENTS_DATA on the seed data"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_source import DataSource, GET_CLIENTS_DATA
+from storage_backends import SQLiteBackend
+from taste_store import TASTE_COLUMNS, client_taste_df
+
+
+@pytest.fixture(scope="module")
+def data_source():
+    data_source = DataSource(None, backend=SQLiteBackend(), query_metrics=False)
+    yield data_source
+    data_source.close()
+
+
+def sql_profiles(data_source):
+    conn = data_source.get_connection()
+    try:
+        df = pd.read_sql_query(data_source.sql(GET_CLIENTS_DATA), conn)
+    finally:
+        data_source.close_connection(conn)
+    return df.set_index('client_number').sort_index()[sorted(TASTE_COLUMNS)]
+
+
+def test_client_taste_df_matches_get_clients_data(data_source):
+    lines = data_source.load_order_lines()
+    matrix = client_taste_df(((client_number, dish_number) for _, client_number, dish_number, _ in lines
+                              if dish_number is not None), data_source.menu)
+    sql = sql_profiles(data_source)
+    assert list(matrix.index) == list(sql.index)
+    assert matrix.shape == sql.shape == (len(sql), len(TASTE_COLUMNS))
+    np.testing.assert_allclose(matrix.to_numpy(), sql.to_numpy())
+
+
+def test_taste_store_profiles_match_get_clients_data(data_source):
+    clients, profiles = data_source.taste.matrix()
+    sql = sql_profiles(data_source)
+    store = pd.DataFrame(profiles, index=clients, columns=TASTE_COLUMNS).sort_index()[sorted(TASTE_COLUMNS)]
+    assert list(store.index) == list(sql.index)
+    np.testing.assert_allclose(store.to_numpy(), sql.to_numpy())